@@ -1,17 +1,29 @@
 import os
 import jwt
+import io
+import csv
+import json
+import base64
+import asyncio
+import threading
+import time
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from fastapi import FastAPI, HTTPException, Depends
+from fastapi import FastAPI, HTTPException, Depends, Request, Query
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.background import BackgroundTask
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel  # Ditambahkan untuk menangani skema data
-import psycopg2
 from psycopg2.extras import RealDictCursor
 from datetime import datetime, timedelta, timezone
 from zoneinfo import ZoneInfo
 from typing import List, Dict, Optional
 
 # Import logic dari main.py
-from main import system
+from main import system, INSERT_LOG_PRODUCT_QUERY
+from db import pool, get_db_connection, run_db, PoolTimeout
+from timeline import compute_timelines
+from stream import hub, format_sse, STREAM_KEEPALIVE_SECONDS
+from cache import TokenBlacklist, token_id
 
 app = FastAPI(
     title="API Monitoring Produksi & Manpower",
@@ -27,174 +39,489 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# KONFIGURASI DATABASE
-DB_CONFIG = {
-    "host": "postgres-db",
-    "database": "database_barcode",
-    "user": "postgres",
-    "password": "a",
-    "port": "5432"
-}
-
-def get_db_connection():
-    return psycopg2.connect(**DB_CONFIG)
+# KONFIGURASI DATABASE (pool bersama, konfigurasi dari environment)
+@app.exception_handler(PoolTimeout)
+def pool_timeout_handler(request: Request, exc: PoolTimeout):
+    return JSONResponse(status_code=503, content={"detail": str(exc)})
 
 SECRET_KEY = os.getenv("SECRET_KEY")
 security = HTTPBearer()
+token_blacklist = TokenBlacklist()
+
+@app.on_event("startup")
+def start_token_blacklist():
+    threading.Thread(target=token_blacklist.listen_forever, daemon=True).start()
 
 def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
-    token = credentials.credentials
-    
-    # 1. CEK DATABASE: Apakah token ini sudah masuk daftar hitam?
-    conn = get_db_connection()
-    cur = conn.cursor()
-    try:
-        cur.execute("SELECT 1 FROM token_blacklist WHERE token = %s", (token,))
-        if cur.fetchone():
-            raise HTTPException(status_code=401, detail="Sesi telah diakhiri (Logout). Silakan login kembali.")
-    finally:
-        cur.close()
-        conn.close()
+    return check_token(credentials.credentials)
 
-    # 2. JIKA AMAN: Lanjutkan proses verifikasi tanda tangan dan waktu JWT
+def check_token(token: str):
+    # 1. Verifikasi tanda tangan dan waktu JWT (tanpa DB)
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=["HS256"])
-        return payload["username"]
     except jwt.ExpiredSignatureError:
         raise HTTPException(status_code=401, detail="Sesi telah berakhir, silakan login kembali")
     except jwt.InvalidTokenError:
         raise HTTPException(status_code=401, detail="Token tidak valid, akses ditolak")
 
-# 1. LOG MANPOWER
-@app.get("/manpower/logs")
-def get_manpower_logs(username: str = Depends(verify_token)):
+    # Ticket /stream (scope "stream") bukan token login
+    if "scope" in payload:
+        raise HTTPException(status_code=401, detail="Token tidak valid, akses ditolak")
+
+    # 2. Apakah token ini sudah masuk daftar hitam? (dicek di memori, lihat cache.TokenBlacklist)
+    if token_blacklist.contains(token_id(token)):
+        raise HTTPException(status_code=401, detail="Sesi telah diakhiri (Logout). Silakan login kembali.")
+    return payload["username"]
+
+def to_utc_naive(value: Optional[datetime]):
+    # Kolom created_at disimpan sebagai TIMESTAMP UTC tanpa zona waktu
+    if value is None or value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+# --- KEYSET PAGINATION UNTUK LOG ---
+# Cursor = (created_at, id) baris terakhir/pertama di halaman, di-encode base64.
+# before=<cursor> -> halaman berikutnya (lebih lama), after=<cursor> -> data yang lebih baru.
+DEFAULT_LOG_PAGE_SIZE = 100
+MAX_LOG_PAGE_SIZE = 1000
+
+def encode_cursor(row):
+    raw = f"{row['created_at'].isoformat()}|{row['id']}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_cursor(cursor: str):
+    try:
+        created_at, row_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(created_at), int(row_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Cursor tidak valid")
+
+def build_log_page_query(table, columns, filters, limit, before=None, after=None, start=None, end=None):
+    """Kembalikan (query, params, ascending) untuk satu halaman log."""
+    if before and after:
+        raise HTTPException(status_code=400, detail="Gunakan before atau after, tidak keduanya")
+
+    # Tabel log lama masih nullable: baris tanpa created_at tidak punya posisi di urutan keyset
+    # (dan tidak bisa dijadikan cursor), jadi tidak ikut dipaginasi
+    conditions = ["created_at IS NOT NULL"] + [sql for sql, _ in filters]
+    params = [value for _, value in filters]
+    if start:
+        conditions.append("created_at >= %s")
+        params.append(to_utc_naive(start))
+    if end:
+        conditions.append("created_at < %s")
+        params.append(to_utc_naive(end))
+
+    # Halaman "after" dibaca naik lalu dibalik, supaya hasil tetap terbaru -> terlama
+    ascending = after is not None
+    if before:
+        conditions.append("(created_at, id) < (%s, %s)")
+        params.extend(decode_cursor(before))
+    if after:
+        conditions.append("(created_at, id) > (%s, %s)")
+        params.extend(decode_cursor(after))
+
+    where = f"WHERE {' AND '.join(conditions)}"
+    order = "ASC" if ascending else "DESC"
+    query = f"""
+        SELECT {columns}
+        FROM {table}
+        {where}
+        ORDER BY created_at {order}, id {order}
+        LIMIT %s
+    """
+    params.append(limit + 1)
+    return query, params, ascending
+
+def fetch_log_page(table, columns, filters, limit, before=None, after=None, start=None, end=None):
+    query, params, ascending = build_log_page_query(table, columns, filters, limit, before, after, start, end)
+
+    conn = get_db_connection()
     try:
-        conn = get_db_connection()
         cur = conn.cursor(cursor_factory=RealDictCursor)
-        cur.execute("SELECT id, name, nik, status, created_at FROM log_manpower ORDER BY created_at DESC")
-        logs = cur.fetchall()
+        cur.execute(query, params)
+        rows = cur.fetchall()
         cur.close()
-        conn.close()
-        return logs
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        conn.close()
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if ascending:
+        rows.reverse()
+
+    older_exists = has_more if not ascending else True
+    return {
+        "items": rows,
+        "next_cursor": encode_cursor(rows[-1]) if rows and older_exists else None,
+        "prev_cursor": encode_cursor(rows[0]) if rows else after,
+    }
+
+MANPOWER_LOG_COLUMNS = "id, name, nik, status, created_at"
+PRODUCT_LOG_COLUMNS = "id, machine_name, name_product, action, name_manpower, created_at"
+
+# 1. LOG MANPOWER
+@app.get("/manpower/logs")
+def get_manpower_logs(
+    limit: int = Query(DEFAULT_LOG_PAGE_SIZE, ge=1, le=MAX_LOG_PAGE_SIZE),
+    before: Optional[str] = None,
+    after: Optional[str] = None,
+    nik: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    username: str = Depends(verify_token)
+):
+    filters = []
+    if nik:
+        filters.append(("nik = %s", nik))
+    return fetch_log_page(
+        "log_manpower", MANPOWER_LOG_COLUMNS,
+        filters, limit, before, after, start, end
+    )
 
 # 2. LOG PRODUCT
 @app.get("/product/logs")
-def get_product_logs(username: str = Depends(verify_token)):
-    try:
-        conn = get_db_connection()
-        cur = conn.cursor(cursor_factory=RealDictCursor)
-        query = """
-            SELECT id, machine_name, name_product, action, name_manpower, created_at 
-            FROM log_product 
-            ORDER BY created_at DESC
-        """
-        cur.execute(query)
-        logs = cur.fetchall()
-        cur.close()
-        conn.close()
-        return logs
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+def get_product_logs(
+    limit: int = Query(DEFAULT_LOG_PAGE_SIZE, ge=1, le=MAX_LOG_PAGE_SIZE),
+    before: Optional[str] = None,
+    after: Optional[str] = None,
+    machine_name: Optional[str] = None,
+    name_product: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    username: str = Depends(verify_token)
+):
+    filters = []
+    if machine_name:
+        filters.append(("machine_name = %s", machine_name))
+    if name_product:
+        filters.append(("name_product = %s", name_product))
+    return fetch_log_page(
+        "log_product", PRODUCT_LOG_COLUMNS,
+        filters, limit, before, after, start, end
+    )
 
 # 3. LOG MACHINE (IoT/Sensor Data) - OPTIMIZED FOR LATEST DATA ONLY
 @app.get("/machine/logs")
 def get_machine_logs(username: str = Depends(verify_token)):
+    conn = get_db_connection()
     try:
-        conn = get_db_connection()
         cur = conn.cursor(cursor_factory=RealDictCursor)
         
-        # DISTINCT ON will only grab the 1 absolute newest row for each tag per machine!
+        # Snapshot log_machine_latest berisi 1 baris per tag per mesin,
+        # di-update oleh proses ingest, jadi tidak perlu scan histori log_machine
         query = """
-            SELECT DISTINCT ON (machine_id, tag_name) 
-                machine_id, tag_name, tag_value, created_at 
-            FROM log_machine 
-            ORDER BY machine_id, tag_name, created_at DESC
+            SELECT machine_id, tag_name, tag_value, created_at 
+            FROM log_machine_latest 
+            ORDER BY machine_id, tag_name
         """
         
         cur.execute(query)
         logs = cur.fetchall()
         cur.close()
-        conn.close()
         return logs
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        conn.close()
     
 # 3.1. MACHINE STATUS
+# Transisi di dalam [start, end] + 1 status terakhir sebelum start (status yang "terbawa")
+MACHINE_STATUS_EVENTS_QUERY = """
+    SELECT created_at, status FROM (
+        (SELECT created_at, status
+         FROM machine_status_event
+         WHERE machine_id = %(machine_id)s AND created_at < %(start)s
+         ORDER BY created_at DESC, id DESC
+         LIMIT 1)
+        UNION ALL
+        (SELECT created_at, status
+         FROM machine_status_event
+         WHERE machine_id = %(machine_id)s AND created_at >= %(start)s AND created_at <= %(end)s)
+    ) events
+    ORDER BY created_at
+"""
+
 @app.get("/machine/status")
-def get_machine_status_events(machine_id: str, username: str = Depends(verify_token)):
+def get_machine_status_events(machine_id: str, start: Optional[datetime] = None, end: Optional[datetime] = None, username: str = Depends(verify_token)):
+    conn = get_db_connection()
     try:
-        conn = get_db_connection()
         cur = conn.cursor(cursor_factory=RealDictCursor)
 
-        query = """
-        WITH ordered AS (
-          SELECT
-            created_at,
-            tag_value::text AS status,
-            LAG(tag_value::text) OVER (ORDER BY created_at) AS prev_status
-          FROM log_machine
-          WHERE
-            machine_id = %s
-            AND tag_name = 'Machine_Status'
-        )
-        SELECT created_at, status
-        FROM ordered
-        WHERE prev_status IS DISTINCT FROM status
-        ORDER BY created_at;
-        """
-
-        cur.execute(query, (machine_id,))
+        params = {
+            "machine_id": machine_id,
+            "start": to_utc_naive(start) or "-infinity",
+            "end": to_utc_naive(end) or "infinity",
+        }
+        cur.execute(MACHINE_STATUS_EVENTS_QUERY, params)
         data = cur.fetchall()
         cur.close()
-        conn.close()
         return data
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        conn.close()
     
+# 3.2. MACHINE TIMELINE (segmen & durasi per status, dihitung di server)
+MAX_TIMELINE_RANGES = 10
+MAX_TIMELINE_MACHINES = 200
+
+class TimelineRange(BaseModel):
+    start: datetime
+    end: datetime
+
+class TimelineRequest(BaseModel):
+    machine_ids: List[str]
+    ranges: List[TimelineRange]
+
+@app.post("/machine/timeline")
+def get_machine_timeline(data: TimelineRequest, username: str = Depends(verify_token)):
+    if not data.machine_ids or not data.ranges:
+        raise HTTPException(status_code=400, detail="machine_ids dan ranges wajib diisi")
+    if len(data.ranges) > MAX_TIMELINE_RANGES or len(data.machine_ids) > MAX_TIMELINE_MACHINES:
+        raise HTTPException(status_code=400, detail=f"Maksimal {MAX_TIMELINE_RANGES} range dan {MAX_TIMELINE_MACHINES} mesin")
+
+    ranges = [(to_utc_naive(r.start), to_utc_naive(r.end)) for r in data.ranges]
+    if any(end <= start for start, end in ranges):
+        raise HTTPException(status_code=400, detail="end harus lebih besar dari start")
+
+    conn = get_db_connection()
+    try:
+        return compute_timelines(conn, data.machine_ids, ranges)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        conn.close()
+
+# 3.3. DASHBOARD SNAPSHOT (semua data dashboard dalam satu request & satu snapshot DB)
+class DashboardSnapshotRequest(BaseModel):
+    main: TimelineRange
+    comparison: Optional[TimelineRange] = None
+
+# Log product di dalam range + aksi terakhir tiap product sebelum range (status yang terbawa).
+# Carry-in diambil per product lewat LATERAL supaya memakai index (machine_name, name_product, created_at)
+DASHBOARD_PRODUCT_LOGS_QUERY = """
+    SELECT id, machine_name, name_product, action, name_manpower, created_at FROM (
+        SELECT id, machine_name, name_product, action, name_manpower, created_at
+        FROM log_product
+        WHERE created_at >= %(since)s
+        UNION ALL
+        SELECT lp.id, lp.machine_name, lp.name_product, lp.action, lp.name_manpower, lp.created_at
+        FROM product p
+        CROSS JOIN LATERAL (
+            SELECT id, machine_name, name_product, action, name_manpower, created_at
+            FROM log_product
+            WHERE machine_name = p.machine_name AND name_product = p.name_product
+              AND created_at < %(since)s
+            ORDER BY created_at DESC, id DESC
+            LIMIT 1
+        ) lp
+    ) logs
+    ORDER BY created_at DESC
+"""
+
+@app.post("/dashboard/snapshot")
+def get_dashboard_snapshot(data: DashboardSnapshotRequest, username: str = Depends(verify_token)):
+    ranges = [(to_utc_naive(data.main.start), to_utc_naive(data.main.end))]
+    if data.comparison:
+        ranges.append((to_utc_naive(data.comparison.start), to_utc_naive(data.comparison.end)))
+    if any(end <= start for start, end in ranges):
+        raise HTTPException(status_code=400, detail="end harus lebih besar dari start")
+    since = min(start for start, _ in ranges)
+
+    conn = get_db_connection()
+    try:
+        cur = conn.cursor(cursor_factory=RealDictCursor)
+        # Semua query di bawah melihat snapshot database yang sama
+        cur.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ READ ONLY")
+
+        cur.execute("SELECT machine_name, serial_number FROM devices ORDER BY machine_name ASC")
+        devices = cur.fetchall()
+
+        cur.execute("""
+            SELECT machine_id, tag_name, tag_value, created_at
+            FROM log_machine_latest
+            ORDER BY machine_id, tag_name
+        """)
+        machine_logs = cur.fetchall()
+
+        cur.execute(DASHBOARD_PRODUCT_LOGS_QUERY, {"since": since})
+        product_logs = cur.fetchall()
+
+        cur.execute("""
+            SELECT
+                (SELECT COUNT(*) FROM manpower) AS manpower,
+                (SELECT COUNT(*) FROM product) AS parts,
+                (SELECT COUNT(*) FROM work_orders) AS work_orders
+        """)
+        counts = cur.fetchone()
+        cur.close()
+
+        machine_ids = [d["machine_name"] for d in devices]
+        timelines = compute_timelines(conn, machine_ids, ranges) if machine_ids else {}
+        conn.commit()
+
+        return {
+            "devices": devices,
+            "machine_logs": machine_logs,
+            "product_logs": product_logs,
+            "timelines": timelines,
+            "counts": {
+                "manpower": counts["manpower"],
+                "parts": counts["parts"],
+                "machines": len(devices),
+                "workOrders": counts["work_orders"],
+            },
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        conn.close()
+
+# 3.4. LIVE STREAM (Server-Sent Events)
+# Update tag, transisi status, start/stop product dan login/logout manpower
+# dikirim langsung dari MQTT ke browser, tanpa polling ke database.
+@app.on_event("startup")
+def start_event_hub():
+    try:
+        conn = get_db_connection()
+        try:
+            with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                cur.execute("SELECT machine_id, tag_value FROM log_machine_latest WHERE tag_name = 'Machine_Status'")
+                hub.seed_status(cur.fetchall())
+        finally:
+            conn.close()
+    except Exception as e:
+        print(f"STREAM: gagal mengambil status awal: {str(e)}")
+    hub.start(asyncio.get_running_loop())
+
+@app.on_event("shutdown")
+def stop_event_hub():
+    hub.stop()
+
+# EventSource di browser tidak bisa mengirim header Authorization. Token login tidak dikirim lewat
+# query (masuk access log); client minta ticket berumur pendek dulu, lalu membuka /stream?ticket=.
+# Ticket = JWT scope "stream" yang membawa token_id dan exp token login, jadi stream ditutup saat
+# token itu di-logout atau kedaluwarsa. Tanpa state, sehingga berlaku di worker API mana pun.
+STREAM_TICKET_TTL_SECONDS = int(os.getenv("STREAM_TICKET_TTL_SECONDS", 30))
+
+@app.post("/stream/ticket")
+def create_stream_ticket(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    token = credentials.credentials
+    check_token(token)
+    token_exp = jwt.decode(token, SECRET_KEY, algorithms=["HS256"])["exp"]
+    expires_at = datetime.now(timezone.utc) + timedelta(seconds=STREAM_TICKET_TTL_SECONDS)
+    ticket = jwt.encode({
+        "scope": "stream",
+        "tid": token_id(token),
+        "token_exp": token_exp,
+        "exp": expires_at,
+    }, SECRET_KEY, algorithm="HS256")
+    return {"ticket": ticket, "expires_in": STREAM_TICKET_TTL_SECONDS}
+
+def check_stream_ticket(ticket: str):
+    try:
+        payload = jwt.decode(ticket, SECRET_KEY, algorithms=["HS256"])
+    except jwt.InvalidTokenError:
+        raise HTTPException(status_code=401, detail="Ticket stream tidak valid atau kedaluwarsa")
+    if payload.get("scope") != "stream" or token_blacklist.contains(payload["tid"]):
+        raise HTTPException(status_code=401, detail="Ticket stream tidak valid atau kedaluwarsa")
+    return payload
+
+@app.get("/stream")
+async def stream_events(request: Request, ticket: str, machine_id: Optional[List[str]] = Query(None)):
+    claims = await run_db(check_stream_ticket, ticket)
+    sub = hub.subscribe(machine_id)
+
+    async def session_ended():
+        return time.time() >= claims["token_exp"] or await run_db(token_blacklist.contains, claims["tid"])
+
+    async def event_source():
+        try:
+            yield "retry: 3000\n\n"
+            next_check = time.monotonic() + STREAM_KEEPALIVE_SECONDS
+            while not await request.is_disconnected():
+                # Token login dicek ulang setiap interval keepalive: logout / exp menutup stream
+                if time.monotonic() >= next_check:
+                    if await session_ended():
+                        break
+                    next_check = time.monotonic() + STREAM_KEEPALIVE_SECONDS
+                events = await sub.get(STREAM_KEEPALIVE_SECONDS)
+                if not events:
+                    yield ": keepalive\n\n"
+                    continue
+                for event in events:
+                    yield format_sse(event)
+        finally:
+            hub.unsubscribe(sub)
+
+    return StreamingResponse(
+        event_source(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.get("/stream/stats")
+def get_stream_stats(username: str = Depends(verify_token)):
+    return hub.stats()
+
 # 4. MASTER DATA MANPOWER
+# status = ada/tidaknya sesi terbuka di manpower_session (state yang sama dengan BarcodeSystem)
+MANPOWER_LIST_QUERY = """
+    SELECT m.name, m.nik, m.position, m.department,
+           CASE WHEN ms.nik IS NULL THEN 'logout' ELSE 'login' END AS status
+    FROM manpower m
+    LEFT JOIN manpower_session ms ON ms.nik = m.nik
+    ORDER BY m.name ASC
+"""
+
 @app.get("/manpower")
 def get_all_manpower(username: str = Depends(verify_token)):
+    conn = get_db_connection()
     try:
-        conn = get_db_connection()
         cur = conn.cursor(cursor_factory=RealDictCursor)
-        query = "SELECT name, nik, position, department FROM manpower ORDER BY name ASC"
-        cur.execute(query)
+        cur.execute(MANPOWER_LIST_QUERY)
         data = cur.fetchall()
         cur.close()
-        conn.close()
         return data
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Gagal mengambil master data manpower: {str(e)}")
+    finally:
+        conn.close()
     
 # 5. GET PRODUCT LIST (MASTER DATA PRODUCT)
+# JOIN dengan work_order_details untuk mendapatkan wo_number
+PRODUCT_LIST_QUERY = """
+    SELECT 
+        p.id, p.machine_name, p.name_product, wod.wo_number, lp.action AS last_action
+    FROM product p
+    LEFT JOIN work_order_details wod 
+      ON p.machine_name = wod.machine_name
+     AND p.name_product = wod.product_name
+    LEFT JOIN product_state lp
+      ON lp.machine_name = p.machine_name
+     AND lp.name_product = p.name_product
+    ORDER BY p.name_product ASC
+"""
+
 @app.get("/product")
 def get_all_products(username: str = Depends(verify_token)):
+    conn = get_db_connection()
     try:
-        conn = get_db_connection()
         cur = conn.cursor(cursor_factory=RealDictCursor)
         
-        # JOIN dengan work_order_details untuk mendapatkan wo_number
-        query = """
-            SELECT 
-                p.id, p.machine_name, p.name_product, wod.wo_number
-            FROM product p
-            LEFT JOIN work_order_details wod 
-              ON p.machine_name = wod.machine_name
-             AND p.name_product = wod.product_name
-            ORDER BY p.name_product ASC
-        """
-
-        cur.execute(query)
+        cur.execute(PRODUCT_LIST_QUERY)
         data = cur.fetchall()
         
         cur.close()
-        conn.close()
         return data
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Gagal mengambil master data produk: {str(e)}")
+    finally:
+        conn.close()
     
 # 6. POST Add ManPower
 class addmanpower(BaseModel):
@@ -205,6 +532,9 @@ class addmanpower(BaseModel):
 
 @app.post("/add_manpower")
 async def post_add_manpower(data: addmanpower, username: str = Depends(verify_token)):
+    return await run_db(_post_add_manpower, data)
+
+def _post_add_manpower(data: addmanpower):
     conn = get_db_connection()
     cur = conn.cursor()
     try:
@@ -254,6 +584,9 @@ class deletemanpower(BaseModel):
 
 @app.delete("/delete_manpower")
 async def delete_manpower(data: deletemanpower, username: str = Depends(verify_token)):
+    return await run_db(_delete_manpower, data)
+
+def _delete_manpower(data: deletemanpower):
     conn = get_db_connection()
     cur = conn.cursor()
     try:
@@ -268,11 +601,12 @@ async def delete_manpower(data: deletemanpower, username: str = Depends(verify_t
                 detail="NIK tidak ditemukan!"
             )
 
-        # 2. Query DELETE
+        # 2. Query DELETE (sesi login yang masih terbuka ikut ditutup)
         cur.execute(
             "DELETE FROM manpower WHERE nik = %s",
             (data.nik,)
         )
+        cur.execute("DELETE FROM manpower_session WHERE nik = %s", (data.nik,))
         conn.commit()
 
         return {
@@ -298,6 +632,9 @@ class EditManpower(BaseModel):
 
 @app.put("/editmanpower")
 async def put_editmanpower(data: EditManpower, username: str = Depends(verify_token)):
+    return await run_db(_put_editmanpower, data)
+
+def _put_editmanpower(data: EditManpower):
     conn = get_db_connection()
     cur = conn.cursor()
     try:
@@ -329,7 +666,8 @@ async def put_editmanpower(data: EditManpower, username: str = Depends(verify_to
             )
         )
 
-        # 3. Insert log logout (FORCE LOGOUT)
+        # 3. Insert log logout (FORCE LOGOUT) + tutup sesi yang masih terbuka
+        cur.execute("DELETE FROM manpower_session WHERE nik = %s", (data.nik,))
         cur.execute(
             """
             INSERT INTO log_manpower (nik, name, status)
@@ -366,6 +704,9 @@ class addproduct(BaseModel):
 
 @app.post("/addproduct")
 async def post_addproduct(data: addproduct, username: str = Depends(verify_token)):
+    return await run_db(_post_addproduct, data)
+
+def _post_addproduct(data: addproduct):
     conn = get_db_connection()
     cur = conn.cursor()
     try:
@@ -400,11 +741,11 @@ async def post_addproduct(data: addproduct, username: str = Depends(verify_token
                 VALUES (%s, %s, %s)
             """, (wo_num, data.machine_name, data.name_product))
 
-        # 3. Insert ke table log_product
-        cur.execute("""
-            INSERT INTO log_product (machine_name, name_product, name_manpower, created_at, action) 
-            VALUES (%s, %s, %s, NOW(), %s)
-        """, (data.machine_name, data.name_product, "admin", "stop"))
+        # 3. Insert ke table log_product (+ product_state)
+        cur.execute(INSERT_LOG_PRODUCT_QUERY, {
+            "machine_name": data.machine_name, "name_product": data.name_product,
+            "action": "stop", "name_manpower": "admin", "station": None, "nik": None,
+        })
 
         conn.commit()
         return {"status": "success", "message": "Product ditambahkan"}
@@ -427,6 +768,9 @@ class DeleteProduct(BaseModel):
 
 @app.delete("/delete_product")
 async def delete_product(data: DeleteProduct, username: str = Depends(verify_token)):
+    return await run_db(_delete_product, data)
+
+def _delete_product(data: DeleteProduct):
     conn = get_db_connection()
     cur = conn.cursor()
     try:
@@ -497,6 +841,9 @@ class EditProduct(BaseModel):
 
 @app.put("/editproduct")
 async def put_editproduct(data: EditProduct, username: str = Depends(verify_token)):
+    return await run_db(_put_editproduct, data)
+
+def _put_editproduct(data: EditProduct):
     conn = get_db_connection()
     cur = conn.cursor()
     try:
@@ -521,6 +868,28 @@ async def put_editproduct(data: EditProduct, username: str = Depends(verify_toke
             "UPDATE log_product SET machine_name=%s, name_product=%s WHERE machine_name=%s AND name_product=%s",
             (data.new_machine_name, data.new_name_product, data.old_machine_name, data.old_name_product)
         )
+
+        # 2.1. Hitung ulang product_state untuk nama baru dari log yang sudah di-rename
+        cur.execute(
+            "DELETE FROM product_state WHERE (machine_name=%s AND name_product=%s) OR (machine_name=%s AND name_product=%s) "
+            "RETURNING log_id, station, nik",
+            (data.old_machine_name, data.old_name_product, data.new_machine_name, data.new_name_product)
+        )
+        # Sesi yang men-start product ikut pindah ke nama baru (untuk auto-stop saat logout)
+        sessions = {log_id: (station, nik) for log_id, station, nik in cur.fetchall() if station}
+        cur.execute("""
+            INSERT INTO product_state (machine_name, name_product, action, name_manpower, log_id, updated_at)
+            SELECT machine_name, name_product, action, name_manpower, id, COALESCE(created_at, NOW())
+            FROM log_product
+            WHERE machine_name=%s AND name_product=%s AND action IS NOT NULL
+            ORDER BY created_at DESC NULLS LAST, id DESC
+            LIMIT 1
+            RETURNING log_id
+        """, (data.new_machine_name, data.new_name_product))
+        state_row = cur.fetchone()
+        if state_row and state_row[0] in sessions:
+            cur.execute("UPDATE product_state SET station=%s, nik=%s WHERE machine_name=%s AND name_product=%s",
+                        (*sessions[state_row[0]], data.new_machine_name, data.new_name_product))
         
         # 3. Hapus dari detail WO lama
         cur.execute("DELETE FROM work_order_details WHERE machine_name=%s AND product_name=%s", 
@@ -562,20 +931,24 @@ class DeviceSchema(BaseModel):
 
 @app.get("/devices")
 def get_all_devices(username: str = Depends(verify_token)):
+    conn = get_db_connection()
     try:
-        conn = get_db_connection()
         cur = conn.cursor(cursor_factory=RealDictCursor)
         cur.execute("SELECT machine_name, serial_number FROM devices ORDER BY machine_name ASC")
         data = cur.fetchall()
         cur.close()
-        conn.close()
         return data
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        conn.close()
 
 # 13. POST ADD DEVICE
 @app.post("/add_device")
 async def post_add_device(data: DeviceSchema, username: str = Depends(verify_token)):
+    return await run_db(_post_add_device, data)
+
+def _post_add_device(data: DeviceSchema):
     conn = get_db_connection()
     cur = conn.cursor()
     try:
@@ -593,6 +966,9 @@ async def post_add_device(data: DeviceSchema, username: str = Depends(verify_tok
 # 14. DELETE DEVICE
 @app.delete("/delete_device/{machine_name}")
 async def delete_device(machine_name: str, username: str = Depends(verify_token)):
+    return await run_db(_delete_device, machine_name)
+
+def _delete_device(machine_name: str):
     conn = get_db_connection()
     cur = conn.cursor()
     try:
@@ -618,6 +994,9 @@ class DeviceUpdate(BaseModel):
 
 @app.put("/edit_device")
 async def edit_device(data: DeviceUpdate, username: str = Depends(verify_token)):
+    return await run_db(_edit_device, data)
+
+def _edit_device(data: DeviceUpdate):
     conn = get_db_connection()
     cur = conn.cursor()
     try:
@@ -686,20 +1065,32 @@ def login(data: LoginRequest):
         conn.close()
 
 # 16.1. Logout
+PURGE_TOKEN_BLACKLIST_QUERY = "DELETE FROM token_blacklist WHERE expires_at < NOW() AT TIME ZONE 'UTC'"
+
 @app.post("/logout")
 def logout(credentials: HTTPAuthorizationCredentials = Depends(security)):
     token = credentials.credentials
-    
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=["HS256"], options={"verify_exp": False})
+    except jwt.InvalidTokenError:
+        raise HTTPException(status_code=401, detail="Token tidak valid, akses ditolak")
+    tid = token_id(token)
+    exp = float(payload["exp"])
+
     conn = get_db_connection()
     cur = conn.cursor()
     try:        
-        # 1. FITUR SAPU OTOMATIS: Hapus token yang umurnya sudah lebih dari 7 hari
-        cur.execute("DELETE FROM token_blacklist WHERE blacklisted_at < NOW() - INTERVAL '7 days'")
+        # 1. FITUR SAPU OTOMATIS: Hapus token yang sudah kedaluwarsa (tidak akan lolos jwt.decode lagi)
+        cur.execute(PURGE_TOKEN_BLACKLIST_QUERY)
         
-        # 2. Masukkan token ke tabel blacklist.
+        # 2. Masukkan token ke tabel blacklist; trigger mengirim NOTIFY ke semua worker API
         cur.execute(
-            "INSERT INTO token_blacklist (token) VALUES (%s) ON CONFLICT DO NOTHING", 
-            (token,)
+            """
+            INSERT INTO token_blacklist (token, token_id, expires_at)
+            VALUES (%s, %s, to_timestamp(%s) AT TIME ZONE 'UTC')
+            ON CONFLICT DO NOTHING
+            """,
+            (token, tid, exp)
         )
         conn.commit()
     except Exception as e:
@@ -708,6 +1099,9 @@ def logout(credentials: HTTPAuthorizationCredentials = Depends(security)):
     finally:
         cur.close()
         conn.close()
+
+    # Worker ini langsung menolak token tanpa menunggu NOTIFY
+    token_blacklist.add(tid, exp)
         
     return {"status": "success", "message": "Berhasil logout, token dimatikan permanen"}
 
@@ -722,32 +1116,30 @@ class ChangePasswordRequest(BaseModel):
 def change_password(data: ChangePasswordRequest, username: str = Depends(verify_token)):
     conn = get_db_connection()
     cursor = conn.cursor()
+    try:
+        # 1. cek old password
+        check_query = """
+            SELECT username 
+            FROM accounts
+            WHERE username = %s AND passwords = %s
+        """
+        cursor.execute(check_query, (data.username, data.old_password))
+        user = cursor.fetchone()
 
-    # 1. cek old password
-    check_query = """
-        SELECT username 
-        FROM accounts
-        WHERE username = %s AND passwords = %s
-    """
-    cursor.execute(check_query, (data.username, data.old_password))
-    user = cursor.fetchone()
+        if not user:
+            raise HTTPException(status_code=401, detail="Password lama salah")
 
-    if not user:
+        # 2. update password
+        update_query = """
+            UPDATE accounts
+            SET passwords = %s
+            WHERE username = %s
+        """
+        cursor.execute(update_query, (data.new_password, data.username))
+        conn.commit()
+    finally:
         cursor.close()
         conn.close()
-        raise HTTPException(status_code=401, detail="Password lama salah")
-
-    # 2. update password
-    update_query = """
-        UPDATE accounts
-        SET passwords = %s
-        WHERE username = %s
-    """
-    cursor.execute(update_query, (data.new_password, data.username))
-    conn.commit()
-
-    cursor.close()
-    conn.close()
 
     return {
         "status": "success",
@@ -755,27 +1147,162 @@ def change_password(data: ChangePasswordRequest, username: str = Depends(verify_
     }
 
 # 18. Machine log filter
-@app.get("/machine/logs/filtered")
-def get_filtered_machine_logs(start_date: str = None, end_date: str = None, machine_id: str = None, username: str = Depends(verify_token)):
+# resolution: "raw" (default, baris mentah log_machine) atau ukuran bucket seperti 5m, 1h, 1d,
+# atau "auto" (dipilih supaya tiap tag maksimal ~MAX_RESOLUTION_POINTS titik).
+# Bucket diambil dari tabel rollup paling kasar yang masih pas (1h jika kelipatan jam, selain itu 1m).
+ROLLUP_TABLES = [(3600, "log_machine_rollup_1h"), (60, "log_machine_rollup_1m")]
+AUTO_RESOLUTION_STEPS = [60, 300, 900, 3600, 6 * 3600, 86400]
+MAX_RESOLUTION_POINTS = 1000
+RESOLUTION_UNITS = {"m": 60, "h": 3600, "d": 86400}
+
+def parse_resolution(resolution, start_day, end_day):
+    """Kembalikan ukuran bucket dalam detik, atau None untuk data mentah."""
+    if not resolution or resolution == "raw":
+        return None
+    if resolution == "auto":
+        span = ((end_day - start_day).days + 1) * 86400
+        for step in AUTO_RESOLUTION_STEPS:
+            if span / step <= MAX_RESOLUTION_POINTS:
+                return step
+        return AUTO_RESOLUTION_STEPS[-1]
+    unit = RESOLUTION_UNITS.get(resolution[-1:])
+    if not unit or not resolution[:-1].isdigit() or int(resolution[:-1]) <= 0:
+        raise HTTPException(status_code=400, detail="resolution harus raw, auto, atau <angka><m|h|d> (mis. 5m, 1h)")
+    return int(resolution[:-1]) * unit
+
+RAW_LOG_COLUMNS = ["created_at", "machine_id", "tag_name", "tag_value", "recorded_at"]
+ROLLUP_LOG_COLUMNS = ["created_at", "machine_id", "tag_name", "tag_value", "sample_count", "value_min", "value_max", "value_avg"]
+
+def parse_machine_log_request(start_date, end_date, machine_id, resolution):
+    if not start_date or not end_date or not machine_id:
+        raise HTTPException(status_code=400, detail="start_date, end_date, and machine_id are required")
     try:
-        if not start_date or not end_date or not machine_id:
-            raise HTTPException(status_code=400, detail="start_date, end_date, and machine_id are required")
-        
-        conn = get_db_connection()
-        cur = conn.cursor(cursor_factory=RealDictCursor)
-        query = """
+        start_day = datetime.strptime(start_date, "%Y-%m-%d").date()
+        end_day = datetime.strptime(end_date, "%Y-%m-%d").date()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="start_date dan end_date harus berformat YYYY-MM-DD")
+    return start_day, end_day, parse_resolution(resolution, start_day, end_day)
+
+def build_machine_log_query(start_day, end_day, machine_id, step, tag_name=None):
+    """Kembalikan (query, params, columns) untuk data mentah (step None) atau rollup."""
+    params = {"start": start_day, "end": end_day, "machine_id": machine_id, "tag_name": tag_name}
+    tag_filter = "AND tag_name = %(tag_name)s" if tag_name else ""
+
+    if step is None:
+        query = f"""
             SELECT created_at, machine_id, tag_name, tag_value, recorded_at 
             FROM log_machine 
-            WHERE DATE(created_at) >= %s AND DATE(created_at) <= %s AND machine_id = %s
+            WHERE created_at >= %(start)s::date AND created_at < %(end)s::date + 1
+              AND machine_id = %(machine_id)s {tag_filter}
             ORDER BY created_at ASC
         """
-        cur.execute(query, (start_date, end_date, machine_id))
+        return query, params, RAW_LOG_COLUMNS
+
+    table = next(name for size, name in ROLLUP_TABLES if step % size == 0)
+    params["step"] = f"{step} seconds"
+    # created_at = awal bucket, tag_value = nilai terakhir di bucket (kompatibel dengan format raw)
+    query = f"""
+        SELECT date_bin(%(step)s::interval, bucket, TIMESTAMP '2000-01-01') AS created_at,
+               machine_id, tag_name,
+               (array_agg(last_value ORDER BY last_at DESC))[1] AS tag_value,
+               SUM(sample_count) AS sample_count,
+               MIN(value_min) AS value_min,
+               MAX(value_max) AS value_max,
+               SUM(value_sum) / NULLIF(SUM(value_count), 0) AS value_avg
+        FROM {table}
+        WHERE bucket >= %(start)s::date AND bucket < %(end)s::date + 1
+          AND machine_id = %(machine_id)s {tag_filter}
+        GROUP BY 1, machine_id, tag_name
+        ORDER BY created_at ASC, tag_name ASC
+    """
+    return query, params, ROLLUP_LOG_COLUMNS
+
+@app.get("/machine/logs/filtered")
+def get_filtered_machine_logs(start_date: str = None, end_date: str = None, machine_id: str = None,
+                              resolution: str = "raw", tag_name: Optional[str] = None,
+                              username: str = Depends(verify_token)):
+    start_day, end_day, step = parse_machine_log_request(start_date, end_date, machine_id, resolution)
+    query, params, _ = build_machine_log_query(start_day, end_day, machine_id, step, tag_name)
+
+    conn = get_db_connection()
+    try:
+        cur = conn.cursor(cursor_factory=RealDictCursor)
+        cur.execute(query, params)
         logs = cur.fetchall()
         cur.close()
-        conn.close()
         return logs
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        conn.close()
+
+# 18.1. Machine log export (streaming CSV / NDJSON)
+# Baris dibaca lewat named (server-side) cursor per EXPORT_CHUNK_ROWS dan langsung dikirim,
+# jadi memori tetap konstan berapa pun panjang range-nya.
+EXPORT_CHUNK_ROWS = int(os.getenv("EXPORT_CHUNK_ROWS", 5000))
+EXPORT_FORMATS = {"csv": "text/csv; charset=utf-8", "ndjson": "application/x-ndjson"}
+
+def _export_value(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+def stream_machine_logs(query, params, columns, fmt):
+    # Koneksi diambil di dalam generator: jika client putus sebelum body mulai dikirim,
+    # generator tidak pernah jalan dan tidak ada slot pool yang tertahan
+    conn = get_db_connection()
+    try:
+        # Cursor server-side ditutup di sini juga saat generator dihentikan (client putus);
+        # transaksinya di-rollback oleh pool saat koneksi dikembalikan (db.ConnectionPool._release)
+        with conn.cursor(name="machine_log_export") as cur:
+            cur.itersize = EXPORT_CHUNK_ROWS
+            cur.execute(query, params)
+
+            if fmt == "csv":
+                buffer = io.StringIO()
+                writer = csv.writer(buffer)
+                writer.writerow(columns)
+                yield buffer.getvalue()
+            while True:
+                rows = cur.fetchmany(EXPORT_CHUNK_ROWS)
+                if not rows:
+                    break
+                if fmt == "csv":
+                    buffer.seek(0)
+                    buffer.truncate()
+                    writer.writerows([[_export_value(v) for v in row] for row in rows])
+                    yield buffer.getvalue()
+                else:
+                    yield "".join(
+                        json.dumps(dict(zip(columns, (_export_value(v) for v in row))), default=str) + "\n"
+                        for row in rows
+                    )
+    finally:
+        conn.close()
+
+def close_export_stream(stream):
+    # Dipanggil setelah response selesai / client putus, supaya cursor dan koneksi dilepas
+    # sekarang, bukan menunggu generator di-garbage-collect
+    try:
+        stream.close()
+    except ValueError:
+        pass  # next() masih berjalan di thread lain; generator ditutup saat di-garbage-collect
+
+@app.get("/machine/logs/export")
+def export_machine_logs(start_date: str = None, end_date: str = None, machine_id: str = None,
+                        format: str = "csv", resolution: str = "raw", tag_name: Optional[str] = None,
+                        username: str = Depends(verify_token)):
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail="format harus csv atau ndjson")
+    start_day, end_day, step = parse_machine_log_request(start_date, end_date, machine_id, resolution)
+    query, params, columns = build_machine_log_query(start_day, end_day, machine_id, step, tag_name)
+
+    filename = f"machine_logs_{machine_id}_{start_day}_{end_day}.{format}"
+    stream = stream_machine_logs(query, params, columns, format)
+    return StreamingResponse(
+        stream,
+        media_type=EXPORT_FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+        background=BackgroundTask(close_export_stream, stream),
+    )
 
 # 19. work order
 def get_wib_now():
@@ -799,38 +1326,37 @@ class WorkOrderResponse(BaseModel):
     parts: List[Dict]
 
 # 19.1. GET ALL WORK ORDERS
+# UBAH wo.start_date dan wo.end_date menjadi wo.created_at
+WORK_ORDERS_QUERY = """
+    SELECT 
+        wo.id, wo.wo_number, wo.created_at, 
+        COALESCE(json_agg(
+            json_build_object(
+                'machine', wod.machine_name,
+                'name', wod.product_name,
+                'status', COALESCE(lp.action, 'Pending')
+            )
+        ) FILTER (WHERE wod.product_name IS NOT NULL), '[]') AS parts
+    FROM work_orders wo
+    LEFT JOIN work_order_details wod ON wod.wo_number = wo.wo_number
+    LEFT JOIN product_state lp
+      ON lp.name_product = wod.product_name
+     AND lp.machine_name = wod.machine_name
+    GROUP BY wo.id
+    ORDER BY wo.id DESC
+"""
+
 @app.get("/work-orders", response_model=List[WorkOrderResponse])
 def get_work_orders(username: str = Depends(verify_token)):
     conn = get_db_connection()
     cur = conn.cursor(cursor_factory=RealDictCursor)
 
-    # UBAH wo.start_date dan wo.end_date menjadi wo.created_at
-    query = """
-        SELECT 
-            wo.id, wo.wo_number, wo.created_at, 
-            COALESCE(json_agg(
-                json_build_object(
-                    'machine', wod.machine_name,
-                    'name', wod.product_name,
-                    'status', COALESCE(lp.action, 'Pending')
-                )
-            ) FILTER (WHERE wod.product_name IS NOT NULL), '[]') AS parts
-        FROM work_orders wo
-        LEFT JOIN work_order_details wod ON wod.wo_number = wo.wo_number
-        LEFT JOIN LATERAL (
-            SELECT action
-            FROM log_product
-            WHERE name_product = wod.product_name 
-              AND machine_name = wod.machine_name
-            ORDER BY created_at DESC
-            LIMIT 1
-        ) lp ON TRUE
-        GROUP BY wo.id
-        ORDER BY wo.id DESC
-    """
-
-    cur.execute(query)
-    rows = cur.fetchall()
+    try:
+        cur.execute(WORK_ORDERS_QUERY)
+        rows = cur.fetchall()
+    finally:
+        cur.close()
+        conn.close()
 
     result = []
     for r in rows:
@@ -842,8 +1368,6 @@ def get_work_orders(username: str = Depends(verify_token)):
             "parts": r["parts"]
         })
 
-    cur.close()
-    conn.close()
     return result
 
 # 19.2. GET LOGS SPECIFIC WO
@@ -863,8 +1387,12 @@ def get_work_order_logs(wo_number: str, username: str = Depends(verify_token)):
         ORDER BY lp.created_at ASC
     """
 
-    cur.execute(query, (wo_number,))
-    rows = cur.fetchall()
+    try:
+        cur.execute(query, (wo_number,))
+        rows = cur.fetchall()
+    finally:
+        cur.close()
+        conn.close()
     
     logs = {}
 
@@ -875,8 +1403,6 @@ def get_work_order_logs(wo_number: str, username: str = Depends(verify_token)):
             "time": r["created_at"].isoformat() if r["created_at"] else None
         })
 
-    cur.close()
-    conn.close()
     return logs
 
 # --- ENDPOINTS VALIDATION (EXISTING) ---
@@ -891,3 +1417,8 @@ def api_validate_product(machine_name: str, name_product: str):
     payload = {"machine_name": machine_name, "name_product": name_product}
     success, message = system.handle_product(payload)
     return {"success": success, "message": message}
+
+# --- DB POOL STATS ---
+@app.get("/db/pool")
+def get_db_pool_stats(username: str = Depends(verify_token)):
+    return pool.stats()
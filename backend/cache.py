@@ -0,0 +1,319 @@
+import os
+import json
+import time
+import hashlib
+import select
+import logging
+import threading
+
+import psycopg2
+
+from db import DB_CONFIG, pool
+
+# ==============================
+# CACHE CONFIG
+# ==============================
+# Channel NOTIFY dari trigger manpower / product (lihat migrations/0007_master_data_notify.sql)
+MASTER_DATA_CHANNEL = "master_data_changed"
+# Interval cek koneksi LISTEN (detik) saat tidak ada notifikasi
+CACHE_LISTEN_TIMEOUT = float(os.getenv("CACHE_LISTEN_TIMEOUT", 30))
+
+
+def format_tag_value(value):
+    """
+    Nilai tag sebagai string, sama dengan log_machine.tag_value yang ditulis ingest
+    (machine_data/decode.coerce_value): bool -> "true"/"false", float -> repr, lainnya JSON.
+    """
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, (int, float, str)):
+        return value if isinstance(value, str) else repr(value)
+    return json.dumps(value)
+
+
+def _scalar(cur, query, params):
+    """Kolom pertama baris pertama (cursor tuple maupun RealDictCursor), atau None."""
+    cur.execute(query, params)
+    row = cur.fetchone()
+    if row is None:
+        return None
+    return next(iter(row.values())) if isinstance(row, dict) else row[0]
+
+
+def _fallback_scalar(cur, query, params):
+    """
+    Lookup DB saat cache tidak live. Jika pemanggil sedang di dalam transaksi, pakai cursor-nya
+    (`cur`) supaya satu scan tidak memegang dua koneksi pool sekaligus.
+    """
+    if cur is not None:
+        return _scalar(cur, query, params)
+    conn = pool.getconn()
+    try:
+        with conn.cursor() as own_cur:
+            return _scalar(own_cur, query, params)
+    finally:
+        conn.close()
+
+
+class MasterDataCache:
+    """
+    Salinan in-memory tabel manpower, product dan devices untuk validasi scan badge.
+
+    Cache hanya dipakai selama listener LISTEN/NOTIFY hidup (`live`); sebelum itu atau saat
+    koneksi listener putus, lookup jatuh kembali ke query DB biasa supaya tidak pernah
+    memakai data yang mungkin sudah basi.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._manpower = {}  # nik -> name
+        self._products = {}  # (machine_name, name_product) -> name_product
+        self._devices = set()  # machine_name (= station id)
+        self.live = False
+
+    # --- loaders ---
+    def _load_manpower(self, cur):
+        cur.execute("SELECT nik, name FROM manpower")
+        manpower = {str(nik): name for nik, name in cur.fetchall()}
+        with self._lock:
+            self._manpower = manpower
+
+    def _load_products(self, cur):
+        cur.execute("SELECT machine_name, name_product FROM product")
+        products = {(machine, product): product for machine, product in cur.fetchall()}
+        with self._lock:
+            self._products = products
+
+    def _load_devices(self, cur):
+        cur.execute("SELECT machine_name FROM devices")
+        devices = {machine for (machine,) in cur.fetchall()}
+        with self._lock:
+            self._devices = devices
+
+    def reload(self, conn, tables=("manpower", "product", "devices")):
+        with conn.cursor() as cur:
+            if "manpower" in tables:
+                self._load_manpower(cur)
+            if "product" in tables:
+                self._load_products(cur)
+            if "devices" in tables:
+                self._load_devices(cur)
+        logging.info(f"🗃️ Cache master data dimuat ulang: {', '.join(tables)}")
+
+    # --- lookups ---
+    def manpower_name(self, nik, cur=None):
+        """Nama manpower untuk nik, atau None jika tidak terdaftar."""
+        if self.live:
+            with self._lock:
+                return self._manpower.get(str(nik))
+        return _fallback_scalar(cur, "SELECT name FROM manpower WHERE nik=%s", (nik,))
+
+    def product_name(self, machine_name, name_product, cur=None):
+        """name_product seperti tersimpan di master product, atau None jika tidak terdaftar."""
+        if self.live:
+            with self._lock:
+                return self._products.get((machine_name, name_product))
+        return _fallback_scalar(cur, "SELECT name_product FROM product WHERE machine_name=%s AND name_product=%s",
+                                (machine_name, name_product))
+
+    def device_exists(self, machine_name, cur=None):
+        """True jika machine_name terdaftar di master devices."""
+        if self.live:
+            with self._lock:
+                return machine_name in self._devices
+        return _fallback_scalar(cur, "SELECT 1 FROM devices WHERE machine_name=%s LIMIT 1", (machine_name,)) is not None
+
+    # --- invalidation ---
+    def listen_forever(self):
+        """Thread: LISTEN master_data_changed dan muat ulang tabel yang berubah."""
+        while True:
+            conn = None
+            try:
+                conn = psycopg2.connect(**DB_CONFIG)
+                conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+                with conn.cursor() as cur:
+                    cur.execute(f"LISTEN {MASTER_DATA_CHANNEL}")
+                # Muat penuh setelah LISTEN aktif, supaya perubahan di antaranya tidak terlewat
+                self.reload(conn)
+                self.live = True
+                while True:
+                    if select.select([conn], [], [], CACHE_LISTEN_TIMEOUT) == ([], [], []):
+                        with conn.cursor() as cur:
+                            cur.execute("SELECT 1")
+                        continue
+                    conn.poll()
+                    tables = {notify.payload for notify in conn.notifies}
+                    conn.notifies.clear()
+                    if tables:
+                        self.reload(conn, tables)
+            except Exception as e:
+                self.live = False
+                logging.warning(f"Cache master data: listener terputus ({e}), mencoba lagi dalam 5 detik...")
+                time.sleep(5)
+            finally:
+                if conn is not None:
+                    try:
+                        conn.close()
+                    except Exception:
+                        pass
+
+
+class TagValueCache:
+    """
+    Nilai terakhir tag interlock (mis. PB_EMG) per mesin, di-update dari stream MQTT.
+    get() tanpa machine_id mengembalikan nilai terbaru dari mesin mana pun (perilaku lama).
+
+    Sama seperti MasterDataCache: hanya dipakai selama subscription MQTT aktif (`live`);
+    di luar itu nilai dibaca dari log_machine_latest.
+    """
+
+    def __init__(self, tag_names):
+        self.tag_names = set(tag_names)
+        self._lock = threading.Lock()
+        self._values = {}  # (machine_id | None, tag_name) -> (created_at, tag_value)
+        self.live = False
+
+    def update(self, tag_name, tag_value, created_at, machine_id=None):
+        if tag_name not in self.tag_names:
+            return
+        keys = [(None, tag_name)] + ([(machine_id, tag_name)] if machine_id else [])
+        with self._lock:
+            for key in keys:
+                current = self._values.get(key)
+                if current is None or current[0] <= created_at:
+                    self._values[key] = (created_at, tag_value)
+
+    def update_from_gateway(self, payload, created_at, machine_id=None):
+        """Payload gateway `<machine_id>/data`: {"ts": ..., "d": [{"tag": ..., "value": ...}]}"""
+        for item in payload.get("d") or []:
+            if isinstance(item, dict) and item.get("tag") in self.tag_names and item.get("value") is not None:
+                self.update(item["tag"], format_tag_value(item["value"]), created_at, machine_id)
+
+    def seed(self):
+        """Isi ulang dari log_machine_latest (saat start / setelah MQTT reconnect)."""
+        conn = pool.getconn()
+        try:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    SELECT machine_id, tag_name, tag_value, created_at
+                    FROM log_machine_latest
+                    WHERE tag_name = ANY(%s)
+                """, (list(self.tag_names),))
+                rows = cur.fetchall()
+        finally:
+            conn.close()
+        for machine_id, tag_name, tag_value, created_at in rows:
+            self.update(tag_name, tag_value, created_at, machine_id)
+
+    def get(self, tag_name, machine_id=None, cur=None):
+        if self.live:
+            with self._lock:
+                current = self._values.get((machine_id, tag_name))
+            return current[1] if current else None
+        if machine_id:
+            return _fallback_scalar(cur, "SELECT tag_value FROM log_machine_latest WHERE machine_id=%s AND tag_name=%s",
+                                    (machine_id, tag_name))
+        return _fallback_scalar(cur, "SELECT tag_value FROM log_machine_latest WHERE tag_name=%s ORDER BY created_at DESC LIMIT 1",
+                                (tag_name,))
+
+
+
+# Channel NOTIFY dari trigger token_blacklist (lihat migrations/0010_token_blacklist_id.sql)
+TOKEN_BLACKLIST_CHANNEL = "token_blacklist"
+# Fallback saat listener tidak live
+TOKEN_BLACKLIST_LOOKUP_QUERY = "SELECT 1 FROM token_blacklist WHERE token_id = %s"
+
+
+def token_id(token):
+    """Kunci blacklist: sha256 token (hex), sama dengan kolom token_blacklist.token_id."""
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+class TokenBlacklist:
+    """
+    Token yang sudah di-logout, disimpan di memori setiap worker API: token_id -> exp (epoch).
+
+    Dimuat penuh saat listener LISTEN token_blacklist tersambung, lalu diperbarui dari NOTIFY
+    setiap /logout di worker mana pun. Entri dibuang setelah exp lewat, karena token itu sudah
+    ditolak oleh jwt.decode. Selama listener tidak `live`, cek jatuh kembali ke query DB.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tokens = {}
+        self.live = False
+
+    def load(self, conn):
+        with conn.cursor() as cur:
+            cur.execute("""
+                SELECT token_id, EXTRACT(EPOCH FROM expires_at)
+                FROM token_blacklist
+                WHERE token_id IS NOT NULL AND expires_at > NOW() AT TIME ZONE 'UTC'
+            """)
+            tokens = {tid: float(exp) for tid, exp in cur.fetchall()}
+        with self._lock:
+            self._tokens = tokens
+        logging.info(f"🗃️ Token blacklist dimuat: {len(tokens)} token")
+
+    def add(self, tid, exp):
+        if exp <= time.time():
+            return
+        with self._lock:
+            self._tokens[tid] = exp
+
+    def prune(self):
+        now = time.time()
+        with self._lock:
+            self._tokens = {tid: exp for tid, exp in self._tokens.items() if exp > now}
+
+    def contains(self, tid):
+        if self.live:
+            with self._lock:
+                exp = self._tokens.get(tid)
+                if exp is not None and exp <= time.time():
+                    del self._tokens[tid]
+                    exp = None
+            return exp is not None
+        conn = pool.getconn()
+        try:
+            with conn.cursor() as cur:
+                cur.execute(TOKEN_BLACKLIST_LOOKUP_QUERY, (tid,))
+                return cur.fetchone() is not None
+        finally:
+            conn.close()
+
+    def listen_forever(self):
+        """Thread: LISTEN token_blacklist dan tambahkan token dari setiap NOTIFY."""
+        while True:
+            conn = None
+            try:
+                conn = psycopg2.connect(**DB_CONFIG)
+                conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+                with conn.cursor() as cur:
+                    cur.execute(f"LISTEN {TOKEN_BLACKLIST_CHANNEL}")
+                # Muat penuh setelah LISTEN aktif, supaya logout di antaranya tidak terlewat
+                self.load(conn)
+                self.live = True
+                while True:
+                    if select.select([conn], [], [], CACHE_LISTEN_TIMEOUT) == ([], [], []):
+                        with conn.cursor() as cur:
+                            cur.execute("SELECT 1")
+                        self.prune()
+                        continue
+                    conn.poll()
+                    for notify in conn.notifies:
+                        tid, exp = notify.payload.split()
+                        self.add(tid, float(exp))
+                    conn.notifies.clear()
+            except Exception as e:
+                self.live = False
+                logging.warning(f"Token blacklist: listener terputus ({e}), mencoba lagi dalam 5 detik...")
+                time.sleep(5)
+            finally:
+                if conn is not None:
+                    try:
+                        conn.close()
+                    except Exception:
+                        pass
@@ -0,0 +1,248 @@
+import os
+import time
+import asyncio
+import functools
+import threading
+import logging
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+import psycopg2
+
+# ==============================
+# DB CONFIG (ENV-DRIVEN)
+# ==============================
+DB_CONFIG = {
+    "dbname": os.getenv("DB_NAME", "database_barcode"),
+    "user": os.getenv("DB_USER", "postgres"),
+    "password": os.getenv("DB_PASS", "a"),
+    "host": os.getenv("DB_HOST", "postgres-db"),
+    "port": os.getenv("DB_PORT", "5432")
+}
+
+# POOL CONFIG
+POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN", 2))
+POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX", 20))
+POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 10))
+# Koneksi yang idle lebih lama dari ini akan di-ping (SELECT 1) sebelum dipakai
+POOL_HEALTHCHECK_IDLE = float(os.getenv("DB_POOL_HEALTHCHECK_IDLE", 30))
+# Koneksi yang umurnya melebihi ini akan ditutup dan diganti yang baru (0 = tidak dibatasi)
+POOL_MAX_LIFETIME = float(os.getenv("DB_POOL_MAX_LIFETIME", 3600))
+# Jumlah thread untuk menjalankan query dari route async (default = ukuran pool)
+DB_EXECUTOR_WORKERS = int(os.getenv("DB_EXECUTOR_WORKERS", POOL_MAX_SIZE))
+
+
+class PoolTimeout(Exception):
+    """Raised when no connection becomes available within the checkout timeout."""
+
+
+class PooledConnection:
+    """Proxy around a psycopg2 connection; close() hands it back to the pool."""
+
+    def __init__(self, pool, conn, created_at):
+        self._pool = pool
+        self._conn = conn
+        self._created_at = created_at
+
+    def __getattr__(self, name):
+        if self._conn is None:
+            raise psycopg2.InterfaceError("connection already returned to pool")
+        return getattr(self._conn, name)
+
+    def close(self):
+        if self._conn is None:
+            return
+        conn, self._conn = self._conn, None
+        self._pool._release(conn, self._created_at)
+
+
+class ConnectionPool:
+    """Thread-safe psycopg2 pool with bounded size, checkout timeout and health checks."""
+
+    def __init__(self, min_size=POOL_MIN_SIZE, max_size=POOL_MAX_SIZE, timeout=POOL_TIMEOUT,
+                 healthcheck_idle=POOL_HEALTHCHECK_IDLE, max_lifetime=POOL_MAX_LIFETIME, **conn_kwargs):
+        if max_size < 1 or min_size < 0 or min_size > max_size:
+            raise ValueError(f"Invalid pool size min={min_size} max={max_size}")
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.healthcheck_idle = healthcheck_idle
+        self.max_lifetime = max_lifetime
+        self.conn_kwargs = conn_kwargs or DB_CONFIG
+
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_size)
+        self._idle = deque()  # (conn, created_at, last_used)
+        self._in_use = 0
+        self._waiting = 0
+        self._prefilled = False
+        self._stats = {
+            "checkouts": 0,
+            "timeouts": 0,
+            "connections_created": 0,
+            "connections_discarded": 0,
+            "healthcheck_failures": 0,
+            "max_wait_ms": 0.0,
+        }
+
+    # --- internal helpers ---
+    def _connect(self):
+        conn = psycopg2.connect(**self.conn_kwargs)
+        with self._lock:
+            self._stats["connections_created"] += 1
+        return conn, time.monotonic()
+
+    def _discard(self, conn):
+        with self._lock:
+            self._stats["connections_discarded"] += 1
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _expired(self, created_at, now):
+        return self.max_lifetime > 0 and now - created_at > self.max_lifetime
+
+    def _healthy(self, conn, last_used, now):
+        if conn.closed:
+            return False
+        if now - last_used < self.healthcheck_idle:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except Exception as e:
+            logging.warning(f"DB pool: koneksi stale dibuang ({e})")
+            with self._lock:
+                self._stats["healthcheck_failures"] += 1
+            return False
+
+    def _prefill(self):
+        with self._lock:
+            if self._prefilled:
+                return
+            self._prefilled = True
+        for _ in range(self.min_size):
+            try:
+                conn, created_at = self._connect()
+            except Exception as e:
+                logging.warning(f"DB pool: gagal mengisi koneksi awal ({e})")
+                return
+            with self._lock:
+                self._idle.append((conn, created_at, time.monotonic()))
+
+    def _release(self, conn, created_at):
+        try:
+            now = time.monotonic()
+            if conn.closed or self._expired(created_at, now):
+                self._discard(conn)
+                return
+            try:
+                # Jangan kembalikan koneksi yang masih di tengah transaksi
+                if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except Exception:
+                self._discard(conn)
+                return
+            with self._lock:
+                self._idle.append((conn, created_at, now))
+        finally:
+            with self._lock:
+                self._in_use -= 1
+            self._slots.release()
+
+    # --- public API ---
+    def getconn(self, timeout=None):
+        """Check out a connection, waiting up to `timeout` seconds for a free slot."""
+        if not self._prefilled:
+            self._prefill()
+
+        timeout = self.timeout if timeout is None else timeout
+        started = time.monotonic()
+        with self._lock:
+            self._waiting += 1
+        acquired = self._slots.acquire(timeout=timeout)
+        waited_ms = (time.monotonic() - started) * 1000
+        with self._lock:
+            self._waiting -= 1
+            if not acquired:
+                self._stats["timeouts"] += 1
+            else:
+                self._in_use += 1
+                self._stats["checkouts"] += 1
+                self._stats["max_wait_ms"] = max(self._stats["max_wait_ms"], waited_ms)
+        if not acquired:
+            raise PoolTimeout(f"Tidak ada koneksi DB tersedia dalam {timeout} detik")
+
+        try:
+            while True:
+                with self._lock:
+                    item = self._idle.pop() if self._idle else None
+                if item is None:
+                    conn, created_at = self._connect()
+                    break
+                conn, created_at, last_used = item
+                now = time.monotonic()
+                if self._expired(created_at, now) or not self._healthy(conn, last_used, now):
+                    self._discard(conn)
+                    continue
+                break
+        except Exception:
+            with self._lock:
+                self._in_use -= 1
+            self._slots.release()
+            raise
+
+        return PooledConnection(self, conn, created_at)
+
+    @contextmanager
+    def connection(self, timeout=None):
+        conn = self.getconn(timeout)
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def stats(self):
+        with self._lock:
+            idle = len(self._idle)
+            return {
+                "min_size": self.min_size,
+                "max_size": self.max_size,
+                "size": idle + self._in_use,
+                "idle": idle,
+                "in_use": self._in_use,
+                "waiting": self._waiting,
+                **self._stats,
+            }
+
+    def closeall(self):
+        with self._lock:
+            idle, self._idle = list(self._idle), deque()
+        for conn, _, _ in idle:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+
+# Pool bersama per proses (dipakai oleh semua endpoint API)
+pool = ConnectionPool()
+
+
+def get_db_connection(timeout=None):
+    return pool.getconn(timeout)
+
+
+# Executor terbatas untuk pekerjaan DB yang dipanggil dari route async,
+# supaya query blocking psycopg2 tidak berjalan di event loop
+db_executor = ThreadPoolExecutor(max_workers=DB_EXECUTOR_WORKERS, thread_name_prefix="db-worker")
+
+
+async def run_db(fn, *args, **kwargs):
+    """Run a blocking DB function on the bounded DB executor and await its result."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(db_executor, functools.partial(fn, *args, **kwargs))
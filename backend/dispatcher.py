@@ -0,0 +1,142 @@
+import time
+import zlib
+import logging
+import threading
+from collections import deque
+
+import paho.mqtt.client as mqtt
+
+
+class Lane:
+    """Satu antrean + satu worker thread: pesan di lane yang sama diproses berurutan."""
+
+    def __init__(self, name, handler, maxsize=0, keep=None):
+        self.name = name
+        self.handler = handler
+        self.maxsize = maxsize
+        # keep(msg) -> True: pesan tidak pernah dibuang saat lane penuh (mis. Machine_Status / EMG)
+        self.keep = keep
+        self._items = deque()
+        self._cond = threading.Condition()
+        self.depth_by_topic = {}
+        self.processed = 0
+        self.dropped = 0
+        self.errors = 0
+        self.max_wait_ms = 0.0
+        self.last_wait_ms = 0.0
+        # Lama handler berjalan per pesan (untuk scan: terima -> feedback terkirim)
+        self.total_handle_ms = 0.0
+        self.max_handle_ms = 0.0
+
+    def put(self, client, msg):
+        with self._cond:
+            if self.maxsize and len(self._items) >= self.maxsize:
+                # Lane bulk penuh: buang pesan terlama yang boleh dibuang, jangan blok thread
+                # network paho. Pesan `keep` tetap masuk walaupun lane melebihi maxsize.
+                self._drop_oldest()
+            # keep=None: belum dievaluasi (hanya perlu saat lane penuh)
+            self._items.append((client, msg, time.monotonic(), None))
+            self.depth_by_topic[msg.topic] = self.depth_by_topic.get(msg.topic, 0) + 1
+            self._cond.notify()
+
+    def _drop_oldest(self):
+        for i, (client, old_msg, queued_at, keep) in enumerate(self._items):
+            if keep is None:
+                keep = bool(self.keep and self.keep(old_msg))
+                # Disimpan supaya pesan yang sama tidak dievaluasi ulang di put berikutnya
+                self._items[i] = (client, old_msg, queued_at, keep)
+            if not keep:
+                del self._items[i]
+                self._dec(old_msg.topic)
+                self.dropped += 1
+                return
+
+    def _dec(self, topic):
+        depth = self.depth_by_topic.get(topic, 0) - 1
+        if depth > 0:
+            self.depth_by_topic[topic] = depth
+        else:
+            self.depth_by_topic.pop(topic, None)
+
+    def run(self):
+        while True:
+            with self._cond:
+                while not self._items:
+                    self._cond.wait()
+                client, msg, queued_at, _ = self._items.popleft()
+                self._dec(msg.topic)
+            started = time.monotonic()
+            wait_ms = (started - queued_at) * 1000
+            try:
+                self.handler(client, msg)
+            except Exception as e:
+                with self._cond:
+                    self.errors += 1
+                logging.error(f"Dispatcher [{self.name}]: error memproses {msg.topic}: {e}")
+            handle_ms = (time.monotonic() - started) * 1000
+            with self._cond:
+                self.processed += 1
+                self.last_wait_ms = wait_ms
+                self.max_wait_ms = max(self.max_wait_ms, wait_ms)
+                self.total_handle_ms += handle_ms
+                self.max_handle_ms = max(self.max_handle_ms, handle_ms)
+
+    def stats(self):
+        with self._cond:
+            return {
+                "depth": len(self._items),
+                "depth_by_topic": dict(self.depth_by_topic),
+                "processed": self.processed,
+                "dropped": self.dropped,
+                "errors": self.errors,
+                "last_wait_ms": round(self.last_wait_ms, 1),
+                "max_wait_ms": round(self.max_wait_ms, 1),
+                "avg_handle_ms": round(self.total_handle_ms / self.processed, 1) if self.processed else 0.0,
+                "max_handle_ms": round(self.max_handle_ms, 1),
+            }
+
+
+class TopicDispatcher:
+    """
+    Memindahkan pemrosesan pesan MQTT dari thread network paho ke worker per lane.
+
+    Setiap lane punya satu worker, jadi urutan pesan dalam satu topic tetap terjaga.
+    Topic scan (manpower/product) punya lane sendiri sehingga tidak pernah antre di
+    belakang data mesin; lane bulk dibatasi `maxsize` dan membuang pesan terlama, kecuali
+    pesan yang ditandai `keep(msg)`.
+
+    Dengan `workers` > 1, lane dipecah menjadi beberapa shard; `key(topic)` (mis. station id)
+    menentukan shard, jadi pesan dengan key yang sama tetap berurutan sementara key yang
+    berbeda diproses paralel.
+    """
+
+    def __init__(self):
+        self.lanes = []
+        self._routes = []  # (topic filter, [lane], key)
+
+    def add_lane(self, name, handler, topics, maxsize=0, workers=1, key=None, keep=None):
+        if workers > 1:
+            shards = [Lane(f"{name}-{i}", handler, maxsize, keep) for i in range(workers)]
+        else:
+            shards = [Lane(name, handler, maxsize, keep)]
+        self.lanes.extend(shards)
+        self._routes.extend((topic, shards, key) for topic in topics)
+        return shards
+
+    def start(self):
+        for lane in self.lanes:
+            threading.Thread(target=lane.run, name=f"dispatch-{lane.name}", daemon=True).start()
+
+    def dispatch(self, client, msg):
+        """Dipanggil dari on_message; mengembalikan False jika tidak ada lane untuk topic ini."""
+        for topic, shards, key in self._routes:
+            if mqtt.topic_matches_sub(topic, msg.topic):
+                shard = 0
+                if len(shards) > 1:
+                    shard = zlib.crc32((key(msg.topic) if key else msg.topic).encode()) % len(shards)
+                shards[shard].put(client, msg)
+                return True
+        return False
+
+    def stats(self):
+        return {lane.name: lane.stats() for lane in self.lanes}
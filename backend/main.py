@@ -7,6 +7,7 @@ import threading
 import time
 import logging
 import os
+from datetime import datetime, timezone
 
 # Enable DEBUG logging to show DEBUG messages
 logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -14,13 +15,12 @@ logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %
 # ==============================
 # DB CONSTANTS AND CONFIG
 # ==============================
-DB_CONFIG = {
-    "dbname": os.getenv("DB_NAME", "database_barcode"),
-    "user": os.getenv("DB_USER", "postgres"),
-    "password": os.getenv("DB_PASS", "a"),
-    "host": os.getenv("DB_HOST", "postgres-db"),
-    "port": os.getenv("DB_PORT", "5432")
-}
+from db import DB_CONFIG, pool
+from maintenance import run_maintenance_loop
+from cache import MasterDataCache, TagValueCache, format_tag_value
+from dispatcher import TopicDispatcher
+from stations import (StationRegistry, station_from_topic, DEFAULT_STATION,
+                      TOPIC_STATION_MANPOWER, TOPIC_STATION_PRODUCT)
 
 # MQTT CONFIG
 MQTT_BROKER = os.getenv("MQTT_BROKER", "192.168.1.205") 
@@ -30,18 +30,153 @@ MQTT_PORT = int(os.getenv("MQTT_PORT", 1883))
 TOPIC_MANPOWER = "data/manpower"
 TOPIC_PRODUCT = "data/product"
 TOPIC_MACHINE = "data/machine"
+# Payload gateway per mesin (ditulis ke DB oleh machine_data); di sini hanya untuk cache tag interlock
+TOPIC_GATEWAY_DATA = "+/data"
 FEEDBACK_MANPOWER = "data/feedback/manpower"
 FEEDBACK_PRODUCT = "data/feedback/product"
 CMD_MACHINE = "machine_01/cmd"
+# Statistik antrean dispatcher (retained, untuk monitoring)
+STATUS_DISPATCHER = "status/barcode/dispatcher"
+# Event untuk live dashboard (diteruskan API ke browser lewat /stream)
+EVENT_MANPOWER = "events/manpower"
+EVENT_PRODUCT = "events/product"
 
 EMG_TAG_NAME = "WISE4050:PB_EMG"
+STATUS_TAG_NAME = "Machine_Status"
+# Tag yang nilai terakhirnya dipakai untuk validasi scan (disimpan di memori)
+INTERLOCK_TAGS = [EMG_TAG_NAME]
+# machine_id untuk data/machine yang payload-nya tidak membawa machine_id
+DEFAULT_MACHINE_ID = os.getenv("DEFAULT_MACHINE_ID", "machine_01")
+
+# DISPATCHER CONFIG
+# Batas antrean lane data mesin; jika penuh, pesan terlama dibuang (scan badge tidak pernah dibuang).
+# Machine_Status dan tag interlock (EMG) tidak pernah dibuang, lihat is_critical_machine_message.
+DISPATCH_MACHINE_QUEUE_MAX = int(os.getenv("DISPATCH_MACHINE_QUEUE_MAX", 5000))
+DISPATCH_GATEWAY_QUEUE_MAX = int(os.getenv("DISPATCH_GATEWAY_QUEUE_MAX", 5000))
+DISPATCH_STATS_INTERVAL = float(os.getenv("DISPATCH_STATS_INTERVAL", 60))
+# Jumlah worker scan; station yang sama selalu ke worker yang sama (urutan terjaga), station berbeda paralel
+DISPATCH_SCAN_WORKERS = int(os.getenv("DISPATCH_SCAN_WORKERS", 8))
+
+# ==============================
+# PRODUCT STATE QUERIES
+# ==============================
+# Insert log_product + upsert product_state dalam satu statement (jadi satu transaksi).
+# Dipakai oleh semua tempat yang menulis log_product (main.py dan api.py).
+# station / nik = sesi manpower yang men-scan (None untuk perubahan dari API).
+INSERT_LOG_PRODUCT_QUERY = """
+    WITH inserted AS (
+        INSERT INTO log_product (created_at, machine_name, name_product, action, name_manpower)
+        VALUES (NOW(), %(machine_name)s, %(name_product)s, %(action)s, %(name_manpower)s)
+        RETURNING id, created_at, machine_name, name_product, action, name_manpower
+    )
+    INSERT INTO product_state (machine_name, name_product, action, name_manpower, station, nik, log_id, updated_at)
+    SELECT machine_name, name_product, action, name_manpower, %(station)s, %(nik)s, id, created_at FROM inserted
+    ON CONFLICT (machine_name, name_product) DO UPDATE
+    SET action = EXCLUDED.action,
+        name_manpower = EXCLUDED.name_manpower,
+        station = EXCLUDED.station,
+        nik = EXCLUDED.nik,
+        log_id = EXCLUDED.log_id,
+        updated_at = EXCLUDED.updated_at
+"""
+
+# Logout: stop semua product yang aksi terakhirnya 'start' oleh sesi ini (station + nik),
+# bukan oleh nama manpower yang sama di station lain
+AUTO_STOP_PRODUCTS_QUERY = """
+    WITH active AS (
+        SELECT machine_name, name_product, name_manpower FROM product_state
+        WHERE station = %(station)s AND nik = %(nik)s AND action = 'start'
+        FOR UPDATE
+    ), stopped AS (
+        INSERT INTO log_product (created_at, machine_name, name_product, action, name_manpower)
+        SELECT NOW(), machine_name, name_product, 'stop', name_manpower FROM active
+        RETURNING id, created_at, machine_name, name_product, name_manpower
+    )
+    UPDATE product_state ps
+    SET action = 'stop', station = NULL, nik = NULL, log_id = s.id, updated_at = s.created_at
+    FROM stopped s
+    WHERE ps.machine_name = s.machine_name AND ps.name_product = s.name_product
+    RETURNING ps.machine_name, ps.name_product, ps.name_manpower
+"""
+
+# Aksi terakhir product (dikunci sampai transaksi scan selesai)
+LAST_PRODUCT_ACTION_QUERY = "SELECT action FROM product_state WHERE machine_name=%s AND name_product=%s FOR UPDATE"
+
+# Product terakhir yang di-scan di seluruh plant (state awal station lama)
+LAST_PRODUCT_QUERY = "SELECT machine_name, name_product, action, name_manpower FROM log_product ORDER BY created_at DESC LIMIT 1"
+
+# ==============================
+# MANPOWER SESSION QUERIES
+# ==============================
+# Sesi manpower yang sedang login di satu station (dikunci sampai transaksi scan selesai)
+ACTIVE_SESSION_QUERY = "SELECT nik, name FROM manpower_session WHERE station=%s FOR UPDATE"
+
+# Login: log + buka sesi dalam satu statement; tidak mengembalikan baris jika station sudah ada
+# sesi atau nik sedang login di tempat lain (login bersamaan ditolak oleh constraint unik)
+LOGIN_MANPOWER_QUERY = """
+    WITH logged AS (
+        INSERT INTO log_manpower (created_at, nik, name, status)
+        SELECT NOW(), %(nik)s, %(name)s, 'login'
+        WHERE NOT EXISTS (
+            SELECT 1 FROM manpower_session WHERE station = %(station)s OR nik = %(nik)s
+        )
+        RETURNING id, nik, name, created_at
+    )
+    INSERT INTO manpower_session (station, nik, name, log_id, started_at)
+    SELECT %(station)s, nik, name, id, created_at FROM logged
+    RETURNING nik
+"""
+
+# Logout: tutup sesi milik nik ini + log dalam satu statement
+LOGOUT_MANPOWER_QUERY = """
+    WITH ended AS (
+        DELETE FROM manpower_session
+        WHERE station = %(station)s AND nik = %(nik)s
+        RETURNING nik
+    )
+    INSERT INTO log_manpower (created_at, nik, name, status)
+    SELECT NOW(), nik, %(name)s, 'logout' FROM ended
+    RETURNING id
+"""
+
+# ==============================
+# MACHINE LOG QUERIES (data/machine)
+# ==============================
+INSERT_MACHINE_LOG_QUERY = """
+    INSERT INTO log_machine (created_at, machine_id, tag_name, tag_value)
+    VALUES (NOW(), %s, %s, %s)
+"""
+
+# Snapshot nilai terakhir, di transaksi yang sama dengan insert log_machine
+UPSERT_MACHINE_LATEST_QUERY = """
+    INSERT INTO log_machine_latest (machine_id, tag_name, tag_value, created_at)
+    VALUES (%s, %s, %s, NOW())
+    ON CONFLICT (machine_id, tag_name) DO UPDATE
+    SET tag_value = EXCLUDED.tag_value,
+        recorded_at = NULL,
+        created_at = EXCLUDED.created_at
+    WHERE log_machine_latest.created_at <= EXCLUDED.created_at
+"""
+
+# Catat transisi status hanya jika berbeda dari status terakhir
+INSERT_STATUS_EVENT_QUERY = """
+    INSERT INTO machine_status_event (machine_id, status, created_at)
+    SELECT %(machine_id)s, %(status)s, NOW()
+    WHERE %(status)s IS DISTINCT FROM (
+        SELECT status FROM machine_status_event
+        WHERE machine_id = %(machine_id)s
+        ORDER BY created_at DESC, id DESC
+        LIMIT 1
+    )
+"""
 
 # ==============================
 # DATABASE HELPERS
 # ==============================
+# Koneksi diambil dari pool db.py (close() = kembali ke pool), bukan connect baru per query
 @contextmanager
 def db_session():
-    conn = psycopg2.connect(**DB_CONFIG)
+    conn = pool.getconn()
     try:
         yield conn
     except Exception as e:
@@ -50,17 +185,39 @@ def db_session():
     finally:
         conn.close()
 
+@contextmanager
+def db_transaction():
+    """Satu transaksi di satu koneksi pool: commit jika blok selesai, rollback jika error."""
+    with db_session() as conn:
+        try:
+            with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                yield cur
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
 def fetch_one(query, params=None):
     with db_session() as conn:
         with conn.cursor(cursor_factory=RealDictCursor) as cur:
             cur.execute(query, params)
             return cur.fetchone()
 
-def execute_query(query, params=None):
-    with db_session() as conn:
-        with conn.cursor() as cur:
-            cur.execute(query, params)
-            conn.commit()
+CRITICAL_MACHINE_TAGS = (STATUS_TAG_NAME, *INTERLOCK_TAGS)
+CRITICAL_MACHINE_TAG_BYTES = tuple(tag.encode() for tag in CRITICAL_MACHINE_TAGS)
+
+def is_critical_machine_message(msg):
+    """
+    Pesan data/machine yang tidak boleh dibuang lane saat penuh: status mesin dan tag interlock.
+    Hanya dipanggil saat lane penuh; payload tanpa nama tag tersebut tidak perlu di-parse.
+    """
+    if not any(tag in msg.payload for tag in CRITICAL_MACHINE_TAG_BYTES):
+        return False
+    try:
+        data = json.loads(msg.payload.decode())
+    except ValueError:
+        return False
+    return isinstance(data, dict) and data.get("tag_name") in CRITICAL_MACHINE_TAGS
 
 def wait_for_db():
     logging.info("⏳ Memeriksa koneksi Database...")
@@ -79,152 +236,193 @@ def wait_for_db():
 # ==============================
 class BarcodeSystem:
     def __init__(self):
-        self.last_login = None  # Cache last manpower login state
-        self.last_product = None  # Cache last product state
+        # State per station (lock + product terakhir); topic lama = DEFAULT_STATION
         self.client = None
         self.mqtt_connected = False
+        # Master data manpower/product/devices (invalidasi via NOTIFY) dan nilai terakhir tag interlock (dari MQTT)
+        self.master_data = MasterDataCache()
+        # Station baru hanya dibuat untuk mesin yang ada di master devices
+        self.stations = StationRegistry(CMD_MACHINE, FEEDBACK_MANPOWER, FEEDBACK_PRODUCT,
+                                        is_known=self.master_data.device_exists)
+        self.interlocks = TagValueCache(INTERLOCK_TAGS)
+        # Pesan MQTT diproses di worker per lane, bukan di thread network paho.
+        # manpower & product satu lane per station (keduanya mengubah state login/product station itu).
+        self.dispatcher = TopicDispatcher()
+        self.dispatcher.add_lane("scan", self.process_message,
+                                 [TOPIC_MANPOWER, TOPIC_PRODUCT, TOPIC_STATION_MANPOWER, TOPIC_STATION_PRODUCT],
+                                 workers=DISPATCH_SCAN_WORKERS, key=station_from_topic)
+        self.dispatcher.add_lane("machine", self.process_message, [TOPIC_MACHINE], DISPATCH_MACHINE_QUEUE_MAX,
+                                 keep=is_critical_machine_message)
+        self.dispatcher.add_lane("gateway", self.process_gateway_message, [TOPIC_GATEWAY_DATA], DISPATCH_GATEWAY_QUEUE_MAX)
+
+    def publish_event(self, topic, event):
+        if not self.client or not self.mqtt_connected:
+            return
+        event.setdefault("created_at", datetime.now(timezone.utc).replace(tzinfo=None).isoformat())
+        try:
+            self.client.publish(topic, json.dumps(event), qos=1)
+        except Exception as e:
+            logging.warning(f"Gagal publish event {topic}: {e}")
+
+    def active_session(self, cur, station=DEFAULT_STATION):
+        """Sesi manpower yang sedang login di station ini (dikunci sampai transaksi scan selesai)."""
+        cur.execute(ACTIVE_SESSION_QUERY, (station,))
+        return cur.fetchone()
 
     def update_cached_states(self):
         try:
-            # Update last login
-            self.last_login = fetch_one("SELECT nik, name, status FROM log_manpower ORDER BY created_at DESC LIMIT 1")
-
-            # Update last product
-            self.last_product = fetch_one("SELECT machine_name, name_product, action, name_manpower FROM log_product ORDER BY created_at DESC LIMIT 1")
+            # Update last product (station lama)
+            self.stations.get(DEFAULT_STATION).last_product = fetch_one(LAST_PRODUCT_QUERY)
         except Exception as e:
             logging.error(f"Error updating cached states: {e}")
 
     # ==============================
     # MANPOWER LOGIC
     # ==============================
-    def handle_manpower(self, data):
+    def handle_manpower(self, data, station=DEFAULT_STATION):
+        state = self.stations.get(station)
+        # Hanya scan di station yang sama yang saling menunggu
+        with state.lock:
+            return self._handle_manpower(state, data)
+
+    def _handle_manpower(self, state, data):
+        # Semua cek dan tulis satu scan dalam satu transaksi; event MQTT baru dikirim setelah commit
+        events = []
+        try:
+            with db_transaction() as cur:
+                result = self._manpower_scan(cur, state, data, events)
+        except psycopg2.IntegrityError as e:
+            # Login bersamaan untuk station / nik yang sama ditolak constraint unik manpower_session
+            logging.warning(f"❌ Manpower: Login failed - sesi bentrok ({e})")
+            return False, "Login", None
+        for topic, event in events:
+            self.publish_event(topic, event)
+        return result
+
+    def _manpower_scan(self, cur, state, data, events):
         nik = data.get("nik")
         name = data.get("name")
 
+        session = self.active_session(cur, state.station)
+        attempted_action = "Login" if not session else "Logout"
+
         if not nik or not name:
             logging.warning("Manpower: Field nik / name kosong")
-            return False, "Login" if not self.last_login or self.last_login["status"] == "logout" else "Logout", None
+            return False, attempted_action, None
 
-        row = fetch_one("SELECT nik, name FROM manpower WHERE nik=%s", (nik,))
-        if not row or row["name"].lower() != name.lower():
+        registered_name = self.master_data.manpower_name(nik, cur)
+        if not registered_name or registered_name.lower() != name.lower():
             logging.warning(f"Manpower: NIK {nik} tidak valid atau nama tidak cocok")
-            return False, "Login" if not self.last_login or self.last_login["status"] == "logout" else "Logout", None
-
-        emg = fetch_one(f"SELECT tag_value FROM log_machine WHERE tag_name='{EMG_TAG_NAME}' ORDER BY created_at DESC LIMIT 1")
-        machine_status = int(emg["tag_value"]) if emg else 0
+            return False, attempted_action, None
 
-        last_login = self.last_login
-        last_product = self.last_product  
+        emg = self.interlocks.get(EMG_TAG_NAME, state.machine_id, cur)
+        machine_status = int(emg) if emg else 0
 
-        attempted_action = "Login" if not last_login or last_login["status"] == "logout" else "Logout"
+        logging.info(f"Manpower: {attempted_action} attempted by {name} (NIK: {nik}) at station {state.station}")
 
-        logging.info(f"Manpower: {attempted_action} attempted by {name} (NIK: {nik})")
-
-        if not last_login or last_login["status"] == "logout":
+        if not session:
+            cur.execute(LOGIN_MANPOWER_QUERY, {"station": state.station, "nik": nik, "name": name})
+            if not cur.fetchone():
+                # Station sudah diisi sesi lain, atau nik ini sedang login di tempat lain
+                logging.warning(f"❌ Manpower: Login failed for {name} (NIK: {nik}) - sudah ada sesi aktif")
+                return False, attempted_action, None
             logging.debug(f"DEBUG Login successfully Name : {name}, NIK : {nik}")
             logging.info(f"✅ Manpower: {name} (NIK: {nik}) logged in successfully")
-            execute_query("""
-                INSERT INTO log_manpower (created_at, nik, name, status)
-                VALUES (NOW(), %s, %s, 'login')
-            """, (nik, name))
-            self.last_login = {"nik": nik, "name": name, "status": "login"}  # Update cache
+            events.append((EVENT_MANPOWER, {"type": "manpower", "station": state.station, "nik": nik, "name": name, "status": "login"}))
             return True, attempted_action, attempted_action
-        
-        if last_login["status"] == "login":
-            if machine_status != 1:
-                logging.warning(f"❌ Manpower: Logout failed for {name} (NIK: {nik}) - EMG tidak aktif")
-                return False, attempted_action, None
-            if str(last_login["nik"]) != str(nik):
-                logging.warning(f"❌ Manpower: Logout failed - {last_login['name']} sedang login, bukan {name}")
-                return False, attempted_action, None
 
-            status_msg = attempted_action
-            
-            # LOGIKA BARU: MANPOWER LOGOUT, PRODUCT AUTO STOP
-            if last_login["status"] == "login":
-                if machine_status != 1:
-                    logging.warning(f"❌ Manpower: Logout failed for {name} (NIK: {nik}) - EMG tidak aktif")
-                    return False, attempted_action, None
-                if str(last_login["nik"]) != str(nik):
-                    logging.warning(f"❌ Manpower: Logout failed - {last_login['name']} sedang login, bukan {name}")
-                    return False, attempted_action, None
-
-                # --- LOGIKA BARU: AUTO-STOP SEMUA PRODUK YANG MASIH 'START' ---
-                # Query ini akan langsung memasukkan status 'stop' untuk semua produk yang 
-                # status terakhirnya adalah 'start' milik manpower ini.
-                execute_query("""
-                    INSERT INTO log_product (created_at, machine_name, name_product, action, name_manpower)
-                    SELECT NOW(), lp.machine_name, lp.name_product, 'stop', lp.name_manpower
-                    FROM log_product lp
-                    WHERE lp.name_manpower = %s 
-                    AND lp.action = 'start'
-                    AND NOT EXISTS (
-                        SELECT 1 FROM log_product lp2 
-                        WHERE lp2.machine_name = lp.machine_name 
-                        AND lp2.name_product = lp.name_product 
-                        AND lp2.created_at > lp.created_at
-                    )
-                """, (name,))
-
-            status_msg = attempted_action + " & All Active Products Auto-Stopped"
-            self.last_product = None
-
-            logging.debug(f"DEBUG Logout successfully Name : {name}, NIK : {nik}")
-            logging.info(f"✅ Manpower: {name} (NIK: {nik}) logged out successfully")
-            execute_query("""
-                INSERT INTO log_manpower (created_at, nik, name, status)
-                VALUES (NOW(), %s, %s, 'logout')
-            """, (nik, name))
-            self.last_login = {"nik": nik, "name": name, "status": "logout"}  
-
-            return True, attempted_action, status_msg
-
-        logging.warning("Manpower: Status logic tidak dikenal")
-        return False, attempted_action, None
+        if machine_status != 1:
+            logging.warning(f"❌ Manpower: Logout failed for {name} (NIK: {nik}) - EMG tidak aktif")
+            return False, attempted_action, None
+        if str(session["nik"]) != str(nik):
+            logging.warning(f"❌ Manpower: Logout failed - {session['name']} sedang login, bukan {name}")
+            return False, attempted_action, None
+
+        # LOGIKA BARU: MANPOWER LOGOUT, PRODUCT AUTO STOP
+        # --- LOGIKA BARU: AUTO-STOP SEMUA PRODUK YANG MASIH 'START' ---
+        # Query ini akan langsung memasukkan status 'stop' untuk semua produk yang 
+        # status terakhirnya adalah 'start' milik sesi manpower ini di station ini.
+        cur.execute(AUTO_STOP_PRODUCTS_QUERY, {"station": state.station, "nik": str(session["nik"])})
+        for row in cur.fetchall():
+            events.append((EVENT_PRODUCT, {
+                "type": "product",
+                "machine_id": row["machine_name"],
+                "name_product": row["name_product"],
+                "action": "stop",
+                "name_manpower": row["name_manpower"],
+            }))
+
+        status_msg = attempted_action + " & All Active Products Auto-Stopped"
+        state.last_product = None
+
+        logging.debug(f"DEBUG Logout successfully Name : {name}, NIK : {nik}")
+        logging.info(f"✅ Manpower: {name} (NIK: {nik}) logged out successfully")
+        cur.execute(LOGOUT_MANPOWER_QUERY, {"station": state.station, "nik": nik, "name": name})
+        events.append((EVENT_MANPOWER, {"type": "manpower", "station": state.station, "nik": nik, "name": name, "status": "logout"}))
+
+        return True, attempted_action, status_msg
 
     # ==============================
     # PRODUCT LOGIC
     # ==============================
-    def handle_product(self, data):
-        machine = data.get("machine_name")
+    def handle_product(self, data, station=DEFAULT_STATION):
+        state = self.stations.get(station)
+        with state.lock:
+            return self._handle_product(state, data)
+
+    def _handle_product(self, state, data):
+        events = []
+        with db_transaction() as cur:
+            result = self._product_scan(cur, state, data, events)
+        for topic, event in events:
+            self.publish_event(topic, event)
+        return result
+
+    def _product_scan(self, cur, state, data, events):
+        # Di topic station, machine_name boleh kosong (= mesin station itu); mesin lain ditolak
+        machine = data.get("machine_name") or state.machine_id
         product = data.get("name_product")
 
         if not machine or not product:
             logging.warning("Product: Data product tidak lengkap")
             return False, "Data product tidak lengkap"
 
-        row = fetch_one("SELECT name_product FROM product WHERE machine_name=%s AND name_product=%s", (machine, product))
-        if not row or row["name_product"].lower() != product.lower():
+        if state.machine_id and machine != state.machine_id:
+            logging.warning(f"Product: Station {state.station} tidak boleh scan product mesin '{machine}'")
+            return False, "Product bukan untuk mesin station ini"
+
+        registered_product = self.master_data.product_name(machine, product, cur)
+        if not registered_product or registered_product.lower() != product.lower():
             logging.warning(f"Product: Produk '{product}' Product gagal '{machine}'")
             return False, "Product gagal"
         
-        manpower = fetch_one("""
-            SELECT nik, name FROM log_manpower lm
-            WHERE lm.status='login'
-            AND NOT EXISTS (
-                SELECT 1 FROM log_manpower lo
-                WHERE lo.nik=lm.nik AND lo.status='logout' AND lo.created_at>lm.created_at
-            )
-            ORDER BY lm.created_at DESC LIMIT 1
-        """)
+        manpower = self.active_session(cur, state.station)
 
         if not manpower:
             logging.warning("Product: Tidak ada manpower login")
             return False, "Tidak ada manpower login"
         
         # LOGIKA BARU: MENGECEK STATUS DAN NAMA PRODUCT
-        last_product = fetch_one("""SELECT action FROM log_product WHERE machine_name=%s AND name_product=%s ORDER BY created_at DESC LIMIT 1""", (machine, product))
+        cur.execute(LAST_PRODUCT_ACTION_QUERY, (machine, product))
+        last_product = cur.fetchone()
 
         action = "start" if not last_product or last_product["action"].lower() == "stop" else "stop"
 
         logging.debug(f"DEBUG Product {action} successfully Name : {manpower['name']}, NIK : {manpower['nik']}")
         logging.info(f"✅ Product: {action.capitalize()} '{product}' on machine '{machine}' by {manpower['name']} (NIK: {manpower['nik']})")
-        execute_query("""
-            INSERT INTO log_product (created_at, machine_name, name_product, action, name_manpower)
-            VALUES (NOW(), %s, %s, %s, %s)
-        """, (machine, product, action, manpower["name"]))
-
-        self.last_product = {"machine_name": machine, "name_product": product, "action": action, "name_manpower": manpower["name"]}
+        cur.execute(INSERT_LOG_PRODUCT_QUERY, {
+            "machine_name": machine, "name_product": product, "action": action, "name_manpower": manpower["name"],
+            "station": state.station, "nik": str(manpower["nik"]),
+        })
+
+        state.last_product = {"machine_name": machine, "name_product": product, "action": action, "name_manpower": manpower["name"]}
+        events.append((EVENT_PRODUCT, {
+            "type": "product",
+            "machine_id": machine,
+            "name_product": product,
+            "action": action,
+            "name_manpower": manpower["name"],
+        }))
 
         return True, f"Product valid, action: {action}, manpower: {manpower['name']}"
 
@@ -232,14 +430,24 @@ class BarcodeSystem:
     # MACHINE LOGIC (LOG DATA)
     # ==============================
     def handle_machine(self, data):
+        machine_id = data.get("machine_id") or DEFAULT_MACHINE_ID
         tag_name = data.get("tag_name")
-        tag_value = data.get("tag_value")
+        # Format sama dengan ingest machine_data (bool -> "true"/"false")
+        tag_value = format_tag_value(data.get("tag_value"))
         if tag_name and tag_value is not None:
-            execute_query("""
-                INSERT INTO log_machine (created_at, tag_name, tag_value)
-                VALUES (NOW(), %s, %s)
-            """, (tag_name, tag_value))
-            logging.info(f"Machine: Logged data - {tag_name} = {tag_value}")
+            with db_session() as conn:
+                with conn.cursor() as cur:
+                    cur.execute(INSERT_MACHINE_LOG_QUERY, (machine_id, tag_name, tag_value))
+                    cur.execute(UPSERT_MACHINE_LATEST_QUERY, (machine_id, tag_name, tag_value))
+                    if tag_name == STATUS_TAG_NAME:
+                        cur.execute(INSERT_STATUS_EVENT_QUERY, {"machine_id": machine_id, "status": tag_value})
+                conn.commit()
+            self.interlocks.update(tag_name, tag_value, datetime.now(timezone.utc).replace(tzinfo=None), machine_id)
+            logging.info(f"Machine: Logged data - {machine_id} {tag_name} = {tag_value}")
+
+    def handle_gateway_data(self, machine_id, payload):
+        # Hanya update cache; penyimpanan ke DB dilakukan service machine_data
+        self.interlocks.update_from_gateway(payload, datetime.now(timezone.utc).replace(tzinfo=None), machine_id)
 
     # ==============================
     # MQTT CALLBACKS
@@ -253,8 +461,17 @@ class BarcodeSystem:
             client.subscribe([
                 (TOPIC_MANPOWER, 1),
                 (TOPIC_PRODUCT, 1),
-                (TOPIC_MACHINE, 1)
+                (TOPIC_STATION_MANPOWER, 1),
+                (TOPIC_STATION_PRODUCT, 1),
+                (TOPIC_MACHINE, 1),
+                (TOPIC_GATEWAY_DATA, 0)
             ])
+            # Nilai yang terlewat selama disconnect diambil ulang dari DB
+            try:
+                self.interlocks.seed()
+                self.interlocks.live = True
+            except Exception as e:
+                logging.error(f"Gagal memuat nilai tag interlock: {e}")
         else:
             logging.error(f"Connection failed with code {rc}")
             self.mqtt_connected = False
@@ -262,8 +479,24 @@ class BarcodeSystem:
     def on_disconnect(self, client, userdata, rc):
         logging.warning(f"MQTT Disconnected with code {rc}")
         self.mqtt_connected = False
+        self.interlocks.live = False
 
     def on_message(self, client, userdata, msg):
+        # Jalan di thread network paho: hanya antrekan, pemrosesan di worker dispatcher
+        if not self.dispatcher.dispatch(client, msg):
+            logging.warning(f"Tidak ada handler untuk topic {msg.topic}")
+
+    def process_gateway_message(self, client, msg):
+        # Data gateway datang terus-menerus; jangan di-log per pesan
+        try:
+            payload = json.loads(msg.payload.decode())
+        except ValueError:
+            return
+        if isinstance(payload, dict):
+            self.handle_gateway_data(msg.topic.split("/", 1)[0], payload)
+
+    def process_message(self, client, msg):
+        started = time.perf_counter()
         logging.info(f"📩 Received message on {msg.topic}")
 
         try:
@@ -272,56 +505,73 @@ class BarcodeSystem:
             logging.error("Payload bukan JSON")
             return
 
-        handlers = {
-            TOPIC_MANPOWER: self.handle_manpower,
-            TOPIC_PRODUCT: self.handle_product,
-            TOPIC_MACHINE: self.handle_machine
-        }
-
-        if msg.topic in handlers:
-            if msg.topic == TOPIC_MACHINE:
-                handlers[msg.topic](payload)
-                return  
-
-
-            if msg.topic == TOPIC_MANPOWER:
-                success, message, status_msg = handlers[msg.topic](payload)
-                feedback_topic = FEEDBACK_MANPOWER
-                if message == "Login":
-                    msg_text = "Login Berhasil" if success else "Login Gagal"
-                elif message == "Logout":
-                    msg_text = "Logout Berhasil" if success else "Logout Gagal"
-                else:
-                    msg_text = "Unknown"
-                feedback_payload = {
-                    "nik": payload.get("nik"),
-                    "name": payload.get("name"),
-                    "success": success,
-                    "message": msg_text
-                }
-                if success:
-                    val = 1 if message == "Login" else 0
-                    client.publish(CMD_MACHINE, json.dumps({"w": [{"tag": "ManPower_Validation", "value": val}]}), qos=1)
-                    if status_msg and "Auto-Stop" in status_msg:
-                        client.publish(CMD_MACHINE, json.dumps({"w": [{"tag": "Product_Validation", "value": 0}]}), qos=1)
-                        logging.info("⚠️ Command sent: Force Stop Product (Auto-Stop)")
-            elif msg.topic == TOPIC_PRODUCT:
-                success, message = handlers[msg.topic](payload)
-                feedback_topic = FEEDBACK_PRODUCT
-                product_info = self.last_product
-                feedback_payload = {
-                    "machine_name": product_info["machine_name"] if product_info else None,
-                    "name_product": product_info["name_product"] if product_info else None,
-                    "success": success,
-                    "message": message
-                }
-                if success:
-                    val_prod = 1 if "action: start" in message.lower() else 0
-                    client.publish(CMD_MACHINE, json.dumps({"w": [{"tag": "Product_Validation", "value": val_prod}]}), qos=1)
-
-            # Publish feedback
-            client.publish(feedback_topic, json.dumps(feedback_payload), qos=1)
-            logging.info(f"Feedback sent to {feedback_topic}: {feedback_payload['message']}")
+        if msg.topic == TOPIC_MACHINE:
+            self.handle_machine(payload)
+            return
+
+        station = station_from_topic(msg.topic)
+        state = self.stations.get(station)
+        if state is None:
+            # Station tidak dikenal: tidak ada feedback / command yang dikirim
+            return
+        cmd_topic = state.cmd_topic
+
+        if msg.topic == TOPIC_MANPOWER or mqtt.topic_matches_sub(TOPIC_STATION_MANPOWER, msg.topic):
+            success, message, status_msg = self.handle_manpower(payload, station)
+            feedback_topic = state.feedback_manpower
+            if message == "Login":
+                msg_text = "Login Berhasil" if success else "Login Gagal"
+            elif message == "Logout":
+                msg_text = "Logout Berhasil" if success else "Logout Gagal"
+            else:
+                msg_text = "Unknown"
+            feedback_payload = {
+                "nik": payload.get("nik"),
+                "name": payload.get("name"),
+                "success": success,
+                "message": msg_text
+            }
+            if success:
+                val = 1 if message == "Login" else 0
+                client.publish(cmd_topic, json.dumps({"w": [{"tag": "ManPower_Validation", "value": val}]}), qos=1)
+                if status_msg and "Auto-Stop" in status_msg:
+                    client.publish(cmd_topic, json.dumps({"w": [{"tag": "Product_Validation", "value": 0}]}), qos=1)
+                    logging.info(f"⚠️ Command sent: Force Stop Product (Auto-Stop) ke {cmd_topic}")
+        elif msg.topic == TOPIC_PRODUCT or mqtt.topic_matches_sub(TOPIC_STATION_PRODUCT, msg.topic):
+            success, message = self.handle_product(payload, station)
+            feedback_topic = state.feedback_product
+            product_info = state.last_product
+            feedback_payload = {
+                "machine_name": product_info["machine_name"] if product_info else None,
+                "name_product": product_info["name_product"] if product_info else None,
+                "success": success,
+                "message": message
+            }
+            if success:
+                val_prod = 1 if "action: start" in message.lower() else 0
+                client.publish(cmd_topic, json.dumps({"w": [{"tag": "Product_Validation", "value": val_prod}]}), qos=1)
+        else:
+            return
+
+        # Publish feedback
+        client.publish(feedback_topic, json.dumps(feedback_payload), qos=1)
+        logging.info(f"Feedback sent to {feedback_topic}: {feedback_payload['message']} "
+                     f"({(time.perf_counter() - started) * 1000:.1f} ms)")
+
+    def report_dispatcher_stats(self):
+        while True:
+            time.sleep(DISPATCH_STATS_INTERVAL)
+            stats = self.dispatcher.stats()
+            logging.info("📊 Dispatcher: " + " | ".join(
+                f"{name}: {lane['depth']} antre, {lane['processed']} diproses, "
+                f"wait max {lane['max_wait_ms']:.0f} ms, handle avg/max {lane['avg_handle_ms']:.1f}/{lane['max_handle_ms']:.0f} ms" + (f", {lane['dropped']} dibuang" if lane["dropped"] else "")
+                for name, lane in stats.items()
+            ))
+            if self.client and self.mqtt_connected:
+                try:
+                    self.client.publish(STATUS_DISPATCHER, json.dumps(stats), qos=0, retain=True)
+                except Exception as e:
+                    logging.warning(f"Gagal publish statistik dispatcher: {e}")
 
     def reconnect_mqtt(self):
         while True:
@@ -337,6 +587,7 @@ class BarcodeSystem:
     def run(self):
         wait_for_db()
         self.update_cached_states()
+        threading.Thread(target=self.master_data.listen_forever, daemon=True).start()
         
         client = mqtt.Client()
         client.on_connect = self.on_connect
@@ -353,12 +604,20 @@ class BarcodeSystem:
                 logging.warning(f"MQTT belum siap, mencoba lagi dalam 5 detik... Error: {e}")
                 time.sleep(5)
 
+        # Worker dispatcher harus jalan sebelum pesan pertama masuk
+        self.dispatcher.start()
+
         # Start MQTT loop in a separate thread
         client.loop_start()
         
         # Start reconnection thread
         threading.Thread(target=self.reconnect_mqtt, daemon=True).start()
+
+        # Partisi harian log_machine (buat ke depan + retensi) dan refresh rollup 1m/1h
+        threading.Thread(target=run_maintenance_loop, daemon=True).start()
         
+        threading.Thread(target=self.report_dispatcher_stats, daemon=True).start()
+
         # Main infinite loop to keep the server running
         while True:
             try:
@@ -0,0 +1,75 @@
+import os
+import time
+import logging
+
+import psycopg2
+
+from db import DB_CONFIG
+
+# ==============================
+# MAINTENANCE CONFIG
+# ==============================
+# Jumlah hari ke depan yang partisi log_machine-nya disiapkan lebih dulu
+LOG_MACHINE_PARTITION_DAYS_AHEAD = int(os.getenv("LOG_MACHINE_PARTITION_DAYS_AHEAD", 7))
+# Partisi harian yang lebih tua dari ini akan di-DROP (0 = simpan selamanya)
+LOG_MACHINE_RETENTION_DAYS = int(os.getenv("LOG_MACHINE_RETENTION_DAYS", 0))
+MAINTENANCE_INTERVAL_SECONDS = float(os.getenv("MAINTENANCE_INTERVAL_SECONDS", 3600))
+# Rollup 1m/1h log_machine di-refresh lebih sering dari maintenance partisi
+ROLLUP_REFRESH_SECONDS = float(os.getenv("ROLLUP_REFRESH_SECONDS", 60))
+ROLLUP_BATCH_ROWS = int(os.getenv("ROLLUP_BATCH_ROWS", 500000))
+
+
+def maintain_log_machine_partitions():
+    """Buat partisi harian yang akan datang dan hapus partisi di luar retensi."""
+    conn = psycopg2.connect(**DB_CONFIG)
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT ensure_log_machine_partitions(%s)", (LOG_MACHINE_PARTITION_DAYS_AHEAD,))
+            created = cur.fetchone()[0]
+            cur.execute("SELECT drop_expired_log_machine_partitions(%s)", (LOG_MACHINE_RETENTION_DAYS,))
+            dropped = cur.fetchone()[0]
+        conn.commit()
+        # RAISE WARNING dari fungsi partisi (hari yang gagal dibuat / dipindah dari DEFAULT)
+        for notice in conn.notices:
+            logging.warning(f"🗂️ {notice.strip()}")
+    finally:
+        conn.close()
+    if created or dropped:
+        logging.info(f"🗂️ log_machine: {created} partisi dibuat, {dropped} partisi dihapus")
+    return created, dropped
+
+
+def refresh_log_machine_rollups():
+    """Masukkan baris log_machine baru ke rollup 1m/1h; diulang per batch sampai tidak ada sisa."""
+    conn = psycopg2.connect(**DB_CONFIG)
+    total = 0
+    try:
+        while True:
+            with conn.cursor() as cur:
+                cur.execute("SELECT refresh_log_machine_rollups(%s)", (ROLLUP_BATCH_ROWS,))
+                processed = cur.fetchone()[0]
+            conn.commit()
+            total += processed
+            if processed < ROLLUP_BATCH_ROWS:
+                break
+    finally:
+        conn.close()
+    if total >= ROLLUP_BATCH_ROWS:
+        logging.info(f"📊 Rollup log_machine: {total} baris diproses")
+    return total
+
+
+def run_maintenance_loop():
+    next_partition_run = 0.0
+    while True:
+        if time.monotonic() >= next_partition_run:
+            try:
+                maintain_log_machine_partitions()
+            except Exception as e:
+                logging.error(f"Maintenance log_machine gagal: {e}")
+            next_partition_run = time.monotonic() + MAINTENANCE_INTERVAL_SECONDS
+        try:
+            refresh_log_machine_rollups()
+        except Exception as e:
+            logging.error(f"Refresh rollup log_machine gagal: {e}")
+        time.sleep(ROLLUP_REFRESH_SECONDS)
@@ -0,0 +1,165 @@
+"""
+Runner migrasi skema database.
+
+File migrasi ada di folder migrations/ dengan nama NNNN_deskripsi.sql dan
+dijalankan berurutan sesuai nomor versi. Setiap file dijalankan dalam satu
+transaksi dan dicatat di tabel schema_migrations, jadi file yang sudah pernah
+dijalankan tidak akan dijalankan lagi. File migrasi ditulis idempotent
+(IF NOT EXISTS / CREATE OR REPLACE) supaya aman untuk database yang skemanya
+sudah sebagian dibuat oleh init.sql versi lama.
+
+Contoh (dari folder backend):
+    python migrate.py                # jalankan migrasi yang belum diterapkan
+    python migrate.py --status       # tampilkan status tiap migrasi
+    python migrate.py --target 0001  # hanya sampai versi 0001
+
+Commit lama (sebelum migrate.py ada) yang sudah memakai tabel baru hanya menambahkannya ke
+init.sql, jadi database yang sudah ada tidak ikut berubah. Saat menjalankan / bisect commit
+seperti itu, terapkan dulu migrasi yang sesuai dari checkout yang lebih baru:
+    log_machine_latest (/machine/logs dari tabel nilai terakhir)   --target 0001
+    machine_status_event (transisi status di /machine/status)      --target 0002
+"""
+import os
+import re
+import sys
+import time
+import hashlib
+import argparse
+import logging
+
+import psycopg2
+
+from db import DB_CONFIG
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations")
+MIGRATION_FILE_RE = re.compile(r"^(\d{4})_([\w-]+)\.sql$")
+# Advisory lock supaya dua proses tidak menjalankan migrasi bersamaan
+MIGRATION_LOCK_ID = 72310010
+
+CREATE_MIGRATIONS_TABLE = """
+    CREATE TABLE IF NOT EXISTS schema_migrations (
+        version VARCHAR(10) PRIMARY KEY,
+        name VARCHAR(200) NOT NULL,
+        checksum VARCHAR(64) NOT NULL,
+        applied_at TIMESTAMP NOT NULL DEFAULT NOW()
+    )
+"""
+
+
+class Migration:
+    def __init__(self, version, name, path):
+        self.version = version
+        self.name = name
+        self.path = path
+        with open(path, encoding="utf-8") as f:
+            self.sql = f.read()
+        self.checksum = hashlib.sha256(self.sql.encode("utf-8")).hexdigest()
+
+
+def discover_migrations(directory=MIGRATIONS_DIR):
+    migrations = []
+    for filename in sorted(os.listdir(directory)):
+        match = MIGRATION_FILE_RE.match(filename)
+        if match:
+            migrations.append(Migration(match.group(1), match.group(2), os.path.join(directory, filename)))
+    versions = [m.version for m in migrations]
+    if len(versions) != len(set(versions)):
+        raise RuntimeError(f"Nomor versi migrasi duplikat di {directory}")
+    return migrations
+
+
+def applied_migrations(conn):
+    with conn.cursor() as cur:
+        cur.execute(CREATE_MIGRATIONS_TABLE)
+        cur.execute("SELECT version, checksum FROM schema_migrations")
+        rows = dict(cur.fetchall())
+    conn.commit()
+    return rows
+
+
+def migrate(conn, migrations=None, target=None):
+    """
+    Terapkan semua migrasi yang belum tercatat (sampai versi `target` jika diisi).
+    Mengembalikan list versi yang diterapkan.
+    """
+    migrations = discover_migrations() if migrations is None else migrations
+    if target is not None:
+        migrations = [m for m in migrations if m.version <= target]
+    applied = []
+    with conn.cursor() as cur:
+        cur.execute("SELECT pg_advisory_lock(%s)", (MIGRATION_LOCK_ID,))
+    try:
+        done = applied_migrations(conn)
+        for migration in migrations:
+            if migration.version in done:
+                if done[migration.version] != migration.checksum:
+                    logging.warning(f"⚠️ Migrasi {migration.version}_{migration.name} berubah setelah diterapkan")
+                continue
+            logging.info(f"⏳ Menerapkan migrasi {migration.version}_{migration.name}...")
+            started = time.monotonic()
+            try:
+                with conn.cursor() as cur:
+                    cur.execute(migration.sql)
+                    cur.execute(
+                        "INSERT INTO schema_migrations (version, name, checksum) VALUES (%s, %s, %s)",
+                        (migration.version, migration.name, migration.checksum),
+                    )
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                logging.error(f"❌ Migrasi {migration.version}_{migration.name} gagal, di-rollback")
+                raise
+            logging.info(f"✅ Migrasi {migration.version}_{migration.name} selesai ({time.monotonic() - started:.1f}s)")
+            applied.append(migration.version)
+    finally:
+        with conn.cursor() as cur:
+            cur.execute("SELECT pg_advisory_unlock(%s)", (MIGRATION_LOCK_ID,))
+        conn.commit()
+    return applied
+
+
+def connect_with_retry(retries=60, delay=2):
+    for attempt in range(1, retries + 1):
+        try:
+            return psycopg2.connect(**DB_CONFIG)
+        except psycopg2.OperationalError as e:
+            if attempt == retries:
+                raise
+            logging.warning(f"Database belum siap ({e}), mencoba lagi dalam {delay} detik...")
+            time.sleep(delay)
+
+
+def print_status(conn):
+    done = applied_migrations(conn)
+    for migration in discover_migrations():
+        if migration.version not in done:
+            state = "pending"
+        elif done[migration.version] != migration.checksum:
+            state = "applied (changed)"
+        else:
+            state = "applied"
+        print(f"{migration.version}  {migration.name:<40} {state}")
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--status", action="store_true", help="Tampilkan status migrasi tanpa menerapkan")
+    parser.add_argument("--target", help="Terapkan migrasi hanya sampai versi ini (mis. 0001)")
+    args = parser.parse_args()
+    if args.target is not None and not re.fullmatch(r"\d{4}", args.target):
+        parser.error("--target harus nomor versi 4 digit, mis. 0001")
+
+    conn = connect_with_retry()
+    try:
+        if args.status:
+            print_status(conn)
+        else:
+            applied = migrate(conn, target=args.target)
+            logging.info(f"Skema up to date ({len(applied)} migrasi baru diterapkan)")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,18 @@
+-- Nilai terakhir per (machine_id, tag_name), di-upsert oleh proses ingest
+CREATE TABLE IF NOT EXISTS log_machine_latest (
+    machine_id VARCHAR(50) NOT NULL,
+    tag_name VARCHAR(100) NOT NULL,
+    tag_value VARCHAR(100),
+    recorded_at VARCHAR(100),
+    created_at TIMESTAMP DEFAULT NOW(),
+    PRIMARY KEY (machine_id, tag_name)
+);
+
+-- Backfill dari histori log_machine (baris lama bisa tanpa machine_id)
+INSERT INTO log_machine_latest (machine_id, tag_name, tag_value, recorded_at, created_at)
+SELECT DISTINCT ON (COALESCE(machine_id, 'machine_01'), tag_name)
+       COALESCE(machine_id, 'machine_01'), tag_name, tag_value, recorded_at, created_at
+FROM log_machine
+WHERE tag_name IS NOT NULL
+ORDER BY COALESCE(machine_id, 'machine_01'), tag_name, created_at DESC, id DESC
+ON CONFLICT (machine_id, tag_name) DO NOTHING;
@@ -0,0 +1,23 @@
+-- Transisi status mesin (hanya baris saat Machine_Status berubah), diisi oleh proses ingest
+CREATE TABLE IF NOT EXISTS machine_status_event (
+    id SERIAL PRIMARY KEY,
+    machine_id VARCHAR(50) NOT NULL,
+    created_at TIMESTAMP NOT NULL DEFAULT NOW(),
+    status VARCHAR(100)
+);
+CREATE INDEX IF NOT EXISTS idx_machine_status_event_machine_time ON machine_status_event (machine_id, created_at);
+
+-- Backfill transisi dari histori log_machine, hanya jika tabel masih kosong
+INSERT INTO machine_status_event (machine_id, created_at, status)
+SELECT machine_id, created_at, tag_value
+FROM (
+    SELECT COALESCE(machine_id, 'machine_01') AS machine_id, created_at, tag_value,
+           LAG(tag_value) OVER (
+               PARTITION BY COALESCE(machine_id, 'machine_01')
+               ORDER BY created_at, id
+           ) AS prev_value
+    FROM log_machine
+    WHERE tag_name = 'Machine_Status' AND created_at IS NOT NULL
+) t
+WHERE prev_value IS DISTINCT FROM tag_value
+  AND NOT EXISTS (SELECT 1 FROM machine_status_event);
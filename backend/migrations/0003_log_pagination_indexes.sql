@@ -0,0 +1,6 @@
+-- Index untuk keyset pagination & filter log (ORDER BY created_at, id)
+CREATE INDEX IF NOT EXISTS idx_log_manpower_created ON log_manpower (created_at, id);
+CREATE INDEX IF NOT EXISTS idx_log_manpower_nik_created ON log_manpower (nik, created_at, id);
+CREATE INDEX IF NOT EXISTS idx_log_product_created ON log_product (created_at, id);
+CREATE INDEX IF NOT EXISTS idx_log_product_machine_created ON log_product (machine_name, created_at, id);
+CREATE INDEX IF NOT EXISTS idx_log_product_machine_product_created ON log_product (machine_name, name_product, created_at, id);
@@ -0,0 +1,109 @@
+-- log_machine dipartisi per hari (created_at, UTC). Partisi dibuat di depan oleh
+-- ensure_log_machine_partitions() dan dihapus sesuai retensi oleh
+-- drop_expired_log_machine_partitions(); keduanya dipanggil berkala oleh backend (maintenance.py).
+
+CREATE OR REPLACE FUNCTION create_log_machine_partition(d DATE)
+RETURNS BOOLEAN AS $$
+DECLARE
+    part_name TEXT := 'log_machine_' || to_char(d, 'YYYYMMDD');
+BEGIN
+    IF to_regclass(part_name) IS NOT NULL THEN
+        RETURN FALSE;
+    END IF;
+    EXECUTE format(
+        'CREATE TABLE %I PARTITION OF log_machine FOR VALUES FROM (%L) TO (%L)',
+        part_name, d, d + 1
+    );
+    RETURN TRUE;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION ensure_log_machine_partitions(days_ahead INT DEFAULT 7)
+RETURNS INT AS $$
+DECLARE
+    today DATE := (NOW() AT TIME ZONE 'UTC')::date;
+    d DATE;
+    created INT := 0;
+BEGIN
+    FOR d IN SELECT generate_series(today - 1, today + days_ahead, INTERVAL '1 day')::date LOOP
+        IF create_log_machine_partition(d) THEN
+            created := created + 1;
+        END IF;
+    END LOOP;
+    RETURN created;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION drop_expired_log_machine_partitions(retention_days INT)
+RETURNS INT AS $$
+DECLARE
+    cutoff DATE := (NOW() AT TIME ZONE 'UTC')::date - retention_days;
+    r RECORD;
+    dropped INT := 0;
+BEGIN
+    IF retention_days IS NULL OR retention_days <= 0 THEN
+        RETURN 0;
+    END IF;
+    FOR r IN
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'log_machine'::regclass
+          AND c.relname ~ '^log_machine_[0-9]{8}$'
+    LOOP
+        IF to_date(substring(r.relname FROM 13), 'YYYYMMDD') < cutoff THEN
+            EXECUTE format('DROP TABLE %I', r.relname);
+            dropped := dropped + 1;
+        END IF;
+    END LOOP;
+    RETURN dropped;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Konversi log_machine lama (tabel biasa) ke tabel partisi; data lama dipindah per hari
+DO $$
+DECLARE
+    d DATE;
+BEGIN
+    IF EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = 'log_machine'::regclass) THEN
+        RETURN;
+    END IF;
+
+    ALTER TABLE log_machine RENAME TO log_machine_unpartitioned;
+    ALTER INDEX log_machine_pkey RENAME TO log_machine_unpartitioned_pkey;
+    ALTER SEQUENCE log_machine_id_seq RENAME TO log_machine_unpartitioned_id_seq;
+
+    CREATE TABLE log_machine (
+        id BIGSERIAL,
+        created_at TIMESTAMP NOT NULL DEFAULT NOW(),
+        machine_id VARCHAR(50),
+        tag_name VARCHAR(100),
+        tag_value VARCHAR(100),
+        recorded_at VARCHAR(100),
+        PRIMARY KEY (id, created_at)
+    ) PARTITION BY RANGE (created_at);
+
+    -- Menampung baris di luar partisi harian yang ada (seharusnya selalu kosong)
+    CREATE TABLE log_machine_default PARTITION OF log_machine DEFAULT;
+
+    FOR d IN SELECT DISTINCT created_at::date FROM log_machine_unpartitioned WHERE created_at IS NOT NULL LOOP
+        PERFORM create_log_machine_partition(d);
+    END LOOP;
+
+    INSERT INTO log_machine (id, created_at, machine_id, tag_name, tag_value, recorded_at)
+    SELECT id, COALESCE(created_at, TIMESTAMP 'epoch'), machine_id, tag_name, tag_value, recorded_at
+    FROM log_machine_unpartitioned;
+
+    PERFORM setval(
+        pg_get_serial_sequence('log_machine', 'id'),
+        COALESCE((SELECT MAX(id) FROM log_machine), 0) + 1,
+        false
+    );
+
+    DROP TABLE log_machine_unpartitioned;
+END;
+$$;
+
+SELECT ensure_log_machine_partitions(7);
+
+CREATE INDEX IF NOT EXISTS idx_log_machine_machine_created ON log_machine (machine_id, created_at);
@@ -0,0 +1,12 @@
+-- Index untuk query yang dipanggil setiap scan / setiap request
+
+-- Histori tag per mesin (filter machine_id + tag_name, urut waktu)
+CREATE INDEX IF NOT EXISTS idx_log_machine_machine_tag_created ON log_machine (machine_id, tag_name, created_at);
+
+-- Auto-stop saat logout: cari produk yang masih 'start' milik manpower tertentu
+CREATE INDEX IF NOT EXISTS idx_log_product_manpower_start
+    ON log_product (name_manpower, machine_name, name_product, created_at)
+    WHERE action = 'start';
+
+-- Pembersihan token_blacklist saat /logout (blacklisted_at < NOW() - 7 hari)
+CREATE INDEX IF NOT EXISTS idx_token_blacklist_blacklisted_at ON token_blacklist (blacklisted_at);
@@ -0,0 +1,129 @@
+-- Rollup log_machine per menit dan per jam (count/min/max/sum/last per tag).
+-- Nilai non-numerik tetap dihitung di sample_count dan last_value, tapi tidak masuk min/max/sum.
+CREATE TABLE IF NOT EXISTS log_machine_rollup_1m (
+    machine_id VARCHAR(50) NOT NULL,
+    tag_name VARCHAR(100) NOT NULL,
+    bucket TIMESTAMP NOT NULL,
+    sample_count INT NOT NULL,
+    value_count INT NOT NULL,
+    value_min DOUBLE PRECISION,
+    value_max DOUBLE PRECISION,
+    value_sum DOUBLE PRECISION,
+    last_value VARCHAR(100),
+    last_at TIMESTAMP NOT NULL,
+    PRIMARY KEY (machine_id, tag_name, bucket)
+);
+
+CREATE TABLE IF NOT EXISTS log_machine_rollup_1h (
+    machine_id VARCHAR(50) NOT NULL,
+    tag_name VARCHAR(100) NOT NULL,
+    bucket TIMESTAMP NOT NULL,
+    sample_count INT NOT NULL,
+    value_count INT NOT NULL,
+    value_min DOUBLE PRECISION,
+    value_max DOUBLE PRECISION,
+    value_sum DOUBLE PRECISION,
+    last_value VARCHAR(100),
+    last_at TIMESTAMP NOT NULL,
+    PRIMARY KEY (machine_id, tag_name, bucket)
+);
+
+CREATE INDEX IF NOT EXISTS idx_log_machine_rollup_1m_machine_bucket ON log_machine_rollup_1m (machine_id, bucket);
+CREATE INDEX IF NOT EXISTS idx_log_machine_rollup_1h_machine_bucket ON log_machine_rollup_1h (machine_id, bucket);
+
+-- Posisi terakhir (log_machine.id) yang sudah masuk rollup
+CREATE TABLE IF NOT EXISTS log_machine_rollup_state (
+    name VARCHAR(50) PRIMARY KEY,
+    watermark_id BIGINT NOT NULL DEFAULT 0,
+    refreshed_at TIMESTAMP
+);
+INSERT INTO log_machine_rollup_state (name) VALUES ('log_machine') ON CONFLICT (name) DO NOTHING;
+
+-- Refresh inkremental: ambil baris log_machine dengan id > watermark (maks max_rows per panggilan),
+-- lalu hitung ulang bucket menit & jam yang tersentuh langsung dari data mentah. Karena bucket
+-- dihitung ulang (bukan ditambah), data yang datang terlambat tetap masuk ke bucket yang benar.
+-- id_overlap membaca ulang sebagian id di bawah watermark untuk menangkap transaksi yang
+-- commit belakangan dengan id lebih kecil. Mengembalikan jumlah id yang diproses
+-- (sama dengan max_rows berarti masih ada sisa, panggil lagi).
+CREATE OR REPLACE FUNCTION refresh_log_machine_rollups(max_rows BIGINT DEFAULT 500000, id_overlap BIGINT DEFAULT 10000)
+RETURNS BIGINT AS $$
+DECLARE
+    last_id BIGINT;
+    hi_id BIGINT;
+BEGIN
+    SELECT watermark_id INTO last_id FROM log_machine_rollup_state WHERE name = 'log_machine' FOR UPDATE;
+    IF last_id IS NULL THEN
+        INSERT INTO log_machine_rollup_state (name) VALUES ('log_machine') ON CONFLICT (name) DO NOTHING;
+        last_id := 0;
+    END IF;
+
+    SELECT MAX(id) INTO hi_id FROM log_machine;
+    IF hi_id IS NULL OR hi_id <= last_id THEN
+        RETURN 0;
+    END IF;
+    hi_id := LEAST(hi_id, last_id + max_rows);
+
+    DROP TABLE IF EXISTS rollup_touched;
+    CREATE TEMP TABLE rollup_touched ON COMMIT DROP AS
+    SELECT DISTINCT machine_id, tag_name, date_trunc('minute', created_at) AS bucket
+    FROM log_machine
+    WHERE id > GREATEST(last_id - id_overlap, 0) AND id <= hi_id
+      AND machine_id IS NOT NULL AND tag_name IS NOT NULL;
+
+    INSERT INTO log_machine_rollup_1m
+        (machine_id, tag_name, bucket, sample_count, value_count, value_min, value_max, value_sum, last_value, last_at)
+    SELECT t.machine_id, t.tag_name, t.bucket,
+           agg.sample_count, agg.value_count, agg.value_min, agg.value_max, agg.value_sum, agg.last_value, agg.last_at
+    FROM rollup_touched t
+    CROSS JOIN LATERAL (
+        SELECT COUNT(*) AS sample_count,
+               COUNT(v) AS value_count,
+               MIN(v) AS value_min,
+               MAX(v) AS value_max,
+               SUM(v) AS value_sum,
+               (array_agg(s.tag_value ORDER BY s.created_at DESC, s.id DESC))[1] AS last_value,
+               MAX(s.created_at) AS last_at
+        FROM (
+            SELECT lm.id, lm.created_at, lm.tag_value,
+                   CASE WHEN lm.tag_value ~ '^\s*[-+]?(\d+\.?\d*|\.\d+)([eE][-+]?\d+)?\s*$'
+                        THEN lm.tag_value::float8 END AS v
+            FROM log_machine lm
+            WHERE lm.machine_id = t.machine_id AND lm.tag_name = t.tag_name
+              AND lm.created_at >= t.bucket AND lm.created_at < t.bucket + INTERVAL '1 minute'
+        ) s
+    ) agg
+    ON CONFLICT (machine_id, tag_name, bucket) DO UPDATE
+    SET sample_count = EXCLUDED.sample_count,
+        value_count = EXCLUDED.value_count,
+        value_min = EXCLUDED.value_min,
+        value_max = EXCLUDED.value_max,
+        value_sum = EXCLUDED.value_sum,
+        last_value = EXCLUDED.last_value,
+        last_at = EXCLUDED.last_at;
+
+    INSERT INTO log_machine_rollup_1h
+        (machine_id, tag_name, bucket, sample_count, value_count, value_min, value_max, value_sum, last_value, last_at)
+    SELECT h.machine_id, h.tag_name, h.bucket,
+           SUM(m.sample_count), SUM(m.value_count), MIN(m.value_min), MAX(m.value_max), SUM(m.value_sum),
+           (array_agg(m.last_value ORDER BY m.last_at DESC))[1], MAX(m.last_at)
+    FROM (SELECT DISTINCT machine_id, tag_name, date_trunc('hour', bucket) AS bucket FROM rollup_touched) h
+    JOIN log_machine_rollup_1m m
+      ON m.machine_id = h.machine_id AND m.tag_name = h.tag_name
+     AND m.bucket >= h.bucket AND m.bucket < h.bucket + INTERVAL '1 hour'
+    GROUP BY h.machine_id, h.tag_name, h.bucket
+    ON CONFLICT (machine_id, tag_name, bucket) DO UPDATE
+    SET sample_count = EXCLUDED.sample_count,
+        value_count = EXCLUDED.value_count,
+        value_min = EXCLUDED.value_min,
+        value_max = EXCLUDED.value_max,
+        value_sum = EXCLUDED.value_sum,
+        last_value = EXCLUDED.last_value,
+        last_at = EXCLUDED.last_at;
+
+    UPDATE log_machine_rollup_state
+    SET watermark_id = hi_id, refreshed_at = NOW() AT TIME ZONE 'UTC'
+    WHERE name = 'log_machine';
+
+    RETURN hi_id - last_id;
+END;
+$$ LANGUAGE plpgsql;
@@ -0,0 +1,18 @@
+-- NOTIFY setiap kali master data (manpower / product) berubah, supaya cache di BarcodeSystem
+-- di-invalidate. Payload = nama tabel. NOTIFY baru terkirim saat transaksi commit.
+CREATE OR REPLACE FUNCTION notify_master_data_changed() RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM pg_notify('master_data_changed', TG_TABLE_NAME);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS manpower_master_data_changed ON manpower;
+CREATE TRIGGER manpower_master_data_changed
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON manpower
+FOR EACH STATEMENT EXECUTE FUNCTION notify_master_data_changed();
+
+DROP TRIGGER IF EXISTS product_master_data_changed ON product;
+CREATE TRIGGER product_master_data_changed
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON product
+FOR EACH STATEMENT EXECUTE FUNCTION notify_master_data_changed();
@@ -0,0 +1,25 @@
+-- Aksi terakhir per product (start/stop), ditulis di statement yang sama dengan insert log_product
+-- (lihat INSERT_LOG_PRODUCT_QUERY di main.py), supaya "status product saat ini" tidak perlu
+-- dihitung ulang dari seluruh log_product.
+CREATE TABLE IF NOT EXISTS product_state (
+    machine_name VARCHAR(100) NOT NULL,
+    name_product VARCHAR(100) NOT NULL,
+    action VARCHAR(20) NOT NULL CHECK (action IN ('start','stop')),
+    name_manpower VARCHAR(100),
+    log_id INT,
+    updated_at TIMESTAMP NOT NULL,
+    PRIMARY KEY (machine_name, name_product)
+);
+
+-- Auto-stop saat logout: product yang sedang 'start' milik manpower tertentu
+CREATE INDEX IF NOT EXISTS idx_product_state_active_manpower
+ON product_state (name_manpower) WHERE action = 'start';
+
+-- Backfill dari log yang sudah ada
+INSERT INTO product_state (machine_name, name_product, action, name_manpower, log_id, updated_at)
+SELECT DISTINCT ON (machine_name, name_product)
+       machine_name, name_product, action, name_manpower, id, COALESCE(created_at, NOW())
+FROM log_product
+WHERE action IS NOT NULL
+ORDER BY machine_name, name_product, created_at DESC NULLS LAST, id DESC
+ON CONFLICT (machine_name, name_product) DO NOTHING;
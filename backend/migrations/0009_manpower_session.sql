@@ -0,0 +1,22 @@
+-- Sesi login manpower yang sedang terbuka (satu baris per sesi). Ditulis di statement yang sama
+-- dengan insert log_manpower login/logout, jadi main.py dan api.py membaca state yang sama.
+-- station: titik scan tempat operator login; nik UNIQUE = satu operator hanya login di satu tempat.
+CREATE TABLE IF NOT EXISTS manpower_session (
+    station VARCHAR(100) PRIMARY KEY,
+    nik VARCHAR(50) NOT NULL UNIQUE,
+    name VARCHAR(100) NOT NULL,
+    log_id INT,
+    started_at TIMESTAMP NOT NULL
+);
+
+-- Backfill: sebelumnya hanya ada satu operator login di seluruh plant, yaitu baris terakhir
+-- log_manpower jika statusnya 'login'
+INSERT INTO manpower_session (station, nik, name, log_id, started_at)
+SELECT 'default', nik, name, id, COALESCE(created_at, NOW())
+FROM (
+    SELECT id, nik, name, status, created_at FROM log_manpower
+    ORDER BY created_at DESC NULLS LAST, id DESC
+    LIMIT 1
+) last_log
+WHERE status = 'login' AND nik IS NOT NULL AND name IS NOT NULL
+ON CONFLICT DO NOTHING;
@@ -0,0 +1,29 @@
+-- token_blacklist dibaca dari memori oleh API (lihat cache.TokenBlacklist), bukan per request.
+-- token_id = sha256(token) hex, expires_at = klaim exp token (UTC); setelah exp lewat token
+-- sudah ditolak oleh verifikasi JWT, jadi barisnya boleh dibuang dari memori dan tabel.
+ALTER TABLE token_blacklist ADD COLUMN IF NOT EXISTS token_id VARCHAR(64);
+ALTER TABLE token_blacklist ADD COLUMN IF NOT EXISTS expires_at TIMESTAMP;
+
+-- Backfill: token lama berlaku maksimal 8 jam sejak login, dan login pasti sebelum logout
+UPDATE token_blacklist
+SET token_id = encode(sha256(convert_to(token, 'UTF8')), 'hex'),
+    expires_at = COALESCE(blacklisted_at, NOW() AT TIME ZONE 'UTC') + INTERVAL '8 hours'
+WHERE token_id IS NULL;
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_token_blacklist_token_id ON token_blacklist (token_id);
+CREATE INDEX IF NOT EXISTS idx_token_blacklist_expires_at ON token_blacklist (expires_at);
+DROP INDEX IF EXISTS idx_token_blacklist_blacklisted_at;
+
+-- NOTIFY ke semua worker API saat token di-logout. Payload = "<token_id> <exp epoch>".
+-- NOTIFY baru terkirim saat transaksi commit.
+CREATE OR REPLACE FUNCTION notify_token_blacklisted() RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM pg_notify('token_blacklist', NEW.token_id || ' ' || EXTRACT(EPOCH FROM NEW.expires_at)::BIGINT);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS token_blacklist_notify ON token_blacklist;
+CREATE TRIGGER token_blacklist_notify
+AFTER INSERT ON token_blacklist
+FOR EACH ROW WHEN (NEW.token_id IS NOT NULL) EXECUTE FUNCTION notify_token_blacklisted();
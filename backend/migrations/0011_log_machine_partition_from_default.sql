@@ -0,0 +1,72 @@
+-- Partisi harian yang dibuat terlambat (maintenance mati lebih lama dari days_ahead sementara
+-- machine_data tetap menulis) sudah punya baris di log_machine_default, sehingga
+-- CREATE TABLE ... PARTITION OF untuk hari itu gagal dan menggagalkan seluruh loop.
+-- Sekarang baris hari tersebut dipindah dari DEFAULT ke tabel baru lalu tabel itu di-ATTACH.
+
+CREATE OR REPLACE FUNCTION create_log_machine_partition(d DATE)
+RETURNS BOOLEAN AS $$
+DECLARE
+    part_name TEXT := 'log_machine_' || to_char(d, 'YYYYMMDD');
+BEGIN
+    IF to_regclass(part_name) IS NOT NULL THEN
+        RETURN FALSE;
+    END IF;
+
+    IF to_regclass('log_machine_default') IS NULL
+       OR NOT EXISTS (SELECT 1 FROM log_machine_default WHERE created_at >= d AND created_at < d + 1) THEN
+        EXECUTE format(
+            'CREATE TABLE %I PARTITION OF log_machine FOR VALUES FROM (%L) TO (%L)',
+            part_name, d, d + 1
+        );
+        RETURN TRUE;
+    END IF;
+
+    -- Kunci DEFAULT supaya tidak ada baris baru untuk hari ini yang masuk di antara DELETE dan ATTACH
+    LOCK TABLE log_machine_default IN ACCESS EXCLUSIVE MODE;
+    EXECUTE format('CREATE TABLE %I (LIKE log_machine INCLUDING DEFAULTS INCLUDING CONSTRAINTS)', part_name);
+    EXECUTE format(
+        'WITH moved AS (
+             DELETE FROM log_machine_default WHERE created_at >= %L AND created_at < %L RETURNING *
+         )
+         INSERT INTO %I SELECT * FROM moved',
+        d, d + 1, part_name
+    );
+    -- Index partisi (PK, idx_log_machine_*) dibuat otomatis saat ATTACH
+    EXECUTE format(
+        'ALTER TABLE log_machine ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+        part_name, d, d + 1
+    );
+    RAISE WARNING 'log_machine: partisi % dibuat dari baris yang sudah ada di log_machine_default', part_name;
+    RETURN TRUE;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Hari yang barisnya sudah ada di DEFAULT ikut dibuatkan partisi (normalnya DEFAULT kosong),
+-- dan satu hari yang gagal tidak lagi menghentikan pembuatan partisi hari-hari berikutnya
+CREATE OR REPLACE FUNCTION ensure_log_machine_partitions(days_ahead INT DEFAULT 7)
+RETURNS INT AS $$
+DECLARE
+    today DATE := (NOW() AT TIME ZONE 'UTC')::date;
+    d DATE;
+    created INT := 0;
+BEGIN
+    FOR d IN
+        SELECT generate_series(today - 1, today + days_ahead, INTERVAL '1 day')::date
+        UNION
+        SELECT DISTINCT created_at::date FROM log_machine_default
+        ORDER BY 1
+    LOOP
+        BEGIN
+            IF create_log_machine_partition(d) THEN
+                created := created + 1;
+            END IF;
+        EXCEPTION WHEN OTHERS THEN
+            RAISE WARNING 'log_machine: gagal membuat partisi %: %', d, SQLERRM;
+        END;
+    END LOOP;
+    RETURN created;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Pindahkan baris yang sudah menumpuk di DEFAULT ke partisi harian
+SELECT ensure_log_machine_partitions(7);
@@ -0,0 +1,16 @@
+-- Auto-stop saat logout sebelumnya mencari product 'start' berdasarkan name_manpower saja, di semua
+-- mesin: operator bernama sama di station lain ikut ter-stop. Sekarang product_state menyimpan sesi
+-- yang men-start product (station + nik dari manpower_session), dan auto-stop memakai kunci itu.
+ALTER TABLE product_state ADD COLUMN IF NOT EXISTS station VARCHAR(100);
+ALTER TABLE product_state ADD COLUMN IF NOT EXISTS nik VARCHAR(50);
+
+-- Backfill: product yang masih 'start' milik operator yang sedang login (nama unik di sesi terbuka)
+UPDATE product_state ps
+SET station = ms.station, nik = ms.nik
+FROM manpower_session ms
+WHERE ps.action = 'start' AND ps.station IS NULL AND ps.name_manpower = ms.name
+  AND (SELECT COUNT(*) FROM manpower_session o WHERE o.name = ms.name) = 1;
+
+CREATE INDEX IF NOT EXISTS idx_product_state_active_session
+ON product_state (station, nik) WHERE action = 'start';
+DROP INDEX IF EXISTS idx_product_state_active_manpower;
@@ -0,0 +1,7 @@
+-- Station scan hanya dibuat untuk mesin yang terdaftar di devices (lihat stations.StationRegistry);
+-- daftar devices di-cache di MasterDataCache dan di-invalidate lewat NOTIFY yang sama
+-- dengan manpower / product (notify_master_data_changed dari 0007).
+DROP TRIGGER IF EXISTS devices_master_data_changed ON devices;
+CREATE TRIGGER devices_master_data_changed
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON devices
+FOR EACH STATEMENT EXECUTE FUNCTION notify_master_data_changed();
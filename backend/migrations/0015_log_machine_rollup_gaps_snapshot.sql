@@ -0,0 +1,135 @@
+-- Finalisasi gap rollup (0012) tidak lagi memakai pg_stat_activity.backend_xid. Tanpa superuser /
+-- pg_read_all_stats, xid session lain tidak terlihat di sana, sehingga gap bisa dianggap final
+-- sebelum INSERT yang mengisinya commit dan baris itu tidak pernah masuk rollup. Sekarang memakai
+-- pg_snapshot_xmin / pg_snapshot_xmax dari pg_current_snapshot(), yang tidak butuh hak khusus.
+
+ALTER TABLE log_machine_rollup_gaps ADD COLUMN IF NOT EXISTS wait_xmax XID8;
+
+-- Refresh inkremental: ambil baris log_machine dengan id > watermark (maks max_rows per panggilan)
+-- ditambah gap yang sudah final, lalu hitung ulang bucket menit & jam yang tersentuh langsung dari
+-- data mentah. Mengembalikan jumlah id baru yang diproses (sama dengan max_rows berarti masih ada
+-- sisa, panggil lagi).
+CREATE OR REPLACE FUNCTION refresh_log_machine_rollups(max_rows BIGINT DEFAULT 500000)
+RETURNS BIGINT AS $$
+DECLARE
+    last_id BIGINT;
+    hi_id BIGINT;
+BEGIN
+    SELECT watermark_id INTO last_id FROM log_machine_rollup_state WHERE name = 'log_machine' FOR UPDATE;
+    IF last_id IS NULL THEN
+        INSERT INTO log_machine_rollup_state (name) VALUES ('log_machine') ON CONFLICT (name) DO NOTHING;
+        last_id := 0;
+    END IF;
+
+    SELECT MAX(id) INTO hi_id FROM log_machine;
+    hi_id := LEAST(GREATEST(COALESCE(hi_id, last_id), last_id), last_id + max_rows);
+
+    -- Gap final: semua transaksi yang mungkin memegang id di gap sudah selesai. Dua tahap, tanpa
+    -- pg_stat_activity (yang butuh superuser / pg_read_all_stats untuk melihat xid session lain):
+    --   1. >= 1 detik setelah gap terlihat, catat wait_xmax = xmax snapshot saat itu. Transaksi
+    --      pengisi gap sudah mengambil id-nya (nextval) sebelum gap terlihat, dan xid-nya
+    --      diberikan di statement INSERT yang sama, jadi dalam 1 detik xid-nya pasti < wait_xmax.
+    --   2. Gap final saat xmin snapshot sekarang >= wait_xmax: tidak ada lagi transaksi dengan
+    --      xid < wait_xmax yang masih berjalan (commit atau rollback).
+    -- pg_current_snapshot() bisa dipanggil role mana pun; tidak perlu GRANT tambahan.
+    DROP TABLE IF EXISTS rollup_final_gaps;
+    CREATE TEMP TABLE rollup_final_gaps ON COMMIT DROP AS
+    SELECT g.from_id, g.to_id
+    FROM log_machine_rollup_gaps g
+    WHERE g.wait_xmax IS NOT NULL
+      AND pg_snapshot_xmin(pg_current_snapshot()) >= g.wait_xmax;
+    DELETE FROM log_machine_rollup_gaps g USING rollup_final_gaps f WHERE g.from_id = f.from_id;
+
+    UPDATE log_machine_rollup_gaps
+    SET wait_xmax = pg_snapshot_xmax(pg_current_snapshot())
+    WHERE wait_xmax IS NULL AND detected_at < clock_timestamp() - INTERVAL '1 second';
+
+    IF hi_id = last_id AND NOT EXISTS (SELECT 1 FROM rollup_final_gaps) THEN
+        RETURN 0;
+    END IF;
+
+    -- Gap baru di rentang ini; hi_id + 1 sebagai sentinel supaya id yang belum terlihat di ujung
+    -- rentang (saat hi_id dibatasi max_rows) juga tercatat
+    INSERT INTO log_machine_rollup_gaps (from_id, to_id, detected_at)
+    SELECT prev_id + 1, id - 1, clock_timestamp()
+    FROM (
+        SELECT id, lag(id, 1, last_id) OVER (ORDER BY id) AS prev_id
+        FROM (
+            SELECT id FROM log_machine WHERE id > last_id AND id <= hi_id
+            UNION ALL
+            SELECT hi_id + 1
+        ) ids
+    ) s
+    WHERE id > prev_id + 1
+    ON CONFLICT (from_id) DO NOTHING;
+
+    DROP TABLE IF EXISTS rollup_touched;
+    CREATE TEMP TABLE rollup_touched ON COMMIT DROP AS
+    SELECT DISTINCT machine_id, tag_name, date_trunc('minute', created_at) AS bucket
+    FROM (
+        SELECT machine_id, tag_name, created_at FROM log_machine
+        WHERE id > last_id AND id <= hi_id
+        UNION ALL
+        SELECT lm.machine_id, lm.tag_name, lm.created_at
+        FROM rollup_final_gaps f
+        JOIN log_machine lm ON lm.id >= f.from_id AND lm.id <= f.to_id
+    ) r
+    WHERE machine_id IS NOT NULL AND tag_name IS NOT NULL;
+
+    INSERT INTO log_machine_rollup_1m
+        (machine_id, tag_name, bucket, sample_count, value_count, value_min, value_max, value_sum, last_value, last_at)
+    SELECT t.machine_id, t.tag_name, t.bucket,
+           agg.sample_count, agg.value_count, agg.value_min, agg.value_max, agg.value_sum, agg.last_value, agg.last_at
+    FROM rollup_touched t
+    CROSS JOIN LATERAL (
+        SELECT COUNT(*) AS sample_count,
+               COUNT(v) AS value_count,
+               MIN(v) AS value_min,
+               MAX(v) AS value_max,
+               SUM(v) AS value_sum,
+               (array_agg(s.tag_value ORDER BY s.created_at DESC, s.id DESC))[1] AS last_value,
+               MAX(s.created_at) AS last_at
+        FROM (
+            SELECT lm.id, lm.created_at, lm.tag_value,
+                   CASE WHEN lm.tag_value ~ '^\s*[-+]?(\d+\.?\d*|\.\d+)([eE][-+]?\d+)?\s*$'
+                        THEN lm.tag_value::float8 END AS v
+            FROM log_machine lm
+            WHERE lm.machine_id = t.machine_id AND lm.tag_name = t.tag_name
+              AND lm.created_at >= t.bucket AND lm.created_at < t.bucket + INTERVAL '1 minute'
+        ) s
+    ) agg
+    ON CONFLICT (machine_id, tag_name, bucket) DO UPDATE
+    SET sample_count = EXCLUDED.sample_count,
+        value_count = EXCLUDED.value_count,
+        value_min = EXCLUDED.value_min,
+        value_max = EXCLUDED.value_max,
+        value_sum = EXCLUDED.value_sum,
+        last_value = EXCLUDED.last_value,
+        last_at = EXCLUDED.last_at;
+
+    INSERT INTO log_machine_rollup_1h
+        (machine_id, tag_name, bucket, sample_count, value_count, value_min, value_max, value_sum, last_value, last_at)
+    SELECT h.machine_id, h.tag_name, h.bucket,
+           SUM(m.sample_count), SUM(m.value_count), MIN(m.value_min), MAX(m.value_max), SUM(m.value_sum),
+           (array_agg(m.last_value ORDER BY m.last_at DESC))[1], MAX(m.last_at)
+    FROM (SELECT DISTINCT machine_id, tag_name, date_trunc('hour', bucket) AS bucket FROM rollup_touched) h
+    JOIN log_machine_rollup_1m m
+      ON m.machine_id = h.machine_id AND m.tag_name = h.tag_name
+     AND m.bucket >= h.bucket AND m.bucket < h.bucket + INTERVAL '1 hour'
+    GROUP BY h.machine_id, h.tag_name, h.bucket
+    ON CONFLICT (machine_id, tag_name, bucket) DO UPDATE
+    SET sample_count = EXCLUDED.sample_count,
+        value_count = EXCLUDED.value_count,
+        value_min = EXCLUDED.value_min,
+        value_max = EXCLUDED.value_max,
+        value_sum = EXCLUDED.value_sum,
+        last_value = EXCLUDED.last_value,
+        last_at = EXCLUDED.last_at;
+
+    UPDATE log_machine_rollup_state
+    SET watermark_id = hi_id, refreshed_at = NOW() AT TIME ZONE 'UTC'
+    WHERE name = 'log_machine';
+
+    RETURN hi_id - last_id;
+END;
+$$ LANGUAGE plpgsql;
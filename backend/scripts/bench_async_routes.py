@@ -0,0 +1,127 @@
+"""
+Benchmark: latency /machine/logs saat ada write yang lambat.
+
+Skenario:
+  1. Baseline  - beberapa client memanggil GET /machine/logs terus-menerus.
+  2. Slow write - tabel `devices` dikunci (ACCESS EXCLUSIVE) dari koneksi terpisah,
+     lalu beberapa PUT /edit_device dikirim sehingga route async tersebut tertahan
+     selama --hold detik. Client /machine/logs tetap berjalan.
+
+Jika route async memblokir event loop, p99 fase kedua akan mendekati --hold.
+Dengan offload ke executor DB, p99 harus tetap setara baseline.
+
+Contoh (dari folder backend, di dalam container):
+    python scripts/bench_async_routes.py --url http://localhost:8000 --user admin --password admin
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+import urllib.request
+import urllib.error
+from concurrent.futures import ThreadPoolExecutor
+
+import psycopg2
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from db import DB_CONFIG  # noqa: E402
+
+
+def request(method, url, token=None, body=None, timeout=60):
+    headers = {"Content-Type": "application/json"}
+    if token:
+        headers["Authorization"] = f"Bearer {token}"
+    data = json.dumps(body).encode() if body is not None else None
+    req = urllib.request.Request(url, data=data, headers=headers, method=method)
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as resp:
+            return resp.status, resp.read()
+    except urllib.error.HTTPError as e:
+        return e.code, e.read()
+
+
+def login(base_url, username, password):
+    status, body = request("POST", f"{base_url}/login", body={"username": username, "password": password})
+    if status != 200:
+        raise SystemExit(f"Login gagal ({status}): {body[:200]}")
+    return json.loads(body)["token"]
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    idx = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[idx]
+
+
+def poll_machine_logs(base_url, token, stop_event, latencies):
+    while not stop_event.is_set():
+        started = time.perf_counter()
+        request("GET", f"{base_url}/machine/logs", token)
+        latencies.append((time.perf_counter() - started) * 1000)
+
+
+def run_phase(base_url, token, clients, duration, during=None):
+    latencies = []
+    stop_event = threading.Event()
+    with ThreadPoolExecutor(max_workers=clients + 1) as ex:
+        for _ in range(clients):
+            ex.submit(poll_machine_logs, base_url, token, stop_event, latencies)
+        if during:
+            ex.submit(during)
+        time.sleep(duration)
+        stop_event.set()
+    return latencies
+
+
+def slow_write(base_url, token, hold, writers):
+    """Hold a lock on `devices` so PUT /edit_device blocks inside its route."""
+    lock_conn = psycopg2.connect(**DB_CONFIG)
+    try:
+        with lock_conn.cursor() as cur:
+            cur.execute("LOCK TABLE devices IN ACCESS EXCLUSIVE MODE")
+        body = {"machine_name": "__bench_missing__", "serial_number": "SN-BENCH"}
+        with ThreadPoolExecutor(max_workers=writers) as ex:
+            futures = [ex.submit(request, "PUT", f"{base_url}/edit_device", token, body) for _ in range(writers)]
+            time.sleep(hold)
+            lock_conn.rollback()
+            for f in futures:
+                f.result()
+    finally:
+        lock_conn.close()
+
+
+def report(name, latencies):
+    print(f"{name:<12} n={len(latencies):<6} "
+          f"p50={percentile(latencies, 50):8.1f} ms  "
+          f"p95={percentile(latencies, 95):8.1f} ms  "
+          f"p99={percentile(latencies, 99):8.1f} ms  "
+          f"max={max(latencies) if latencies else 0:8.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--user", default="admin")
+    parser.add_argument("--password", default="admin")
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--hold", type=float, default=5.0, help="Berapa lama write ditahan (detik)")
+    parser.add_argument("--writers", type=int, default=4)
+    args = parser.parse_args()
+
+    token = login(args.url, args.user, args.password)
+
+    baseline = run_phase(args.url, token, args.clients, args.duration)
+    report("baseline", baseline)
+
+    during = run_phase(args.url, token, args.clients, args.duration,
+                       during=lambda: slow_write(args.url, token, args.hold, args.writers))
+    report("slow write", during)
+
+
+if __name__ == "__main__":
+    main()
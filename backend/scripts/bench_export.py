@@ -0,0 +1,61 @@
+"""
+Benchmark: /machine/logs/export (streaming) vs /machine/logs/filtered (fetchall).
+
+Mengukur waktu sampai byte pertama (TTFB), total waktu, dan ukuran respons untuk
+range yang sama. Jalankan dengan range yang panjang untuk melihat perbedaannya;
+pantau juga memori container backend (docker stats) selama benchmark berjalan.
+
+Contoh:
+    python scripts/bench_export.py --url http://localhost:8000 --machine machine_01 \\
+        --start 2026-01-01 --end 2026-01-31
+"""
+import os
+import sys
+import time
+import argparse
+import urllib.request
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from bench_async_routes import login  # noqa: E402
+
+
+def timed_get(url, token, chunk_size=64 * 1024):
+    req = urllib.request.Request(url, headers={"Authorization": f"Bearer {token}"})
+    started = time.perf_counter()
+    ttfb = None
+    total = 0
+    with urllib.request.urlopen(req, timeout=600) as resp:
+        while True:
+            chunk = resp.read1(chunk_size) if hasattr(resp, "read1") else resp.read(chunk_size)
+            if not chunk:
+                break
+            if ttfb is None:
+                ttfb = time.perf_counter() - started
+            total += len(chunk)
+    return ttfb or 0.0, time.perf_counter() - started, total
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--user", default="admin")
+    parser.add_argument("--password", default="admin")
+    parser.add_argument("--machine", default="machine_01")
+    parser.add_argument("--start", required=True, help="YYYY-MM-DD")
+    parser.add_argument("--end", required=True, help="YYYY-MM-DD")
+    args = parser.parse_args()
+
+    token = login(args.url, args.user, args.password)
+    qs = f"start_date={args.start}&end_date={args.end}&machine_id={args.machine}"
+    targets = [
+        ("export csv", f"{args.url}/machine/logs/export?{qs}&format=csv"),
+        ("export ndjson", f"{args.url}/machine/logs/export?{qs}&format=ndjson"),
+        ("filtered json", f"{args.url}/machine/logs/filtered?{qs}"),
+    ]
+    for name, url in targets:
+        ttfb, total_s, size = timed_get(url, token)
+        print(f"{name:<14} ttfb={ttfb * 1000:9.1f} ms  total={total_s:7.2f} s  size={size / 1e6:8.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Benchmark: timeline status per mesin, SQL (compute_timelines) vs perhitungan lama di browser.
+
+Script ini mengisi machine_status_event dengan transisi sintetis selama --days hari
+untuk beberapa mesin dummy (di dalam satu transaksi yang di-rollback di akhir,
+jadi database tidak berubah), lalu membandingkan:
+
+  * sql     - compute_timelines() untuk range utama + range pembanding dalam satu query
+  * legacy  - ambil seluruh histori transisi per mesin lalu hitung per range di Python,
+              sama seperti calculateTimelineFromEvents di Dashboard.jsx
+
+Contoh (dari folder backend, di dalam container):
+    python scripts/bench_timeline.py --machines 10 --days 365 --interval-min 5
+"""
+import os
+import sys
+import time
+import argparse
+from datetime import timedelta
+
+import psycopg2
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from db import DB_CONFIG  # noqa: E402
+from timeline import compute_timelines, utc_now_naive  # noqa: E402
+
+SEED_QUERY = """
+    INSERT INTO machine_status_event (machine_id, created_at, status)
+    SELECT m, ts, (ARRAY['0', '1.0', '2.0'])[1 + floor(random() * 3)::int]
+    FROM unnest(%(machine_ids)s::text[]) AS m,
+         generate_series(%(start)s::timestamp, %(end)s::timestamp, %(step)s::interval) AS ts
+"""
+
+
+def legacy_timeline(events, start, end, now):
+    """Port dari calculateTimelineFromEvents: O(seluruh histori) per range."""
+    valid = sorted((e for e in events if e[0] <= end), key=lambda e: e[0])
+    totals = {}
+    for i, (created_at, status) in enumerate(valid):
+        seg_start = max(created_at, start)
+        seg_end = valid[i + 1][0] if i + 1 < len(valid) else min(end, now)
+        if seg_start >= seg_end:
+            continue
+        totals[status] = totals.get(status, 0.0) + (seg_end - seg_start).total_seconds()
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--machines", type=int, default=10)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--interval-min", type=int, default=5, help="Jarak antar transisi sintetis (menit)")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    now = utc_now_naive()
+    machine_ids = [f"__bench_timeline_{i:03d}" for i in range(args.machines)]
+    day_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    ranges = [
+        (day_start, now),                                   # range utama: hari ini
+        (day_start - timedelta(days=7), day_start),         # pembanding: 7 hari terakhir
+    ]
+
+    conn = psycopg2.connect(**DB_CONFIG)
+    try:
+        with conn.cursor() as cur:
+            started = time.perf_counter()
+            cur.execute(SEED_QUERY, {
+                "machine_ids": machine_ids,
+                "start": now - timedelta(days=args.days),
+                "end": now,
+                "step": f"{args.interval_min} minutes",
+            })
+            print(f"Seeded {cur.rowcount} transitions in {time.perf_counter() - started:.1f}s")
+            cur.execute("ANALYZE machine_status_event")
+
+        started = time.perf_counter()
+        for _ in range(args.repeat):
+            compute_timelines(conn, machine_ids, ranges, now=now)
+        sql_ms = (time.perf_counter() - started) * 1000 / args.repeat
+
+        started = time.perf_counter()
+        for _ in range(max(1, args.repeat // 5)):
+            with conn.cursor() as cur:
+                for machine_id in machine_ids:
+                    cur.execute(
+                        "SELECT created_at, status FROM machine_status_event WHERE machine_id = %s ORDER BY created_at",
+                        (machine_id,),
+                    )
+                    events = cur.fetchall()
+                    for start, end in ranges:
+                        legacy_timeline(events, start, end, now)
+        legacy_ms = (time.perf_counter() - started) * 1000 / max(1, args.repeat // 5)
+
+        print(f"{args.machines} machines x {len(ranges)} ranges, {args.days} days of history")
+        print(f"  sql    : {sql_ms:10.1f} ms / call")
+        print(f"  legacy : {legacy_ms:10.1f} ms / call")
+    finally:
+        conn.rollback()
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+"""
+Regression check: pastikan query endpoint tidak jatuh ke Seq Scan pada tabel log yang besar.
+
+Script ini mengisi tabel log dengan data sintetis (di dalam satu transaksi yang
+di-rollback di akhir, jadi database tidak berubah), menjalankan ANALYZE, lalu
+EXPLAIN setiap bentuk query yang dipakai api.py / main.py. Jika ada node
+Seq Scan pada tabel yang berisi >= --min-rows baris, script keluar dengan kode 1.
+
+Jalankan setelah migrate.py (dari folder backend, di dalam container):
+    python scripts/check_query_plans.py
+    python scripts/check_query_plans.py --rows 500000 --verbose
+"""
+import os
+import sys
+import json
+import argparse
+from datetime import timedelta
+
+import psycopg2
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from db import DB_CONFIG  # noqa: E402
+from timeline import TIMELINE_QUERY, utc_now_naive  # noqa: E402
+from stations import DEFAULT_STATION  # noqa: E402
+from cache import TOKEN_BLACKLIST_LOOKUP_QUERY  # noqa: E402
+from main import (  # noqa: E402
+    ACTIVE_SESSION_QUERY, AUTO_STOP_PRODUCTS_QUERY, INSERT_STATUS_EVENT_QUERY,
+    LAST_PRODUCT_ACTION_QUERY, LAST_PRODUCT_QUERY,
+)
+from api import (  # noqa: E402
+    DASHBOARD_PRODUCT_LOGS_QUERY, MACHINE_STATUS_EVENTS_QUERY, MANPOWER_LIST_QUERY, MANPOWER_LOG_COLUMNS,
+    PRODUCT_LIST_QUERY, PRODUCT_LOG_COLUMNS, PURGE_TOKEN_BLACKLIST_QUERY, WORK_ORDERS_QUERY,
+    build_log_page_query, build_machine_log_query, encode_cursor,
+)
+
+BENCH_PREFIX = "__plan_check"
+SEEDED_TABLES = ["log_machine", "log_product", "log_manpower", "machine_status_event", "token_blacklist"]
+
+SEED_QUERIES = [
+    # log_machine: partisi harian untuk seluruh rentang data sintetis
+    """
+    SELECT create_log_machine_partition(d::date)
+    FROM generate_series(%(start)s::date, %(now)s::date, INTERVAL '1 day') AS d
+    """,
+    """
+    INSERT INTO log_machine (created_at, machine_id, tag_name, tag_value, recorded_at)
+    SELECT %(start)s::timestamp + (i::bigint * %(span)s / %(rows)s) * INTERVAL '1 second',
+           %(prefix)s || '_m' || (i %% 20), 'tag_' || (i %% 10), (i %% 100)::text, NULL
+    FROM generate_series(1, %(rows)s) AS i
+    """,
+    """
+    INSERT INTO product (machine_name, name_product)
+    SELECT %(prefix)s || '_m' || (i %% 20), %(prefix)s || '_p' || i
+    FROM generate_series(1, 200) AS i
+    ON CONFLICT DO NOTHING
+    """,
+    """
+    INSERT INTO log_product (created_at, machine_name, name_product, action, name_manpower)
+    SELECT %(start)s::timestamp + (i::bigint * %(span)s / %(rows)s) * INTERVAL '1 second',
+           %(prefix)s || '_m' || ((i %% 200 + 1) %% 20), %(prefix)s || '_p' || (i %% 200 + 1),
+           CASE WHEN i %% 2 = 0 THEN 'start' ELSE 'stop' END, %(prefix)s || '_op' || (i %% 50)
+    FROM generate_series(1, %(rows)s) AS i
+    """,
+    """
+    INSERT INTO product_state (machine_name, name_product, action, name_manpower, log_id, updated_at)
+    SELECT DISTINCT ON (machine_name, name_product) machine_name, name_product, action, name_manpower, id, created_at
+    FROM log_product WHERE machine_name LIKE %(prefix)s || '%%'
+    ORDER BY machine_name, name_product, created_at DESC, id DESC
+    ON CONFLICT (machine_name, name_product) DO NOTHING
+    """,
+    """
+    INSERT INTO log_manpower (created_at, nik, name, status)
+    SELECT %(start)s::timestamp + (i::bigint * %(span)s / %(rows)s) * INTERVAL '1 second',
+           %(prefix)s || '_nik' || (i %% 500), %(prefix)s || '_op' || (i %% 500),
+           CASE WHEN i %% 2 = 0 THEN 'login' ELSE 'logout' END
+    FROM generate_series(1, %(rows)s) AS i
+    """,
+    """
+    INSERT INTO machine_status_event (machine_id, created_at, status)
+    SELECT %(prefix)s || '_m' || (i %% 20), %(start)s::timestamp + (i::bigint * %(span)s / %(rows)s) * INTERVAL '1 second',
+           (ARRAY['0', '1.0', '2.0'])[1 + i %% 3]
+    FROM generate_series(1, %(rows)s) AS i
+    """,
+    """
+    INSERT INTO token_blacklist (token, token_id, blacklisted_at, expires_at)
+    SELECT %(prefix)s || '_token_' || i, %(prefix)s || '_tid_' || i,
+           %(start)s::timestamp + (i::bigint * %(span)s / %(rows)s) * INTERVAL '1 second',
+           %(start)s::timestamp + (i::bigint * %(span)s / %(rows)s) * INTERVAL '1 second' + INTERVAL '8 hours'
+    FROM generate_series(1, %(rows)s) AS i
+    """,
+]
+
+
+def log_page(table, columns, filters, **kwargs):
+    query, params, _ = build_log_page_query(table, columns, filters, 100, **kwargs)
+    return query, params
+
+
+def endpoint_queries(now):
+    """
+    (nama, query, params) untuk setiap query panas di api.py / main.py / cache.py.
+
+    Query diimpor dari modulnya (konstanta / builder yang sama yang dipakai endpoint), bukan
+    disalin, supaya perubahan SQL di endpoint ikut dicek.
+    """
+    machine = f"{BENCH_PREFIX}_m3"
+    product = f"{BENCH_PREFIX}_p3"
+    day = now.date()
+    cursor = encode_cursor({"created_at": now - timedelta(days=3), "id": 10 ** 9})
+    raw_logs, raw_params, _ = build_machine_log_query(day - timedelta(days=1), day, machine, None)
+    hourly_logs, hourly_params, _ = build_machine_log_query(day - timedelta(days=30), day, machine, 3600)
+    return [
+        ("api verify_token blacklist (fallback saat listener putus)",
+         TOKEN_BLACKLIST_LOOKUP_QUERY, (f"{BENCH_PREFIX}_tid_42",)),
+        ("api /logout purge blacklist", PURGE_TOKEN_BLACKLIST_QUERY, None),
+        ("api /machine/status", MACHINE_STATUS_EVENTS_QUERY,
+         {"machine_id": machine, "start": now - timedelta(days=1), "end": now}),
+        ("api /machine/timeline", TIMELINE_QUERY, {
+            "machine_ids": [machine], "starts": [now - timedelta(days=1)], "ends": [now], "now": now}),
+        ("api /machine/logs/filtered", raw_logs, raw_params),
+        ("api /machine/logs/filtered resolution=1h", hourly_logs, hourly_params),
+        ("api /manpower", MANPOWER_LIST_QUERY, None),
+        ("api /product", PRODUCT_LIST_QUERY, None),
+        ("api /manpower/logs page", *log_page("log_manpower", MANPOWER_LOG_COLUMNS, [])),
+        ("api /manpower/logs before cursor", *log_page("log_manpower", MANPOWER_LOG_COLUMNS, [], before=cursor)),
+        ("api /manpower/logs nik filter", *log_page(
+            "log_manpower", MANPOWER_LOG_COLUMNS, [("nik = %s", f"{BENCH_PREFIX}_nik7")],
+            start=now - timedelta(days=7))),
+        ("api /product/logs page", *log_page("log_product", PRODUCT_LOG_COLUMNS, [])),
+        ("api /product/logs machine+product filter", *log_page(
+            "log_product", PRODUCT_LOG_COLUMNS, [("machine_name = %s", machine), ("name_product = %s", product)])),
+        ("api /work-orders", WORK_ORDERS_QUERY, None),
+        ("api /dashboard/snapshot product logs", DASHBOARD_PRODUCT_LOGS_QUERY, {"since": now - timedelta(hours=6)}),
+        ("main last_product", LAST_PRODUCT_QUERY, None),
+        ("main handle_product last action", LAST_PRODUCT_ACTION_QUERY, (machine, product)),
+        ("main active session", ACTIVE_SESSION_QUERY, (DEFAULT_STATION,)),
+        ("main logout auto-stop", AUTO_STOP_PRODUCTS_QUERY,
+         {"station": DEFAULT_STATION, "nik": f"{BENCH_PREFIX}_nik7"}),
+        ("main status transition", INSERT_STATUS_EVENT_QUERY, {"machine_id": machine, "status": "1.0"}),
+    ]
+
+
+def walk_plan(node):
+    yield node
+    for child in node.get("Plans", []):
+        yield from walk_plan(child)
+
+
+def large_relations(cur, min_rows):
+    """Tabel (termasuk partisi log_machine) yang hasil ANALYZE-nya >= min_rows baris."""
+    cur.execute("""
+        SELECT c.relname
+        FROM pg_class c
+        LEFT JOIN pg_inherits i ON i.inhrelid = c.oid
+        WHERE c.relkind = 'r'
+          AND (c.relname = ANY(%s) OR i.inhparent = 'log_machine'::regclass)
+          AND c.reltuples >= %s
+    """, (SEEDED_TABLES, min_rows))
+    return {row[0] for row in cur.fetchall()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=200000, help="Jumlah baris sintetis per tabel log")
+    parser.add_argument("--days", type=int, default=30, help="Rentang hari data sintetis")
+    parser.add_argument("--min-rows", type=int, default=5000, help="Seq Scan pada tabel sebesar ini dianggap regresi")
+    parser.add_argument("--verbose", action="store_true", help="Cetak plan lengkap setiap query")
+    args = parser.parse_args()
+
+    now = utc_now_naive()
+    seed_params = {
+        "prefix": BENCH_PREFIX,
+        "rows": args.rows,
+        "start": now - timedelta(days=args.days),
+        "now": now,
+        "span": args.days * 86400,
+    }
+
+    conn = psycopg2.connect(**DB_CONFIG)
+    failures = []
+    try:
+        with conn.cursor() as cur:
+            for query in SEED_QUERIES:
+                cur.execute(query, seed_params)
+            for table in SEEDED_TABLES + ["product", "product_state"]:
+                cur.execute(f"ANALYZE {table}")
+            large = large_relations(cur, args.min_rows)
+
+            for name, query, params in endpoint_queries(now):
+                cur.execute("EXPLAIN (FORMAT JSON) " + query, params)
+                plan = cur.fetchone()[0]
+                if isinstance(plan, str):
+                    plan = json.loads(plan)
+                root = plan[0]["Plan"]
+                seq_scans = sorted({
+                    node["Relation Name"] for node in walk_plan(root)
+                    if node.get("Node Type") == "Seq Scan" and node.get("Relation Name") in large
+                })
+                status = "FAIL" if seq_scans else "ok"
+                print(f"[{status:>4}] {name:<45} cost={root['Total Cost']:.0f}"
+                      + (f"  seq scan: {', '.join(seq_scans)}" if seq_scans else ""))
+                if args.verbose:
+                    print(json.dumps(root, indent=2))
+                if seq_scans:
+                    failures.append(name)
+    finally:
+        conn.rollback()
+        conn.close()
+
+    if failures:
+        print(f"\n{len(failures)} query jatuh ke Seq Scan: {', '.join(failures)}")
+        return 1
+    print("\nSemua query memakai index / partition pruning")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,160 @@
+"""
+Load test: banyak station scan badge/product bersamaan lewat topic per station.
+
+Script ini membuat master data sementara (manpower, product per station, nilai EMG=1),
+lalu setiap station menjalankan siklus login -> product start -> product stop -> logout
+secara paralel lewat MQTT (station/<id>/manpower, station/<id>/product) dan mengukur
+waktu sampai feedback di station/<id>/feedback/#. Semua data uji dihapus di akhir.
+
+Jika scan masih diserialkan secara global, total waktu dan p99 naik linear dengan
+jumlah station; dengan state per station keduanya harus tetap mendekati 1 station.
+
+Jalankan saat main.py dan machine_data berjalan (dari folder backend, di dalam container):
+    python scripts/load_test_stations.py --stations 1
+    python scripts/load_test_stations.py --stations 50 --cycles 5
+"""
+import os
+import sys
+import json
+import time
+import queue
+import argparse
+import threading
+
+import psycopg2
+import paho.mqtt.client as mqtt
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from db import DB_CONFIG  # noqa: E402
+from main import MQTT_BROKER, MQTT_PORT, EMG_TAG_NAME  # noqa: E402
+from bench_async_routes import percentile  # noqa: E402
+
+PREFIX = "__load_st"
+
+
+def station_ids(count):
+    return [f"{PREFIX}{i:02d}" for i in range(count)]
+
+
+def operator(station):
+    return {"nik": f"{station}_nik", "name": f"Load Operator {station[len(PREFIX):]}"}
+
+
+def product_name(station):
+    return f"{station}_part"
+
+
+def setup(cur, stations):
+    for station in stations:
+        op = operator(station)
+        cur.execute("INSERT INTO manpower (nik, name) VALUES (%s, %s) ON CONFLICT (nik) DO NOTHING",
+                    (op["nik"], op["name"]))
+        cur.execute("INSERT INTO product (machine_name, name_product) VALUES (%s, %s) ON CONFLICT DO NOTHING",
+                    (station, product_name(station)))
+        # Station hanya diterima BarcodeSystem jika mesinnya ada di master devices
+        cur.execute("INSERT INTO devices (machine_name, serial_number) VALUES (%s, %s) ON CONFLICT DO NOTHING",
+                    (station, f"{station}_sn"))
+
+
+def cleanup(cur):
+    like = PREFIX + "%"
+    cur.execute("DELETE FROM manpower_session WHERE station LIKE %s", (like,))
+    cur.execute("DELETE FROM product_state WHERE machine_name LIKE %s", (like,))
+    cur.execute("DELETE FROM log_product WHERE machine_name LIKE %s", (like,))
+    cur.execute("DELETE FROM log_manpower WHERE nik LIKE %s", (like,))
+    cur.execute("DELETE FROM product WHERE machine_name LIKE %s", (like,))
+    cur.execute("DELETE FROM devices WHERE machine_name LIKE %s", (like,))
+    cur.execute("DELETE FROM manpower WHERE nik LIKE %s", (like,))
+    cur.execute("DELETE FROM log_machine WHERE machine_id LIKE %s", (like,))
+    cur.execute("DELETE FROM log_machine_latest WHERE machine_id LIKE %s", (like,))
+    cur.execute("DELETE FROM machine_status_event WHERE machine_id LIKE %s", (like,))
+
+
+def run_station(client, station, inbox, cycles, timeout, results):
+    op = operator(station)
+    steps = [
+        ("login", f"station/{station}/manpower", op),
+        ("product start", f"station/{station}/product", {"machine_name": station, "name_product": product_name(station)}),
+        ("product stop", f"station/{station}/product", {"machine_name": station, "name_product": product_name(station)}),
+        ("logout", f"station/{station}/manpower", op),
+    ]
+    for _ in range(cycles):
+        for step, topic, payload in steps:
+            started = time.perf_counter()
+            client.publish(topic, json.dumps(payload), qos=1)
+            try:
+                feedback = inbox.get(timeout=timeout)
+            except queue.Empty:
+                results.append((step, None, False))
+                continue
+            results.append((step, (time.perf_counter() - started) * 1000, bool(feedback.get("success"))))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--stations", type=int, default=50)
+    parser.add_argument("--cycles", type=int, default=3, help="Siklus login/start/stop/logout per station")
+    parser.add_argument("--timeout", type=float, default=10, help="Batas tunggu feedback per scan (detik)")
+    parser.add_argument("--settle", type=float, default=3, help="Jeda setelah setup agar cache master data termuat")
+    parser.add_argument("--broker", default=MQTT_BROKER)
+    parser.add_argument("--port", type=int, default=MQTT_PORT)
+    args = parser.parse_args()
+
+    stations = station_ids(args.stations)
+    inboxes = {station: queue.Queue() for station in stations}
+
+    def on_message(client, userdata, msg):
+        station = msg.topic.split("/")[1]
+        if station in inboxes:
+            inboxes[station].put(json.loads(msg.payload.decode()))
+
+    client = mqtt.Client()
+    client.on_message = on_message
+    client.connect(args.broker, args.port, 60)
+    client.subscribe("station/+/feedback/#", qos=1)
+    client.loop_start()
+
+    conn = psycopg2.connect(**DB_CONFIG)
+    try:
+        with conn.cursor() as cur:
+            cleanup(cur)
+            setup(cur, stations)
+        conn.commit()
+        # EMG aktif di setiap mesin uji (logout butuh EMG = 1); lewat topic gateway supaya cache ikut update
+        for station in stations:
+            client.publish(f"{station}/data", json.dumps({"d": [{"tag": EMG_TAG_NAME, "value": 1}]}), qos=1)
+        time.sleep(args.settle)
+
+        results = []
+        started = time.perf_counter()
+        threads = [
+            threading.Thread(target=run_station, args=(client, station, inboxes[station], args.cycles, args.timeout, results))
+            for station in stations
+        ]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        elapsed = time.perf_counter() - started
+    finally:
+        client.loop_stop()
+        client.disconnect()
+        with conn.cursor() as cur:
+            cleanup(cur)
+        conn.commit()
+        conn.close()
+
+    latencies = [ms for _, ms, _ in results if ms is not None]
+    failed = sum(1 for _, ms, ok in results if ms is None or not ok)
+    print(f"{args.stations} station x {args.cycles} siklus: {len(results)} scan dalam {elapsed:.2f} s "
+          f"({len(results) / elapsed:.0f} scan/s), gagal/timeout: {failed}")
+    print(f"feedback latency  p50={percentile(latencies, 50):.1f} ms  p95={percentile(latencies, 95):.1f} ms  "
+          f"p99={percentile(latencies, 99):.1f} ms  max={max(latencies, default=0):.1f} ms")
+    for step in ["login", "product start", "product stop", "logout"]:
+        step_ms = [ms for name, ms, _ in results if name == step and ms is not None]
+        print(f"  {step:<14} p50={percentile(step_ms, 50):.1f} ms  p99={percentile(step_ms, 99):.1f} ms")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,79 @@
+import os
+import logging
+import threading
+
+# ==============================
+# STATION CONFIG
+# ==============================
+# Station = titik scan badge/product di satu mesin; station id sama dengan machine_id mesin tersebut.
+# Topic per station:  station/<station_id>/manpower, station/<station_id>/product
+# Feedback:           station/<station_id>/feedback/manpower, station/<station_id>/feedback/product
+# Command ke mesin:   <station_id>/cmd
+TOPIC_STATION_MANPOWER = "station/+/manpower"
+TOPIC_STATION_PRODUCT = "station/+/product"
+
+# Topic lama (data/manpower, data/product, data/feedback/*, machine_01/cmd) dipetakan ke station ini
+DEFAULT_STATION = os.getenv("DEFAULT_STATION", "default")
+# Batas jumlah station di memori (pengaman tambahan selain cek master devices)
+STATION_MAX = int(os.getenv("STATION_MAX", 1000))
+
+
+class StationState:
+    """State scan satu station. `lock` menyerialkan scan di station ini saja."""
+
+    def __init__(self, station, machine_id, cmd_topic, feedback_manpower, feedback_product):
+        self.station = station
+        # machine_id untuk tag interlock; None = nilai terbaru dari mesin mana pun (station lama)
+        self.machine_id = machine_id
+        self.cmd_topic = cmd_topic
+        self.feedback_manpower = feedback_manpower
+        self.feedback_product = feedback_product
+        self.lock = threading.Lock()
+        self.last_product = None
+
+
+class StationRegistry:
+    """
+    Daftar StationState, dibuat saat scan pertama dari station tersebut.
+
+    Hanya station yang terdaftar (`is_known(station)`, mis. ada di master devices) yang dibuat,
+    dan jumlahnya dibatasi `max_stations`; selain itu get() mengembalikan None, jadi publisher
+    yang salah konfigurasi tidak bisa menambah state tanpa batas atau mengirim ke <station>/cmd.
+    """
+
+    def __init__(self, legacy_cmd_topic, legacy_feedback_manpower, legacy_feedback_product,
+                 is_known=None, max_stations=STATION_MAX):
+        self._lock = threading.Lock()
+        self.is_known = is_known
+        self.max_stations = max_stations
+        self._stations = {
+            DEFAULT_STATION: StationState(DEFAULT_STATION, None, legacy_cmd_topic,
+                                          legacy_feedback_manpower, legacy_feedback_product),
+        }
+
+    def get(self, station):
+        state = self._stations.get(station)
+        if state is not None:
+            return state
+        # Cek di luar lock: is_known bisa query DB
+        if self.is_known and not self.is_known(station):
+            logging.warning(f"Station '{station}' tidak terdaftar di devices, pesan diabaikan")
+            return None
+        with self._lock:
+            state = self._stations.get(station)
+            if state is None:
+                if len(self._stations) >= self.max_stations:
+                    logging.warning(f"Station '{station}' ditolak: jumlah station sudah {self.max_stations} (STATION_MAX)")
+                    return None
+                state = StationState(station, station, f"{station}/cmd",
+                                     f"station/{station}/feedback/manpower", f"station/{station}/feedback/product")
+                self._stations[station] = state
+            return state
+
+
+def station_from_topic(topic):
+    """station/<station_id>/... -> station_id; topic lama -> DEFAULT_STATION."""
+    parts = topic.split("/")
+    if len(parts) >= 3 and parts[0] == "station":
+        return parts[1]
+    return DEFAULT_STATION
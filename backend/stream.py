@@ -0,0 +1,201 @@
+import os
+import json
+import asyncio
+import logging
+from collections import deque
+from datetime import datetime, timezone
+
+import paho.mqtt.client as mqtt
+
+from main import MQTT_BROKER, MQTT_PORT, TOPIC_MACHINE, STATUS_TAG_NAME, DEFAULT_MACHINE_ID
+from cache import format_tag_value
+
+# ==============================
+# STREAM CONFIG
+# ==============================
+# Topic sumber event
+TOPIC_GATEWAY_DATA = "+/data"          # payload gateway: {"ts": ..., "d": [{"tag": ..., "value": ...}]}
+TOPIC_EVENTS = "events/#"              # event hasil BarcodeSystem (product start/stop, manpower login/logout)
+
+# Batas antrean event diskrit per client; kalau penuh, event terlama dibuang dan client diminta resync
+STREAM_CLIENT_QUEUE_SIZE = int(os.getenv("STREAM_CLIENT_QUEUE_SIZE", 500))
+STREAM_KEEPALIVE_SECONDS = float(os.getenv("STREAM_KEEPALIVE_SECONDS", 15))
+
+
+def utc_now_iso():
+    return datetime.now(timezone.utc).replace(tzinfo=None).isoformat()
+
+
+class Subscriber:
+    """
+    Antrean event milik satu client.
+
+    Update tag digabung per (machine_id, tag_name) sehingga client lambat hanya
+    menerima nilai terbaru. Event lain (status, product, manpower) disimpan
+    berurutan dalam antrean terbatas; jika meluap, event terlama dibuang dan
+    client dikirimi event `resync` agar mengambil ulang snapshot.
+    """
+
+    def __init__(self, machine_ids=None, queue_size=STREAM_CLIENT_QUEUE_SIZE):
+        self.machine_ids = set(machine_ids) if machine_ids else None
+        self._tags = {}
+        self._events = deque()
+        self._queue_size = queue_size
+        self._overflowed = False
+        self._wakeup = asyncio.Event()
+
+    def wants(self, event):
+        machine_id = event.get("machine_id")
+        return self.machine_ids is None or machine_id is None or machine_id in self.machine_ids
+
+    def offer(self, event):
+        if not self.wants(event):
+            return
+        if event["type"] == "tag":
+            self._tags[(event["machine_id"], event["tag_name"])] = event
+        else:
+            if len(self._events) >= self._queue_size:
+                self._events.popleft()
+                self._overflowed = True
+            self._events.append(event)
+        self._wakeup.set()
+
+    async def get(self, timeout):
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), timeout)
+        except asyncio.TimeoutError:
+            return []
+        self._wakeup.clear()
+
+        batch = []
+        if self._overflowed:
+            self._overflowed = False
+            batch.append({"type": "resync", "created_at": utc_now_iso()})
+        batch.extend(self._events)
+        batch.extend(self._tags.values())
+        self._events.clear()
+        self._tags.clear()
+        return batch
+
+
+class EventHub:
+    """Subscribe ke MQTT sekali per proses API dan sebarkan event ke semua client stream."""
+
+    def __init__(self):
+        self._loop = None
+        self._client = None
+        self._subscribers = set()
+        self._last_status = {}
+
+    # --- lifecycle ---
+    def start(self, loop):
+        self._loop = loop
+        if hasattr(mqtt, "CallbackAPIVersion"):
+            client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION1)
+        else:
+            client = mqtt.Client()
+        client.on_connect = self._on_connect
+        client.on_message = self._on_message
+        client.reconnect_delay_set(min_delay=1, max_delay=30)
+        try:
+            client.connect_async(MQTT_BROKER, MQTT_PORT, 60)
+            client.loop_start()
+        except Exception as e:
+            logging.error(f"Stream: gagal menghubungkan MQTT ({e})")
+            return
+        self._client = client
+
+    def stop(self):
+        if self._client:
+            self._client.loop_stop()
+            self._client.disconnect()
+            self._client = None
+
+    def seed_status(self, rows):
+        """Isi status terakhir per mesin supaya event status pertama tidak terkirim dobel."""
+        for row in rows:
+            self._last_status[row["machine_id"]] = row["tag_value"]
+
+    # --- subscribers (dipanggil dari event loop) ---
+    def subscribe(self, machine_ids=None):
+        sub = Subscriber(machine_ids)
+        self._subscribers.add(sub)
+        return sub
+
+    def unsubscribe(self, sub):
+        self._subscribers.discard(sub)
+
+    def stats(self):
+        return {"clients": len(self._subscribers), "mqtt_connected": bool(self._client and self._client.is_connected())}
+
+    def _dispatch(self, events):
+        for sub in list(self._subscribers):
+            for event in events:
+                sub.offer(event)
+
+    def publish(self, events):
+        """Thread-safe: dipanggil dari thread jaringan paho."""
+        if events and self._loop is not None and self._subscribers:
+            self._loop.call_soon_threadsafe(self._dispatch, events)
+
+    # --- MQTT callbacks (thread paho) ---
+    def _on_connect(self, client, userdata, flags, rc):
+        if rc == 0:
+            logging.info("✅ Stream: terhubung ke MQTT Broker")
+            client.subscribe([(TOPIC_GATEWAY_DATA, 0), (TOPIC_MACHINE, 0), (TOPIC_EVENTS, 1)])
+        else:
+            logging.error(f"Stream: koneksi MQTT gagal dengan kode {rc}")
+
+    def _tag_events(self, machine_id, tag_name, tag_value, recorded_at=None):
+        # Format sama dengan yang disimpan ingest, jadi sama dengan snapshot REST / status awal dari DB
+        tag_value = format_tag_value(tag_value)
+        events = [{
+            "type": "tag",
+            "machine_id": machine_id,
+            "tag_name": tag_name,
+            "tag_value": tag_value,
+            "recorded_at": recorded_at,
+            "created_at": utc_now_iso(),
+        }]
+        if tag_name == STATUS_TAG_NAME and tag_value is not None:
+            status = tag_value
+            if self._last_status.get(machine_id) != status:
+                self._last_status[machine_id] = status
+                events.append({
+                    "type": "status",
+                    "machine_id": machine_id,
+                    "status": status,
+                    "created_at": utc_now_iso(),
+                })
+        return events
+
+    def _on_message(self, client, userdata, msg):
+        try:
+            payload = json.loads(msg.payload.decode())
+        except Exception:
+            return
+        if not isinstance(payload, dict):
+            return
+
+        events = []
+        if msg.topic.startswith("events/"):
+            if payload.get("type"):
+                events.append(payload)
+        elif msg.topic == TOPIC_MACHINE:
+            if payload.get("tag_name"):
+                machine_id = payload.get("machine_id") or DEFAULT_MACHINE_ID
+                events.extend(self._tag_events(machine_id, payload["tag_name"], payload.get("tag_value")))
+        elif msg.topic.endswith("/data"):
+            machine_id = msg.topic.split("/")[0]
+            for item in payload.get("d", []) or []:
+                if isinstance(item, dict) and item.get("tag"):
+                    events.extend(self._tag_events(machine_id, item["tag"], item.get("value"), payload.get("ts")))
+
+        self.publish(events)
+
+
+hub = EventHub()
+
+
+def format_sse(event):
+    return f"event: {event['type']}\ndata: {json.dumps(event, default=str)}\n\n"
@@ -0,0 +1,108 @@
+from datetime import datetime, timezone
+
+from psycopg2.extras import RealDictCursor
+
+NO_DATA = "NO DATA"
+
+# Segmen timeline dihitung langsung di SQL dari machine_status_event:
+# untuk setiap (mesin, range) ambil status terakhir sebelum start + transisi di dalam range,
+# lalu akhir segmen = transisi berikutnya, dipotong ke [start, min(end, now)].
+TIMELINE_QUERY = """
+WITH ranges AS (
+    SELECT r.ord, r.range_start, r.range_end
+    FROM unnest(%(starts)s::timestamp[], %(ends)s::timestamp[])
+         WITH ORDINALITY AS r(range_start, range_end, ord)
+),
+machines AS (
+    SELECT DISTINCT unnest(%(machine_ids)s::text[]) AS machine_id
+),
+events AS (
+    SELECT m.machine_id, r.ord, r.range_start, r.range_end, e.created_at, e.status
+    FROM machines m
+    CROSS JOIN ranges r
+    CROSS JOIN LATERAL (
+        (SELECT created_at, status
+         FROM machine_status_event
+         WHERE machine_id = m.machine_id AND created_at <= r.range_start
+         ORDER BY created_at DESC, id DESC
+         LIMIT 1)
+        UNION ALL
+        (SELECT created_at, status
+         FROM machine_status_event
+         WHERE machine_id = m.machine_id AND created_at > r.range_start AND created_at < r.range_end)
+    ) e
+),
+segments AS (
+    SELECT
+        machine_id, ord, status,
+        GREATEST(created_at, range_start) AS seg_start,
+        LEAST(COALESCE(LEAD(created_at) OVER w, range_end), range_end, %(now)s::timestamp) AS seg_end
+    FROM events
+    WINDOW w AS (PARTITION BY machine_id, ord ORDER BY created_at)
+)
+SELECT machine_id, ord, status, seg_start, seg_end,
+       EXTRACT(EPOCH FROM seg_end - seg_start)::float8 AS seconds
+FROM segments
+WHERE seg_end > seg_start
+ORDER BY machine_id, ord, seg_start
+"""
+
+
+def utc_now_naive():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def _segment(start, end, status):
+    return {"start": start, "end": end, "status": status, "seconds": (end - start).total_seconds()}
+
+
+def compute_timelines(conn, machine_ids, ranges, now=None):
+    """
+    Hitung timeline status per mesin untuk beberapa range sekaligus.
+
+    `ranges` adalah list (start, end) berupa datetime UTC naive. Hasilnya
+    {machine_id: [ {start, end, segments, totals}, ... ]} dengan urutan range
+    sama seperti input. Bagian range tanpa data (sebelum transisi pertama atau
+    setelah `now`) diisi segmen NO DATA, sama seperti perhitungan di dashboard.
+    """
+    now = now or utc_now_naive()
+    params = {
+        "machine_ids": list(machine_ids),
+        "starts": [start for start, _ in ranges],
+        "ends": [end for _, end in ranges],
+        "now": now,
+    }
+    with conn.cursor(cursor_factory=RealDictCursor) as cur:
+        cur.execute(TIMELINE_QUERY, params)
+        rows = cur.fetchall()
+
+    grouped = {}
+    for row in rows:
+        grouped.setdefault((row["machine_id"], row["ord"]), []).append(row)
+
+    result = {}
+    for machine_id in dict.fromkeys(machine_ids):
+        per_range = []
+        for ord_, (range_start, range_end) in enumerate(ranges, start=1):
+            segments = []
+            cursor = range_start
+            for row in grouped.get((machine_id, ord_), []):
+                if row["seg_start"] > cursor:
+                    segments.append(_segment(cursor, row["seg_start"], NO_DATA))
+                segments.append({
+                    "start": row["seg_start"],
+                    "end": row["seg_end"],
+                    "status": row["status"],
+                    "seconds": row["seconds"],
+                })
+                cursor = row["seg_end"]
+            if cursor < range_end:
+                segments.append(_segment(cursor, range_end, NO_DATA))
+
+            totals = {}
+            for seg in segments:
+                totals[seg["status"]] = totals.get(seg["status"], 0.0) + seg["seconds"]
+
+            per_range.append({"start": range_start, "end": range_end, "segments": segments, "totals": totals})
+        result[machine_id] = per_range
+    return result
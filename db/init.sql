@@ -1,3 +1,6 @@
+-- Skema dasar untuk database baru. Perubahan skema setelahnya ada di
+-- backend/migrations/ dan dijalankan oleh backend/migrate.py saat container backend start.
+
 CREATE TABLE IF NOT EXISTS manpower (
     id SERIAL PRIMARY KEY,
     nik VARCHAR(50) NOT NULL UNIQUE,
@@ -19,7 +19,7 @@ import StatCard from "../components/StatCard";
 import DeviceCard from "../components/DeviceCard";
 
 // API Imports
-import { getMachineLogs, getProductList, getManpowerList, getProductLogs, getFilteredMachineLogs, getDeviceList, getMachineStatusEvents, getWorkOrders } from "../services/api";
+import { getFilteredMachineLogs, getMachineTimelines, getDashboardSnapshot, openLiveStream } from "../services/api";
 
 // --- STATIC HELPERS (Does not use State) ---
 
@@ -76,6 +76,12 @@ const formatTime = (seconds) => {
   return `${h.toString().padStart(2, '0')}:${m.toString().padStart(2, '0')}:${s.toString().padStart(2, '0')}`;
 };
 
+// Polling cepat hanya dipakai saat live stream tidak tersambung
+const POLL_INTERVAL_MS = 5000;
+const POLL_INTERVAL_STREAMING_MS = 60000;
+const TAG_RENDER_THROTTLE_MS = 250;
+const REFRESH_DEBOUNCE_MS = 1000;
+
 const parseUTC = (dateString) => {
   if (!dateString) return new Date();
   return new Date(dateString.endsWith("Z") ? dateString : dateString + "Z");
@@ -159,6 +165,11 @@ export default function Dashboard() {
   const [maxScroll, setMaxScroll] = useState(0);
 
   const gridWrapperRef = useRef(null);
+
+  const snapshotRef = useRef(null);
+  const fetchRef = useRef(null);
+  const applyRef = useRef(null);
+  const [streamConnected, setStreamConnected] = useState(false);
   
   const updateScrollState = () => {
     if (gridWrapperRef.current) {
@@ -205,104 +216,37 @@ export default function Dashboard() {
   };
 
   // --- LOGIC FUNCTIONS ---
-  const calculateTimelineFromEvents = (events, startObj, endObj) => {
-    let runningTime = 0;
-    let standbyTime = 0;
-    let stopTime = 0;
-    let segments = [];
-
-    const validEvents = events.filter(e => {
-        const t = parseUTC(e.created_at);
-        return t <= endObj; 
-    }).sort((a, b) => parseUTC(a.created_at) - parseUTC(b.created_at));
-
-    if (validEvents.length === 0) {
+  // Ubah hasil /machine/timeline (segmen & total detik per status) ke format chart
+  const buildTimeline = (rangeResult) => {
+    const timeline = (rangeResult?.segments || []).map(seg => {
+        const start = parseUTC(seg.start);
+        const end = parseUTC(seg.end);
+        const style = seg.status === "NO DATA" ? STATUS_CONFIG["NO DATA"] : getStatusStyle(seg.status);
         return {
-            timeline: [{
-                start: startObj, 
-                end: endObj,
-                startFmt: startObj.toTimeString().slice(0, 5),
-                endFmt: endObj.toTimeString().slice(0, 5),
-                status: "NO DATA",
-                color: STATUS_CONFIG["NO DATA"].color,
-                duration: (endObj - startObj) / 1000
-            }],
-            summary: { running: formatTime(0), standby: formatTime(0), stop: formatTime(0), total: formatTime(0) }
-        };
-    }
-
-    const firstEventTime = parseUTC(validEvents[0].created_at);
-    if (firstEventTime > startObj) {
-        segments.push({
-            start: startObj,
-            end: firstEventTime,
-            startFmt: startObj.toTimeString().slice(0, 5),
-            endFmt: firstEventTime.toTimeString().slice(0, 5),
-            status: "NO DATA",
-            color: STATUS_CONFIG["NO DATA"].color,
-            duration: (firstEventTime - startObj) / 1000
-        });
-    }
-
-    for (let i = 0; i < validEvents.length; i++) {
-        const currentEvent = validEvents[i];
-        const nextEvent = validEvents[i + 1];
-
-        let startTime = parseUTC(currentEvent.created_at);
-        if (startTime < startObj) startTime = startObj;
-
-        let endTime;
-        let futureSegment = null;
-
-        if (nextEvent) {
-            endTime = parseUTC(nextEvent.created_at);
-        } else {
-            const now = new Date();
-            if (endObj > now) {
-                endTime = now;
-                if (endTime < endObj) {
-                    futureSegment = {
-                        start: endTime,
-                        end: endObj,
-                        startFmt: endTime.toTimeString().slice(0, 5),
-                        endFmt: endObj.toTimeString().slice(0, 5),
-                        status: "NO DATA",
-                        color: STATUS_CONFIG["NO DATA"].color,
-                        duration: (endObj - endTime) / 1000
-                    };
-                }
-            } else {
-                endTime = endObj; 
-            }
-        }
-
-        if (startTime >= endTime) continue;
-
-        const duration = (endTime - startTime) / 1000;
-        const statusVal = parseFloat(currentEvent.machine_status || currentEvent.status);
-        const style = getStatusStyle(statusVal);
-
-        if (statusVal === 2.0) runningTime += duration;
-        else if (statusVal === 1.0) standbyTime += duration;
-        else stopTime += duration;
-
-        segments.push({
-            start: startTime,
-            end: endTime,
-            startFmt: startTime.toTimeString().slice(0, 5),
-            endFmt: endTime.toTimeString().slice(0, 5),
+            start: start,
+            end: end,
+            startFmt: start.toTimeString().slice(0, 5),
+            endFmt: end.toTimeString().slice(0, 5),
             status: style.label,
             color: style.color,
-            duration: duration
-        });
+            duration: seg.seconds
+        };
+    });
 
-        if (futureSegment) {
-            segments.push(futureSegment);
-        }
-    }
+    let runningTime = 0;
+    let standbyTime = 0;
+    let stopTime = 0;
+
+    Object.entries(rangeResult?.totals || {}).forEach(([status, seconds]) => {
+        if (status === "NO DATA") return;
+        const statusVal = parseFloat(status);
+        if (statusVal === 2.0) runningTime += seconds;
+        else if (statusVal === 1.0) standbyTime += seconds;
+        else stopTime += seconds;
+    });
 
     return {
-        timeline: segments,
+        timeline: timeline,
         summary: {
             running: formatTime(runningTime),
             standby: formatTime(standbyTime),
@@ -312,6 +256,11 @@ export default function Dashboard() {
     };
   };
 
+  const fetchDeviceTimeline = async (machineId, startObj, endObj) => {
+    const result = await getMachineTimelines([machineId], [{ start: startObj, end: endObj }]);
+    return buildTimeline(result?.[machineId]?.[0]);
+  };
+
   const getHistoryRows = (timeline, productLogs, machineId) => {
     const deviceProductLogs = productLogs
       .filter(log => log.machine_name === machineId)
@@ -376,11 +325,18 @@ export default function Dashboard() {
     });
 
     // 2. Add a tiny timeout so the spinner renders before the math freezes the UI
-    setTimeout(() => {
+    setTimeout(async () => {
       const startObj = new Date(modalStartDate);
       const endObj = new Date(modalEndDate);
 
-      const newHistory = calculateTimelineFromEvents(selectedDevice.rawEvents, startObj, endObj);
+      let newHistory;
+      try {
+        newHistory = await fetchDeviceTimeline(selectedDevice.deviceName, startObj, endObj);
+      } catch (error) {
+        console.error("Failed to fetch timeline:", error);
+        Swal.fire({ icon: 'error', title: 'Error', text: 'Failed to fetch timeline' });
+        return;
+      }
       const newRows = getHistoryRows(newHistory.timeline, globalProductLogs, selectedDevice.deviceName);
 
       setModalData(prev => ({
@@ -483,26 +439,34 @@ export default function Dashboard() {
          return;
       }
       
-      const [machineLogs, manpowerData, partsData, productLogs, registeredDevices, workOrdersData] = await Promise.all([
-              getMachineLogs(), 
-              getManpowerList(),
-              getProductList(),
-              getProductLogs(),
-              getDeviceList(),
-              getWorkOrders()
-            ]);
-
-      setGlobalProductLogs(productLogs);
-
-      const timelinePromises = registeredDevices.map(device => 
-          getMachineStatusEvents(device.machine_name)
+      // Satu request untuk semua data dashboard (mesin, log product, timeline, jumlah data)
+      const snapshot = await getDashboardSnapshot(
+          { start: startObj, end: endObj },
+          { start: compStartObj, end: compEndObj }
       );
-      const allEvents = await Promise.all(timelinePromises);
+      snapshotRef.current = snapshot;
+      applySnapshot(snapshot);
+
+    } catch (error) {
+      console.error("Sync Error:", error);
+      setLoading(false);
       
-      const eventsByMachine = {};
-      registeredDevices.forEach((dev, idx) => {
-          eventsByMachine[dev.machine_name] = allEvents[idx];
-      });
+      setTimeout(() => {
+        if (Swal.isVisible() && Swal.getTitle()?.textContent === 'Updating Dashboard...') {
+            Swal.fire({ icon: 'error', title: 'Error', text: 'Failed to fetch data' });
+        }
+      }, 300);
+    }
+  };
+
+  // Hitung ulang kartu device dari snapshot (dipanggil setelah fetch & setiap ada update tag live)
+  const applySnapshot = (snapshot) => {
+      const machineLogs = snapshot.machine_logs;
+      const productLogs = snapshot.product_logs;
+      const registeredDevices = snapshot.devices;
+      const timelinesByMachine = snapshot.timelines;
+
+      setGlobalProductLogs(productLogs);
 
       const pivotByMachine = {};
       machineLogs.forEach((log) => {
@@ -517,10 +481,10 @@ export default function Dashboard() {
         const currentData = pivotByMachine[machineId] || {};
         const rawStatus = currentData["Machine_Status"];
         const statusObj = getStatusStyle(rawStatus) || STATUS_CONFIG[0];
-        const deviceEvents = eventsByMachine[machineId] || [];
+        const [mainRange, compRange] = timelinesByMachine[machineId] || [];
         
-        const mainTimeline = calculateTimelineFromEvents(deviceEvents, startObj, endObj);
-        const compTimeline = calculateTimelineFromEvents(deviceEvents, compStartObj, compEndObj);
+        const mainTimeline = buildTimeline(mainRange);
+        const compTimeline = buildTimeline(compRange);
 
         const deviceProductLogs = productLogs
         .filter(log => log.machine_name === machineId)
@@ -546,7 +510,6 @@ export default function Dashboard() {
           name: device.machine_name.replace(/_/g, " ").toUpperCase(),
           deviceName: machineId,
           serialNumber: device.serial_number,
-          rawEvents: deviceEvents,
 
           status: currentData["WISE4010:Green_Lamp"] === "1" ? "Active" : "Warning",
           deviceStatus: statusObj.label,
@@ -571,12 +534,7 @@ export default function Dashboard() {
         };
       });
 
-      setCounts({
-        manpower: manpowerData?.length || 0,
-        parts: partsData?.length || 0,
-        machines: registeredDevices?.length || 0,
-        workOrders: workOrdersData?.length || 0
-      });
+      setCounts(snapshot.counts);
 
       setDevices(mappedDevices);
       setLoading(false);
@@ -586,25 +544,67 @@ export default function Dashboard() {
             Swal.close();
         }
       }, 300);
-
-    } catch (error) {
-      console.error("Sync Error:", error);
-      setLoading(false);
-      
-      setTimeout(() => {
-        if (Swal.isVisible() && Swal.getTitle()?.textContent === 'Updating Dashboard...') {
-            Swal.fire({ icon: 'error', title: 'Error', text: 'Failed to fetch data' });
-        }
-      }, 300);
-    }
   };
+
+  // Ref ke versi terbaru fungsi di atas, supaya handler live stream tidak memakai state lama
+  useEffect(() => {
+    fetchRef.current = fetchDashboardData;
+    applyRef.current = applySnapshot;
+  });
+
   useEffect(() => {
     fetchDashboardData();
-    const interval = setInterval(fetchDashboardData, 5000);
+    const interval = setInterval(fetchDashboardData, streamConnected ? POLL_INTERVAL_STREAMING_MS : POLL_INTERVAL_MS);
     return () => clearInterval(interval);
-  }, [startDate, endDate, comparisonStartDate, comparisonEndDate]);
+  }, [startDate, endDate, comparisonStartDate, comparisonEndDate, streamConnected]);
+
+  // --- LIVE STREAM ---
+  useEffect(() => {
+    let tagTimer = null;
+    let refreshTimer = null;
+
+    const handleLiveEvent = (type, event) => {
+      if (type === "tag") {
+        const snapshot = snapshotRef.current;
+        if (!snapshot) return;
+        const existing = snapshot.machine_logs.find(
+          log => log.machine_id === event.machine_id && log.tag_name === event.tag_name
+        );
+        if (existing) {
+          existing.tag_value = event.tag_value;
+          existing.created_at = event.created_at;
+        } else {
+          snapshot.machine_logs.push({
+            machine_id: event.machine_id,
+            tag_name: event.tag_name,
+            tag_value: event.tag_value,
+            created_at: event.created_at
+          });
+        }
+        if (!tagTimer) {
+          tagTimer = setTimeout(() => {
+            tagTimer = null;
+            if (snapshotRef.current) applyRef.current(snapshotRef.current);
+          }, TAG_RENDER_THROTTLE_MS);
+        }
+        return;
+      }
+
+      // Status / product / manpower berubah: timeline & part aktif perlu diambil ulang
+      clearTimeout(refreshTimer);
+      refreshTimer = setTimeout(() => fetchRef.current(), REFRESH_DEBOUNCE_MS);
+    };
+
+    const closeStream = openLiveStream(handleLiveEvent, setStreamConnected);
 
-  const handleViewDetails = (device) => {
+    return () => {
+      clearTimeout(tagTimer);
+      clearTimeout(refreshTimer);
+      closeStream();
+    };
+  }, []);
+
+  const handleViewDetails = async (device) => {
     setSelectedDevice(device);
     
     const start = getStartOfDayDateTime();
@@ -612,7 +612,12 @@ export default function Dashboard() {
     setModalStartDate(start);
     setModalEndDate(end);
 
-    const history = calculateTimelineFromEvents(device.rawEvents, new Date(start), new Date(end));
+    let history = { timeline: device.chartTimeline, summary: device.statusSummary };
+    try {
+      history = await fetchDeviceTimeline(device.deviceName, new Date(start), new Date(end));
+    } catch (error) {
+      console.error("Failed to fetch timeline:", error);
+    }
     const historyRows = getHistoryRows(history.timeline, globalProductLogs, device.deviceName);
 
     setModalData({
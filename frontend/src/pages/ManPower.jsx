@@ -15,11 +15,13 @@ import dayjs from 'dayjs';
 // MODAL LIB
 import Swal from "sweetalert2";
 
+// Jumlah log history yang diambil per operator (dari server, terbaru dulu)
+const HISTORY_PAGE_SIZE = 500;
+
 export default function ManPower() {
   const [searchQuery, setSearchQuery] = useState("");
   const [loading, setLoading] = useState(true);
   const [manPowerData, setManPowerData] = useState([]);
-  const [allLogs, setAllLogs] = useState([]);
   
   // History Modal & Filter States
   const [showHistoryModal, setShowHistoryModal] = useState(false);
@@ -55,15 +57,10 @@ export default function ManPower() {
   const loadData = async () => {
     try {
       setLoading(true);
-      const [master, logs] = await Promise.all([
-        getManpowerList(),
-        getManpowerLogs()
-      ]);
-
-      setAllLogs(logs);
+      // Status login/logout terakhir sudah dihitung server di /manpower
+      const master = await getManpowerList();
 
       const merged = master.map((p, i) => {
-        const lastLog = logs.find(l => String(l.nik) === String(p.nik));
         return {
           id: i + 1,
           no: i + 1,
@@ -71,7 +68,7 @@ export default function ManPower() {
           nik: p.nik,
           department: p.department || "Engineering",
           position: p.position || "Staff",
-          status: lastLog ? lastLog.status : "logout"
+          status: p.status || "logout"
         };
       });
       setManPowerData(merged);
@@ -132,10 +129,21 @@ export default function ManPower() {
   };
 
   // --- 3. HISTORY LOGIC ---
-  const handleViewHistory = (person) => {
-    const history = allLogs.filter(l => String(l.nik) === String(person.nik));
+  const fetchHistory = async (nik, start, end) => {
+    try {
+      const page = await getManpowerLogs({ nik, start, end, limit: HISTORY_PAGE_SIZE });
+      return page.items || [];
+    } catch (err) {
+      console.error("History Error:", err);
+      return [];
+    }
+  };
+
+  const handleViewHistory = async (person) => {
+    const history = await fetchHistory(person.nik);
     setSelectedHistory({
       name: person.name,
+      nik: person.nik,
       logs: history
     });
     
@@ -170,8 +178,10 @@ export default function ManPower() {
       }
     });
 
-    // 3. Tiny delay so the spinner actually renders before state updates
-    setTimeout(() => {
+    // 3. Ambil history di rentang filter dari server, lalu terapkan filter aktif
+    setTimeout(async () => {
+      const history = await fetchHistory(selectedHistory.nik, new Date(historyStart), new Date(historyEnd));
+      setSelectedHistory(prev => ({ ...prev, logs: history }));
       setActiveHistoryStart(historyStart);
       setActiveHistoryEnd(historyEnd);
       
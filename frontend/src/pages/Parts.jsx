@@ -17,12 +17,14 @@ import dayjs from 'dayjs';
 import { getProductList, getProductLogs } from "../services/api";
 import Swal from "sweetalert2";
 
+// Jumlah log history yang diambil per part (dari server, terbaru dulu)
+const HISTORY_PAGE_SIZE = 500;
+
 export default function Parts() {
   // --- 1. STATE MANAGEMENT ---
   const [searchQuery, setSearchQuery] = useState("");
   const [loading, setLoading] = useState(true);
   const [partsData, setPartsData] = useState([]);
-  const [allLogs, setAllLogs] = useState([]);
   
   // Modals State
   const [showQrModal, setShowQrModal] = useState(false);
@@ -68,25 +70,18 @@ export default function Parts() {
     try {
       setLoading(true);
       
-      const [productsData, logsData] = await Promise.all([
-        getProductList(),
-        getProductLogs(),
-      ]);
+      // Aksi terakhir tiap part (last_action) sudah dihitung server di /product
+      const productsData = await getProductList();
 
       const mappedProducts = productsData.map((item, index) => {
-        const partLogs = logsData
-          .filter(log => log.machine_name === item.machine_name && log.name_product === item.name_product)
-          .sort((a, b) => new Date(b.created_at) - new Date(a.created_at));
-
         return {
           ...item,
           no: index + 1,
-          status: partLogs.length > 0 ? partLogs[0].action : "not working",
+          status: item.last_action || "not working",
         };
       });
 
       setPartsData(mappedProducts);
-      setAllLogs(logsData);
     } catch (error) {
       console.error("Error fetching data:", error);
       Swal.fire('Error', 'Failed to fetch data from server.', 'error');
@@ -276,10 +271,24 @@ export default function Parts() {
   };
 
   // --- HISTORY LOGIC ---
-  const handleViewHistory = (part) => {
-    const specificHistory = allLogs.filter(
-      (log) => log.machine_name === part.machine_name && log.name_product === part.name_product
-    );
+  const fetchHistory = async (machineName, nameProduct, start, end) => {
+    try {
+      const page = await getProductLogs({
+        machine_name: machineName,
+        name_product: nameProduct,
+        start,
+        end,
+        limit: HISTORY_PAGE_SIZE
+      });
+      return page.items || [];
+    } catch (error) {
+      console.error("History Error:", error);
+      return [];
+    }
+  };
+
+  const handleViewHistory = async (part) => {
+    const specificHistory = await fetchHistory(part.machine_name, part.name_product);
     setSelectedPartHistory({ nama: part.name_product, machine: part.machine_name, history: specificHistory });
     setHistoryStart(""); setHistoryEnd(""); setActiveHistoryStart(""); setActiveHistoryEnd("");
     setShowHistoryModal(true);
@@ -306,8 +315,15 @@ export default function Parts() {
         }
       });
   
-      // 3. Tiny delay so the spinner actually renders before state updates
-      setTimeout(() => {
+      // 3. Ambil history di rentang filter dari server, lalu terapkan filter aktif
+      setTimeout(async () => {
+        const history = await fetchHistory(
+          selectedPartHistory.machine,
+          selectedPartHistory.nama,
+          new Date(historyStart),
+          new Date(historyEnd)
+        );
+        setSelectedPartHistory(prev => ({ ...prev, history }));
         setActiveHistoryStart(historyStart);
         setActiveHistoryEnd(historyEnd);
         
@@ -37,8 +37,19 @@ export const getProductList = async () => {
     const response = await fetchWithAuth(`${BASE_URL}/product`);
     return await response.json();
 };
-export const getManpowerLogs = async () => {
-  const response = await fetchWithAuth(`${BASE_URL}/manpower/logs`);
+// Log dipaginasi dengan cursor: { items, next_cursor, prev_cursor }
+// params: limit, before / after (cursor), filter (nik / machine_name / name_product), start / end (Date)
+const buildLogQuery = (params = {}) => {
+  const query = new URLSearchParams();
+  Object.entries(params).forEach(([key, value]) => {
+    if (value === undefined || value === null || value === "") return;
+    query.append(key, value instanceof Date ? value.toISOString() : value);
+  });
+  return query.toString();
+};
+
+export const getManpowerLogs = async (params = {}) => {
+  const response = await fetchWithAuth(`${BASE_URL}/manpower/logs?${buildLogQuery(params)}`);
   return await response.json();
 };
 
@@ -47,12 +58,12 @@ export const getWorkOrders = async () => {
   return await response.json();
 };
 
-export const getProductLogs = async () => {
+export const getProductLogs = async (params = {}) => {
   // Kita tambahkan "?t=" + waktu sekarang.
   // Ini trik supaya browser & server merasa ini adalah permintaan "baru" 
   // dan terpaksa memberikan data paling update (Real-time).
   const timestamp = new Date().getTime();
-  const response = await fetchWithAuth(`${BASE_URL}/product/logs?t=${timestamp}`, {
+  const response = await fetchWithAuth(`${BASE_URL}/product/logs?${buildLogQuery({ ...params, t: timestamp })}`, {
     headers: {
       "Cache-Control": "no-cache",
       "Pragma": "no-cache"
@@ -62,8 +73,9 @@ export const getProductLogs = async () => {
 };
 
 // Get filtered machine logs for export
-export const getFilteredMachineLogs = async (startDate, endDate, machineId) => {
-  const response = await fetchWithAuth(`${BASE_URL}/machine/logs/filtered?start_date=${startDate}&end_date=${endDate}&machine_id=${machineId}`);
+// resolution: "raw" (default), "auto", atau ukuran bucket seperti "5m" / "1h" (diambil dari tabel rollup)
+export const getFilteredMachineLogs = async (startDate, endDate, machineId, resolution = "raw") => {
+  const response = await fetchWithAuth(`${BASE_URL}/machine/logs/filtered?start_date=${startDate}&end_date=${endDate}&machine_id=${machineId}&resolution=${resolution}`);
   return await response.json();
 };
 
@@ -128,11 +140,84 @@ export const changePassword = async (username, oldPassword, newPassword) => {
   return await response.json();
 };
 
-export const getMachineStatusEvents = async (machineId) => {
-  const res = await fetchWithAuth(`${BASE_URL}/machine/status?machine_id=${machineId}`);
+// start / end (Date, opsional): hanya transisi di rentang ini + status terakhir sebelum start
+export const getMachineStatusEvents = async (machineId, start, end) => {
+  const params = new URLSearchParams({ machine_id: machineId });
+  if (start) params.append("start", start.toISOString());
+  if (end) params.append("end", end.toISOString());
+  const res = await fetchWithAuth(`${BASE_URL}/machine/status?${params.toString()}`);
+  return res.json();
+};
+
+// Timeline status (segmen + total detik per status) untuk beberapa mesin & range sekaligus
+export const getMachineTimelines = async (machineIds, ranges) => {
+  const res = await fetchWithAuth(`${BASE_URL}/machine/timeline`, {
+    method: "POST",
+    headers: { "Content-Type": "application/json" },
+    body: JSON.stringify({
+      machine_ids: machineIds,
+      ranges: ranges.map(r => ({ start: r.start.toISOString(), end: r.end.toISOString() }))
+    })
+  });
   return res.json();
 };
 
+// Semua data dashboard (devices, tag terakhir, log product, timeline, counts) dalam satu request
+export const getDashboardSnapshot = async (mainRange, comparisonRange) => {
+  const toRange = (r) => ({ start: r.start.toISOString(), end: r.end.toISOString() });
+  const res = await fetchWithAuth(`${BASE_URL}/dashboard/snapshot`, {
+    method: "POST",
+    headers: { "Content-Type": "application/json" },
+    body: JSON.stringify({
+      main: toRange(mainRange),
+      comparison: comparisonRange ? toRange(comparisonRange) : null
+    })
+  });
+  return res.json();
+};
+
+// Live update (tag, status, product, manpower) dari backend lewat Server-Sent Events.
+// EventSource tidak bisa mengirim header, jadi stream dibuka dengan ticket berumur pendek
+// (POST /stream/ticket), bukan token login. Ticket hanya berlaku untuk membuka koneksi, jadi
+// setiap kali koneksi putus diambil ticket baru. Mengembalikan fungsi untuk menutup stream.
+const STREAM_RETRY_MS = 3000;
+
+export const openLiveStream = (onEvent, onStatus = () => {}, machineIds = []) => {
+  let source = null;
+  let retryTimer = null;
+  let closed = false;
+
+  const connect = async () => {
+    try {
+      const res = await fetchWithAuth(`${BASE_URL}/stream/ticket`, { method: "POST" });
+      const { ticket } = await res.json();
+      if (closed) return;
+      const params = new URLSearchParams({ ticket });
+      machineIds.forEach(id => params.append("machine_id", id));
+      source = new EventSource(`${BASE_URL}/stream?${params.toString()}`);
+      source.onopen = () => onStatus(true);
+      source.onerror = () => {
+        onStatus(false);
+        source.close();
+        if (!closed) retryTimer = setTimeout(connect, STREAM_RETRY_MS);
+      };
+      ["tag", "status", "product", "manpower", "resync"].forEach(type => {
+        source.addEventListener(type, (e) => onEvent(type, JSON.parse(e.data)));
+      });
+    } catch {
+      onStatus(false);
+      if (!closed) retryTimer = setTimeout(connect, STREAM_RETRY_MS);
+    }
+  };
+
+  connect();
+  return () => {
+    closed = true;
+    clearTimeout(retryTimer);
+    if (source) source.close();
+  };
+};
+
 export const logoutUserAPI = async () => {
   const token = sessionStorage.getItem("token");
   if (token) {
@@ -0,0 +1,91 @@
+"""
+Benchmark: throughput insert log_machine, commit per pesan vs micro-batch (INSERT dan COPY).
+
+Payload sintetis (--tags tag per pesan) ditulis dengan save_batch() milik
+machine_data.py memakai machine_id khusus benchmark, lalu semua barisnya
+dihapus lagi di akhir. Mode yang dibandingkan:
+
+  * per message  - satu transaksi per pesan (perilaku lama)
+  * batch insert - micro-batch, execute_values INSERT
+  * batch copy   - micro-batch, COPY ... FROM STDIN
+
+Contoh (di dalam container machine_data):
+    python bench_batching.py --messages 2000 --tags 20 --batch-rows 5000
+"""
+import json
+import time
+import argparse
+
+import machine_data
+from machine_data import save_batch, get_db_connection, utc_now
+from decode import decode_payload
+
+BENCH_MACHINE_ID = "__bench_batching"
+
+
+def make_payloads(count, tags):
+    return [
+        json.dumps({
+            "ts": f"2026-01-01T00:00:{i % 60:02d}",
+            "d": [{"tag": f"tag_{t}", "value": (i * tags + t) % 1000} for t in range(tags)],
+        })
+        for i in range(count)
+    ]
+
+
+def decode_for_bench(payloads):
+    messages = []
+    for payload in payloads:
+        rows, _ = decode_payload(BENCH_MACHINE_ID, payload, utc_now())
+        messages.append(rows)
+    return messages
+
+
+def cleanup():
+    connection = get_db_connection()
+    with connection.cursor() as cur:
+        for table in ("log_machine", "log_machine_latest", "machine_status_event"):
+            cur.execute(f"DELETE FROM {table} WHERE machine_id = %s", (BENCH_MACHINE_ID,))
+    connection.commit()
+
+
+def run(messages, batch_rows):
+    started = time.perf_counter()
+    batch, rows = [], 0
+    for message in messages:
+        batch.append(message)
+        rows += len(message)
+        if rows >= batch_rows:
+            save_batch(batch)
+            batch, rows = [], 0
+    if batch:
+        save_batch(batch)
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--tags", type=int, default=20)
+    parser.add_argument("--batch-rows", type=int, default=machine_data.BATCH_MAX_ROWS)
+    args = parser.parse_args()
+
+    messages = decode_for_bench(make_payloads(args.messages, args.tags))
+    total_rows = sum(len(m) for m in messages)
+    try:
+        modes = (
+            ("per message", 1, "insert"),
+            ("batch insert", args.batch_rows, "insert"),
+            ("batch copy", args.batch_rows, "copy"),
+        )
+        for name, batch_rows, ingest_mode in modes:
+            machine_data.INGEST_MODE = ingest_mode
+            elapsed = run(messages, batch_rows)
+            print(f"{name:<14} {total_rows} rows in {elapsed:6.2f} s  ->  {total_rows / elapsed:10.0f} rows/s")
+            cleanup()
+    finally:
+        cleanup()
+
+
+if __name__ == "__main__":
+    main()
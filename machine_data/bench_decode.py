@@ -0,0 +1,55 @@
+"""
+Benchmark: throughput stage decode, inline (satu thread) vs decode pool (multi-proses).
+
+Contoh (di dalam container machine_data):
+    python bench_decode.py --messages 50000 --tags 20 --workers 1 2 4
+"""
+import time
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import decode
+from decode import decode_messages
+from bench_batching import make_payloads
+from machine_data import utc_now
+
+
+def run_inline(batches):
+    started = time.perf_counter()
+    for items in batches:
+        decode_messages(items)
+    return time.perf_counter() - started
+
+
+def run_pool(batches, workers):
+    with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        pool.submit(decode_messages, []).result()  # warm-up: start semua proses
+        started = time.perf_counter()
+        for future in [pool.submit(decode_messages, items) for items in batches]:
+            future.result()
+        return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=50000)
+    parser.add_argument("--tags", type=int, default=20)
+    parser.add_argument("--batch", type=int, default=250, help="Pesan per batch decode")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    args = parser.parse_args()
+
+    now = utc_now()
+    items = [(f"machine_{i % 50:02d}", payload, now) for i, payload in enumerate(make_payloads(args.messages, args.tags))]
+    batches = [items[i:i + args.batch] for i in range(0, len(items), args.batch)]
+    print(f"JSON parser: {decode.loads.__module__}")
+
+    elapsed = run_inline(batches)
+    print(f"{'inline':<10} {args.messages / elapsed:10.0f} msg/s")
+    for workers in args.workers:
+        elapsed = run_pool(batches, workers)
+        print(f"{f'pool x{workers}':<10} {args.messages / elapsed:10.0f} msg/s")
+
+
+if __name__ == "__main__":
+    main()
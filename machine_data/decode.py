@@ -0,0 +1,118 @@
+import math
+import time
+import json
+
+try:
+    import orjson
+    loads = orjson.loads
+    dumps = lambda value: orjson.dumps(value).decode()  # noqa: E731
+except ImportError:  # orjson opsional; fallback ke json bawaan
+    loads = json.loads
+    dumps = json.dumps
+
+# Batas kolom di log_machine (VARCHAR); nilai yang lebih panjang ditolak di sini,
+# bukan oleh Postgres (yang akan menggagalkan seluruh batch)
+MAX_MACHINE_ID_LEN = 50
+MAX_TAG_NAME_LEN = 100
+MAX_TAG_VALUE_LEN = 100
+MAX_RECORDED_AT_LEN = 100
+
+
+class InvalidPayload(ValueError):
+    pass
+
+
+def coerce_value(value):
+    """Ubah nilai tag menjadi string seperti yang disimpan di log_machine.tag_value."""
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, int):
+        # Cek bit_length dulu: str() pada int raksasa mahal (dan di Python 3.11+ bisa melempar ValueError)
+        if value.bit_length() > 4 * MAX_TAG_VALUE_LEN:
+            raise InvalidPayload("nilai tag terlalu panjang")
+        text = str(value)
+    elif isinstance(value, float):
+        if not math.isfinite(value):
+            raise InvalidPayload(f"nilai tidak valid: {value}")
+        text = repr(value)
+    elif isinstance(value, str):
+        text = value
+    else:
+        text = dumps(value)
+    if len(text) > MAX_TAG_VALUE_LEN:
+        raise InvalidPayload("nilai tag terlalu panjang")
+    return text
+
+
+def decode_payload(machine_id, payload, received_at):
+    """
+    Ubah satu payload gateway menjadi baris (machine_id, tag, value, ts, created_at).
+
+    Item yang tidak valid (tag kosong / terlalu panjang, nilai tidak bisa dikonversi)
+    dibuang per item; payload yang rusak secara keseluruhan memunculkan InvalidPayload.
+    Mengembalikan (rows, jumlah item yang dibuang).
+    """
+    if not machine_id or len(machine_id) > MAX_MACHINE_ID_LEN:
+        raise InvalidPayload(f"machine_id tidak valid: {machine_id!r}")
+    try:
+        data = loads(payload)
+    except ValueError as e:
+        raise InvalidPayload(f"JSON tidak valid: {e}")
+    if not isinstance(data, dict):
+        raise InvalidPayload("payload bukan object JSON")
+
+    timestamp = data.get("ts")
+    if timestamp is not None:
+        timestamp = str(timestamp)
+        if len(timestamp) > MAX_RECORDED_AT_LEN:
+            timestamp = None
+
+    items = data.get("d") or []
+    if not isinstance(items, list):
+        raise InvalidPayload("field 'd' bukan list")
+
+    rows = []
+    invalid = 0
+    for item in items:
+        tag = item.get("tag") if isinstance(item, dict) else None
+        if not isinstance(tag, str) or not tag or len(tag) > MAX_TAG_NAME_LEN:
+            invalid += 1
+            continue
+        try:
+            value = coerce_value(item.get("value"))
+        except InvalidPayload:
+            invalid += 1
+            continue
+        rows.append((machine_id, tag, value, timestamp, received_at))
+    return rows, invalid
+
+
+def decode_messages(items):
+    """
+    Stage decode: dijalankan di worker pool (proses terpisah) untuk satu batch pesan mentah.
+
+    `items` adalah list (machine_id, payload, received_at). Mengembalikan dict berisi
+    list baris per pesan yang valid plus statistik validasi.
+    """
+    started = time.perf_counter()
+    messages = []
+    invalid_messages = 0
+    invalid_items = 0
+    for machine_id, payload, received_at in items:
+        try:
+            rows, invalid = decode_payload(machine_id, payload, received_at)
+        except InvalidPayload:
+            invalid_messages += 1
+            continue
+        invalid_items += invalid
+        if rows:
+            messages.append(rows)
+    return {
+        "messages": messages,
+        "received": len(items),
+        "invalid_messages": invalid_messages,
+        "invalid_items": invalid_items,
+        "decode_ms": (time.perf_counter() - started) * 1000,
+    }
@@ -1,17 +1,27 @@
+import io
 import os
 import paho.mqtt.client as mqtt
 import psycopg2
 from psycopg2.extras import execute_values
+from psycopg2.errors import UndefinedTable
 import json
-from datetime import datetime
+from datetime import datetime, timezone
 import threading
 import queue
 import time
-import os
+import zlib
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from spool import SpoolQueue
+from decode import decode_messages
+from metrics import Registry, serve_metrics
 
 MQTT_BROKER = os.getenv("MQTT_BROKER", "192.168.1.205") 
 MQTT_PORT = int(os.getenv("MQTT_PORT", 1883))
-MQTT_TOPIC = "machine_01/data"
+# Satu service untuk semua mesin: topic <machine_id>/data, machine_id diambil dari topic
+MQTT_TOPIC = os.getenv("MQTT_TOPIC", "+/data")
 
 DB_CONFIG = {
     "dbname": os.getenv("DB_NAME", "database_barcode"),
@@ -21,65 +31,541 @@ DB_CONFIG = {
     "port": os.getenv("DB_PORT", "5432")
 }
 
-# --- Global Database Connection ---
-conn = None
+# --- Metrics (Prometheus, GET http://<host>:METRICS_PORT/metrics) ---
+# Throughput (pesan/s, baris/s) dihitung di Prometheus: rate(ingest_messages_received_total[1m]) dst.
+METRICS_PORT = int(os.getenv("METRICS_PORT", 9108))  # 0 = endpoint dimatikan
+# Timezone untuk field `ts` payload yang tidak menyertakan offset
+PAYLOAD_TS_TIMEZONE = os.getenv("PAYLOAD_TS_TIMEZONE", "UTC")
+
+metrics = Registry()
+messages_received = metrics.counter("ingest_messages_received_total", "Pesan MQTT yang diterima")
+messages_invalid = metrics.counter("ingest_messages_invalid_total", "Pesan yang dibuang karena payload tidak valid")
+tags_invalid = metrics.counter("ingest_tags_invalid_total", "Item tag yang dibuang karena tidak valid")
+messages_written = metrics.counter("ingest_messages_written_total", "Pesan yang sudah commit ke DB")
+rows_written = metrics.counter("ingest_rows_written_total", "Baris log_machine yang sudah commit ke DB")
+batches_written = metrics.counter("ingest_batches_total", "Transaksi batch yang berhasil commit")
+batch_failures = metrics.counter("ingest_batch_failures_total", "Batch yang ditolak DB (dipecah per pesan)")
+db_reconnects = metrics.counter("ingest_db_reconnects_total", "Koneksi DB yang dibuka ulang setelah putus")
+mqtt_reconnects = metrics.counter("ingest_mqtt_reconnects_total", "Reconnect MQTT setelah disconnect tak terduga")
+decode_pool_restarts = metrics.counter("ingest_decode_pool_restarts_total", "Decode pool yang dibuat ulang karena worker mati")
+batch_rows = metrics.histogram("ingest_batch_rows", "Jumlah baris per transaksi batch",
+                               [10, 50, 100, 500, 1000, 2000, 5000, 10000, 20000])
+db_write_seconds = metrics.histogram("ingest_db_write_seconds", "Durasi tulis + commit satu batch",
+                                     [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10])
+last_commit = [0.0]
+metrics.gauge("ingest_last_commit_timestamp_seconds", "Unix time commit batch terakhir", lambda: [({}, last_commit[0])])
+LAG_BUCKETS = [0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 900, 3600]
+payload_lag_seconds = metrics.histogram("ingest_payload_lag_seconds",
+                                        "Lag dari `ts` payload sampai commit ke DB", LAG_BUCKETS)
+receive_lag_seconds = metrics.histogram("ingest_receive_lag_seconds",
+                                        "Lag dari pesan diterima dari MQTT sampai commit ke DB", LAG_BUCKETS)
+
+# --- Database Connection (satu koneksi per worker thread) ---
+_local = threading.local()
 
 def get_db_connection():
-    global conn
+    conn = getattr(_local, "conn", None)
     while conn is None or conn.closed != 0:
         try:
             conn = psycopg2.connect(**DB_CONFIG)
-            print("✅ DB Connection Established")
+            if getattr(_local, "connected_before", False):
+                db_reconnects.inc()
+            _local.conn = conn
+            _local.connected_before = True
+            print(f"✅ DB Connection Established ({threading.current_thread().name})")
         except Exception as e:
             print(f"⏳ Gagal konek DB ({e}), mencoba lagi dalam 5 detik...")
             time.sleep(5)
     return conn
 
-# --- Queue for asynchronous processing ---
-message_queue = queue.Queue()
+def reset_db_connection():
+    conn = getattr(_local, "conn", None)
+    _local.conn = None
+    if conn is not None:
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+# --- Latest value snapshot (log_machine_latest) ---
+UPSERT_LATEST_QUERY = """
+    INSERT INTO log_machine_latest (machine_id, tag_name, tag_value, recorded_at, created_at)
+    VALUES %s
+    ON CONFLICT (machine_id, tag_name) DO UPDATE
+    SET tag_value = EXCLUDED.tag_value,
+        recorded_at = EXCLUDED.recorded_at,
+        created_at = EXCLUDED.created_at
+    WHERE log_machine_latest.created_at <= EXCLUDED.created_at
+"""
+
+# --- Machine status transitions (machine_status_event) ---
+STATUS_TAG_NAME = "Machine_Status"
+
+# Hanya insert jika status berbeda dari transisi terakhir mesin tersebut
+INSERT_STATUS_EVENT_QUERY = """
+    INSERT INTO machine_status_event (machine_id, status, created_at)
+    SELECT %(machine_id)s, %(status)s, %(created_at)s
+    WHERE %(status)s IS DISTINCT FROM (
+        SELECT status FROM machine_status_event
+        WHERE machine_id = %(machine_id)s
+        ORDER BY created_at DESC, id DESC
+        LIMIT 1
+    )
+"""
+
+INSERT_LOG_QUERY = """
+    INSERT INTO log_machine (machine_id, tag_name, tag_value, recorded_at, created_at)
+    VALUES %s
+"""
+
+# --- COPY ingest ---
+# Batch besar dialirkan ke log_machine lewat COPY ... FROM STDIN (format text) dari buffer memori;
+# batch kecil tetap memakai INSERT karena overhead COPY tidak sebanding.
+# INGEST_MODE: auto (COPY jika >= COPY_MIN_ROWS baris), copy, atau insert
+INGEST_MODE = os.getenv("INGEST_MODE", "auto")
+COPY_MIN_ROWS = int(os.getenv("COPY_MIN_ROWS", 200))
+COPY_LOG_QUERY = "COPY log_machine (machine_id, tag_name, tag_value, recorded_at, created_at) FROM STDIN"
+COPY_ESCAPES = str.maketrans({"\\": "\\\\", "\t": "\\t", "\n": "\\n", "\r": "\\r"})
+
+def copy_field(value):
+    if value is None:
+        return "\\N"
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, datetime):
+        return value.isoformat(sep=" ")
+    return str(value).translate(COPY_ESCAPES)
+
+def copy_rows(cur, rows):
+    buffer = io.StringIO()
+    buffer.writelines("\t".join(copy_field(v) for v in row) + "\n" for row in rows)
+    buffer.seek(0)
+    cur.copy_expert(COPY_LOG_QUERY, buffer)
+
+def use_copy(row_count):
+    return INGEST_MODE == "copy" or (INGEST_MODE == "auto" and row_count >= COPY_MIN_ROWS)
+
+# --- Micro-batching ---
+# Worker mengumpulkan pesan sampai BATCH_MAX_ROWS baris atau BATCH_MAX_LINGER_MS sejak pesan pertama,
+# lalu menulis semuanya dalam satu transaksi.
+BATCH_MAX_ROWS = int(os.getenv("BATCH_MAX_ROWS", 5000))
+BATCH_MAX_LINGER_MS = float(os.getenv("BATCH_MAX_LINGER_MS", 200))
+STATS_LOG_INTERVAL = float(os.getenv("STATS_LOG_INTERVAL", 60))
+
+def spool_totals():
+    totals = {}
+    for q in shard_queues:
+        for key, value in q.stats().items():
+            totals[key] = totals.get(key, 0) + value
+    return totals
+
+def utc_now():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+def payload_ts_zone():
+    if PAYLOAD_TS_TIMEZONE.upper() == "UTC":
+        return timezone.utc
+    from zoneinfo import ZoneInfo
+    return ZoneInfo(PAYLOAD_TS_TIMEZONE)
+
+_payload_tz = payload_ts_zone()
+
+def parse_payload_ts(ts):
+    """
+    Ubah field `ts` payload menjadi datetime UTC naive (None jika tidak bisa dibaca).
+
+    Diterima: epoch detik / milidetik (angka atau string angka) dan ISO 8601
+    (dengan atau tanpa offset; tanpa offset dianggap PAYLOAD_TS_TIMEZONE).
+    """
+    if ts is None:
+        return None
+    try:
+        epoch = float(ts)
+    except ValueError:
+        epoch = None
+    try:
+        if epoch is not None:
+            if epoch > 1e12:
+                epoch /= 1000.0
+            return datetime.fromtimestamp(epoch, timezone.utc).replace(tzinfo=None)
+        text = ts.strip()
+        if text.endswith(("Z", "z")):
+            text = text[:-1] + "+00:00"
+        parsed = datetime.fromisoformat(text)
+    except (ValueError, OverflowError, OSError):
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=_payload_tz)
+    return parsed.astimezone(timezone.utc).replace(tzinfo=None)
+
+def observe_commit(messages, rows, write_seconds):
+    """Catat metrics satu batch yang baru saja commit."""
+    committed_at = utc_now()
+    last_commit[0] = time.time()
+    messages_written.inc(len(messages))
+    rows_written.inc(rows)
+    batches_written.inc()
+    batch_rows.observe(rows)
+    db_write_seconds.observe(write_seconds)
+    for message in messages:
+        # Semua baris satu pesan memakai ts & waktu terima yang sama
+        _, _, _, ts, received_at = message[0]
+        receive_lag_seconds.observe(max(0.0, (committed_at - received_at).total_seconds()))
+        recorded_at = parse_payload_ts(ts)
+        if recorded_at is not None:
+            payload_lag_seconds.observe((committed_at - recorded_at).total_seconds())
+
+class BatchStats:
+    """Statistik batch (ukuran & latency flush), dicetak berkala oleh db_worker."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.batches = 0
+        self.messages = 0
+        self.rows = 0
+        self.failed_batches = 0
+        self.last_batch_rows = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self.total_flush_ms = 0.0
+        self.received = 0
+        self.invalid_messages = 0
+        self.invalid_items = 0
+        self.total_decode_ms = 0.0
+        self.decode_batches = 0
+
+    def record(self, messages, rows, flush_ms):
+        with self.lock:
+            self.batches += 1
+            self.messages += messages
+            self.rows += rows
+            self.last_batch_rows = rows
+            self.last_flush_ms = flush_ms
+            self.max_flush_ms = max(self.max_flush_ms, flush_ms)
+            self.total_flush_ms += flush_ms
+
+    def record_decode(self, result):
+        messages_invalid.inc(result["invalid_messages"])
+        tags_invalid.inc(result["invalid_items"])
+        with self.lock:
+            self.decode_batches += 1
+            self.received += result["received"]
+            self.invalid_messages += result["invalid_messages"]
+            self.invalid_items += result["invalid_items"]
+            self.total_decode_ms += result["decode_ms"]
+
+    def rows_per_message(self):
+        with self.lock:
+            return self.rows / self.messages if self.messages else 1.0
+
+    def record_failure(self):
+        batch_failures.inc()
+        with self.lock:
+            self.failed_batches += 1
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                "batches": self.batches,
+                "messages": self.messages,
+                "rows": self.rows,
+                "failed_batches": self.failed_batches,
+                "last_batch_rows": self.last_batch_rows,
+                "avg_batch_rows": self.rows / self.batches if self.batches else 0.0,
+                "last_flush_ms": self.last_flush_ms,
+                "avg_flush_ms": self.total_flush_ms / self.batches if self.batches else 0.0,
+                "max_flush_ms": self.max_flush_ms,
+                "received": self.received,
+                "invalid_messages": self.invalid_messages,
+                "invalid_items": self.invalid_items,
+                "avg_decode_ms": self.total_decode_ms / self.decode_batches if self.decode_batches else 0.0,
+                "queue_depth": sum(q.qsize() for q in shard_queues),
+                **spool_totals(),
+            }
+
+# --- Sharded queues for asynchronous processing ---
+# Setiap mesin selalu masuk ke shard yang sama (crc32(machine_id) % INGEST_WORKERS), jadi urutan
+# data per mesin terjaga sementara mesin yang berbeda ditulis paralel oleh worker masing-masing.
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", 4))
+# Tiap shard menyimpan maksimal INGEST_QUEUE_MAX pesan di memori; sisanya (mis. saat Postgres mati)
+# dilimpahkan ke segment file di SPOOL_DIR dan diputar ulang berurutan setelah DB kembali.
+INGEST_QUEUE_MAX = int(os.getenv("INGEST_QUEUE_MAX", 10000))
+SPOOL_DIR = os.getenv("SPOOL_DIR", "/var/spool/machine_data")
+SPOOL_SEGMENT_MB = float(os.getenv("SPOOL_SEGMENT_MB", 16))
+# Opt-in: > 0 membatasi ukuran spool per shard dengan MEMBUANG pesan baru saat penuh
+# (ingest_spool_dropped_total). Default 0 = tidak dibatasi, tidak ada pesan yang dibuang.
+SPOOL_MAX_MB = float(os.getenv("SPOOL_MAX_MB", 0))
+
+def encode_item(item):
+    machine_id, payload, received_at = item
+    return json.dumps([machine_id, payload, received_at.isoformat()])
+
+def decode_item(line):
+    machine_id, payload, received_at = json.loads(line)
+    return machine_id, payload, datetime.fromisoformat(received_at)
+
+# Item antrean: (machine_id, payload string, waktu terima UTC).
+# Dibuat di create_shard_queues() (bukan saat import) supaya proses decode pool tidak ikut membuka spool.
+shard_queues = []
+batch_stats = BatchStats()
+
+def create_shard_queues():
+    shard_queues[:] = [
+        SpoolQueue(
+            os.path.join(SPOOL_DIR, f"shard-{i}"),
+            maxsize=INGEST_QUEUE_MAX,
+            segment_bytes=int(SPOOL_SEGMENT_MB * 1024 * 1024),
+            max_bytes=int(SPOOL_MAX_MB * 1024 * 1024),
+            encode=encode_item,
+            decode=decode_item,
+        )
+        for i in range(INGEST_WORKERS)
+    ]
+
+def shard_gauge(key):
+    return lambda: [({"shard": str(i)}, q.stats()[key]) for i, q in enumerate(shard_queues)]
+
+def spool_counter(key):
+    # Nilai total dari SpoolQueue, diekspos sebagai counter
+    return lambda: [({}, spool_totals().get(key, 0))]
+
+metrics.gauge("ingest_queue_depth", "Pesan di antrean memori per shard", shard_gauge("memory_depth"))
+metrics.gauge("ingest_spool_depth", "Pesan di spool disk per shard", shard_gauge("spool_depth"))
+metrics.gauge("ingest_spool_bytes", "Ukuran spool disk per shard", shard_gauge("spool_bytes"))
+metrics.gauge("ingest_spool_pending_depth", "Pesan yang gagal ditulis ke spool disk dan ditahan di memori",
+              shard_gauge("pending_depth"))
+# Alert yang disarankan (Prometheus):
+#   ingest_spool_dropped_total naik  -> data hilang (hanya mungkin jika SPOOL_MAX_MB di-set):
+#       increase(ingest_spool_dropped_total[5m]) > 0
+#   disk spool gagal ditulis, pesan menumpuk di memori (disk penuh / read-only):
+#       increase(ingest_spool_write_errors_total[5m]) > 0 or sum(ingest_spool_pending_depth) > 0
+for key, help_text in [("spilled_total", "Pesan yang dilimpahkan ke spool disk"),
+                       ("replayed_total", "Pesan yang dibaca ulang dari spool disk"),
+                       ("dropped_total", "Pesan yang dibuang karena spool mencapai SPOOL_MAX_MB (data hilang)"),
+                       ("write_errors_total", "Tulis ke spool disk yang gagal (mis. ENOSPC); pesan ditahan di memori")]:
+    metrics.gauge(f"ingest_spool_{key}", help_text, spool_counter(key), type_name="counter")
+
+def shard_for(machine_id):
+    return zlib.crc32(machine_id.encode()) % len(shard_queues)
+
+def machine_id_from_topic(topic):
+    return topic.split("/", 1)[0]
+
+def write_rows(cur, rows):
+    """Tulis baris ke log_machine, log_machine_latest dan machine_status_event (tanpa commit)."""
+    if use_copy(len(rows)):
+        copy_rows(cur, rows)
+    else:
+        execute_values(cur, INSERT_LOG_QUERY, rows, page_size=len(rows))
+
+    # Snapshot nilai terakhir: cukup satu baris per tag (yang terakhir di batch)
+    latest = list({(row[0], row[1]): row for row in rows}.values())
+    execute_values(cur, UPSERT_LATEST_QUERY, latest, page_size=len(latest))
+
+    last_status = {}
+    for machine_id, tag_name, tag_value, _, created_at in rows:
+        if tag_name != STATUS_TAG_NAME or tag_value is None:
+            continue
+        status = str(tag_value)
+        # Status yang sama berturut-turut di dalam batch tidak perlu dicek ke DB lagi
+        if last_status.get(machine_id) == status:
+            continue
+        last_status[machine_id] = status
+        cur.execute(INSERT_STATUS_EVENT_QUERY, {"machine_id": machine_id, "status": status, "created_at": created_at})
+
+def save_batch(messages):
+    """
+    Simpan list pesan (masing-masing list baris) dalam satu transaksi.
+
+    Jika koneksi DB putus, batch dicoba ulang sampai berhasil. Begitu juga jika tabel
+    belum ada (migrasi backend belum jalan): itu bukan kesalahan pesan, jadi pesan tidak
+    dibuang. Jika ada baris yang ditolak DB (mis. nilai terlalu panjang), batch dipecah
+    per pesan supaya hanya pesan yang rusak yang dibuang.
+    """
+    rows = [row for message in messages for row in message]
+    if not rows:
+        return 0
 
-def db_worker():
-    """Worker thread to process DB inserts asynchronously."""
     while True:
+        connection = get_db_connection()
+        started = time.perf_counter()
         try:
-            payload = message_queue.get(timeout=1)  # Wait for a message
-            save_to_db(payload)
-            message_queue.task_done()
-        except queue.Empty:
-            continue
+            with connection.cursor() as cur:
+                write_rows(cur, rows)
+            connection.commit()
+            write_seconds = time.perf_counter() - started
+            batch_stats.record(len(messages), len(rows), write_seconds * 1000)
+            observe_commit(messages, len(rows), write_seconds)
+            return len(rows)
+        except (psycopg2.OperationalError, psycopg2.InterfaceError) as e:
+            print(f"⏳ Koneksi DB terputus saat menyimpan batch ({e}), mencoba lagi...")
+            reset_db_connection()
+            time.sleep(1)
+        except UndefinedTable as e:
+            connection.rollback()
+            print(f"⏳ Tabel belum ada, menunggu migrasi backend ({e.diag.message_primary}), mencoba lagi dalam 5 detik...")
+            time.sleep(5)
         except Exception as e:
-            print(f"DB Worker Error: {e}")
+            connection.rollback()
+            batch_stats.record_failure()
+            if len(messages) == 1:
+                print(f"Error saving to DB: {e}")
+                return 0
+            print(f"Batch ditolak DB ({e}), menyimpan per pesan...")
+            return sum(save_batch([message]) for message in messages)
+
+# --- Pipeline: collector -> decode pool -> writer (per shard) ---
+# Collector mengambil pesan mentah dari antrean shard dan mengirimnya ke decode pool (proses
+# terpisah, jadi parsing JSON memakai core lain). Writer menunggu hasil decode berurutan dan
+# menulisnya ke DB, sehingga decode batch berikutnya berjalan bersamaan dengan write batch ini.
+# DECODE_WORKERS=0: decode dijalankan di thread collector (tetap overlap dengan writer).
+DECODE_WORKERS = int(os.getenv("DECODE_WORKERS", max(0, min(4, (os.cpu_count() or 1) - 1))))
+# Maksimal batch yang sudah dikumpulkan tapi belum ditulis per shard (backpressure ke collector)
+DECODE_INFLIGHT = int(os.getenv("DECODE_INFLIGHT", 2))
+decode_pool = None
+decode_pool_lock = threading.Lock()
+
+def create_decode_pool():
+    # spawn: proses decode tidak mewarisi thread/lock dari proses utama
+    return ProcessPoolExecutor(DECODE_WORKERS, mp_context=multiprocessing.get_context("spawn"))
 
-def save_to_db(payload):
+def rebuild_decode_pool(broken):
+    """
+    Ganti decode pool yang rusak (mis. worker di-kill OOM). Setelah satu worker mati,
+    ProcessPoolExecutor menolak semua submit berikutnya, jadi pool harus dibuat ulang.
+    """
+    global decode_pool
+    with decode_pool_lock:
+        if decode_pool is not broken:
+            return  # Sudah dibuat ulang oleh shard lain
+        print("⚠️ Decode pool rusak (worker mati), membuat pool baru...")
+        decode_pool_restarts.inc()
+        broken.shutdown(wait=False)
+        decode_pool = create_decode_pool()
+
+def collect_items(shard_queue, max_messages, linger_ms=BATCH_MAX_LINGER_MS):
+    """Ambil pesan mentah dari antrean shard sampai max_messages atau linger_ms sejak pesan pertama."""
     try:
-        data = json.loads(payload)
-        timestamp = data.get("ts")
-        machine_id = "machine_01"
-        
-        items = data.get("d", [])
-        if not items:
-            return
+        items = [shard_queue.get(timeout=1)]
+    except queue.Empty:
+        return []
 
-        values = [
-            (machine_id, item.get("tag"), item.get("value"), timestamp)
-            for item in items
-        ]
+    deadline = time.monotonic() + linger_ms / 1000.0
+    while len(items) < max_messages:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        try:
+            items.append(shard_queue.get(timeout=remaining))
+        except queue.Empty:
+            break
+    return items
 
-        connection = get_db_connection()
-        with connection.cursor() as cur:
-            query = """
-                INSERT INTO log_machine (machine_id, tag_name, tag_value, recorded_at)
-                VALUES %s
-            """
-            execute_values(cur, query, values)
-            connection.commit()
-            
-        print(f"[{datetime.now()}] Stored {len(values)} tags for {timestamp}")
-        
+def decode_inline(items):
+    future = Future()
+    try:
+        future.set_result(decode_messages(items))
     except Exception as e:
-        print(f"Error saving to DB: {e}")
-        if conn:
-            conn.rollback()
+        future.set_exception(e)
+    return future
+
+def submit_decode(items):
+    """Kirim batch ke decode pool -> (future, pool). Tanpa pool (atau pool tetap rusak): decode di sini."""
+    for _ in range(2):
+        pool = decode_pool
+        if pool is None:
+            break
+        try:
+            return pool.submit(decode_messages, items), pool
+        except (BrokenProcessPool, RuntimeError):
+            # RuntimeError: pool lama sudah di-shutdown oleh rebuild dari shard lain
+            rebuild_decode_pool(pool)
+    return decode_inline(items), None
+
+def decode_result(items, future, pool):
+    """Hasil decode batch; jika worker pool mati di tengah jalan, batch di-decode ulang inline."""
+    if future is not None:
+        try:
+            return future.result()
+        except BrokenProcessPool:
+            rebuild_decode_pool(pool)
+            print(f"⚠️ Decode {len(items)} pesan diulang inline setelah decode pool rusak")
+    return decode_messages(items)
+
+def collector(shard_queue, handoff):
+    while True:
+        try:
+            # Perkiraan jumlah pesan per batch dari rata-rata baris per pesan sejauh ini
+            max_messages = max(1, int(BATCH_MAX_ROWS / batch_stats.rows_per_message()))
+            items = collect_items(shard_queue, max_messages)
+        except Exception as e:
+            print(f"Collector Error: {e}")
+            continue
+        if not items:
+            continue
+        # Segment spool yang habis dibaca sampai titik ini (semua barisnya ada di batch ini atau
+        # batch sebelumnya) baru di-ack oleh writer setelah batch ini commit
+        segments = shard_queue.checkpoint()
+        future, pool = submit_decode(items)
+        handoff.put((items, future, pool, segments))
+
+def save_decoded(messages, max_rows=BATCH_MAX_ROWS):
+    """Tulis hasil decode dalam transaksi berisi maksimal max_rows baris."""
+    chunk, chunk_rows = [], 0
+    for rows in messages:
+        if chunk and chunk_rows + len(rows) > max_rows:
+            save_batch(chunk)
+            chunk, chunk_rows = [], 0
+        chunk.append(rows)
+        chunk_rows += len(rows)
+    if chunk:
+        save_batch(chunk)
+
+def db_writer(shard_queue, handoff):
+    """Worker thread to process DB inserts asynchronously, in micro-batches (satu per shard)."""
+    while True:
+        items, future, pool, segments = handoff.get()
+        # Batch tidak pernah dilewati: ack() di bawah menghapus segment yang mungkin juga berisi
+        # baris batch ini, jadi batch diulang sampai tersimpan (at-least-once)
+        while True:
+            try:
+                result = decode_result(items, future, pool)
+                batch_stats.record_decode(result)
+                if result["messages"]:
+                    save_decoded(result["messages"])
+                break
+            except Exception as e:
+                print(f"DB Worker Error: {e}, batch dicoba ulang dalam 5 detik...")
+                future, pool = None, None
+                time.sleep(5)
+        # Semua baris batch sudah commit: segment spool yang habis dibaca boleh dihapus
+        shard_queue.ack(segments)
+
+def start_pipeline():
+    global decode_pool
+    create_shard_queues()
+    if DECODE_WORKERS > 0:
+        decode_pool = create_decode_pool()
+    for i, shard_queue in enumerate(shard_queues):
+        handoff = queue.Queue(maxsize=DECODE_INFLIGHT)
+        threading.Thread(target=collector, args=(shard_queue, handoff), name=f"collect-{i}", daemon=True).start()
+        threading.Thread(target=db_writer, args=(shard_queue, handoff), name=f"ingest-{i}", daemon=True).start()
+    print(f"✅ Ingest pipeline: {len(shard_queues)} shard, {DECODE_WORKERS} decode worker")
+
+def stats_reporter():
+    last_replayed = 0
+    while True:
+        time.sleep(STATS_LOG_INTERVAL)
+        stats = batch_stats.snapshot()
+        replay_rate = (stats["replayed_total"] - last_replayed) / STATS_LOG_INTERVAL
+        last_replayed = stats["replayed_total"]
+        print(f"[{datetime.now()}] Batches: {stats['batches']} | rows: {stats['rows']} | "
+              f"avg batch: {stats['avg_batch_rows']:.0f} rows | "
+              f"flush avg/max: {stats['avg_flush_ms']:.1f}/{stats['max_flush_ms']:.1f} ms | "
+              f"decode avg: {stats['avg_decode_ms']:.1f} ms | invalid: {stats['invalid_messages']} msg / {stats['invalid_items']} tag | "
+              f"queue: {stats['memory_depth'] + stats['pending_depth']} mem / {stats['spool_depth']} spool "
+              f"({stats['spool_bytes'] / 1e6:.1f} MB) | replay: {replay_rate:.0f} msg/s"
+              + (f" | dropped: {stats['dropped_total']}" if stats["dropped_total"] else ""))
 
 # --- MQTT Callbacks ---
 def on_connect(client, userdata, flags, rc):
@@ -87,21 +573,27 @@ def on_connect(client, userdata, flags, rc):
     client.subscribe(MQTT_TOPIC)
 
 def on_message(client, userdata, msg):
-    # Put message in queue for async processing
-    message_queue.put(msg.payload.decode())
+    # Put message in queue for async processing (created_at dicap saat diterima, bukan saat batch ditulis)
+    messages_received.inc()
+    machine_id = machine_id_from_topic(msg.topic)
+    shard_queues[shard_for(machine_id)].put((machine_id, msg.payload.decode(), utc_now()))
 
 def on_disconnect(client, userdata, rc):
     print(f"Disconnected with result code {rc}")
     if rc != 0:
         print("Unexpected disconnection. Reconnecting...")
+        mqtt_reconnects.inc()
         time.sleep(5)  # Wait before reconnecting
         client.reconnect()
 
 # --- Main ---
 if __name__ == "__main__":
-    # Start DB worker thread
-    db_thread = threading.Thread(target=db_worker, daemon=True)
-    db_thread.start()
+    # Start ingest pipeline (collector + writer per shard, decode pool bersama)
+    start_pipeline()
+    threading.Thread(target=stats_reporter, daemon=True).start()
+    if METRICS_PORT:
+        serve_metrics(metrics, METRICS_PORT)
+        print(f"✅ Metrics: http://0.0.0.0:{METRICS_PORT}/metrics")
 
     # MQTT Client
     client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION1)
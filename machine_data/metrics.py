@@ -0,0 +1,142 @@
+import math
+import bisect
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Metrics format Prometheus (text exposition) tanpa dependency tambahan.
+# Rate per detik (pesan/s, baris/s) dihitung di Prometheus dengan rate() dari counter *_total.
+
+
+class Counter:
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help_text = help_text
+        self._lock = threading.Lock()
+        self._value = 0.0
+
+    def inc(self, amount=1):
+        with self._lock:
+            self._value += amount
+
+    def render(self):
+        with self._lock:
+            value = self._value
+        return [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter", f"{self.name} {_value(value)}"]
+
+
+class Gauge:
+    """
+    Metric yang nilainya diambil saat scrape lewat callback (bisa berlabel).
+    type_name="counter" untuk total yang sudah dihitung di tempat lain (mis. SpoolQueue).
+    """
+
+    def __init__(self, name, help_text, collect, type_name="gauge"):
+        self.name = name
+        self.help_text = help_text
+        self.collect = collect  # -> list of (labels dict, value)
+        self.type_name = type_name
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.type_name}"]
+        for labels, value in self.collect():
+            lines.append(f"{self.name}{_labels(labels)} {_value(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = sorted(buckets)
+        self._lock = threading.Lock()
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._sum = 0.0
+        self._count = 0
+
+    def observe(self, value):
+        idx = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[idx] += 1
+            self._sum += value
+            self._count += 1
+
+    def render(self):
+        with self._lock:
+            counts, total, count = list(self._counts), self._sum, self._count
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets, counts):
+            cumulative += bucket_count
+            lines.append(f'{self.name}_bucket{{le="{_value(bound)}"}} {cumulative}')
+        lines.append(f'{self.name}_bucket{{le="+Inf"}} {count}')
+        lines.append(f"{self.name}_sum {_value(total)}")
+        lines.append(f"{self.name}_count {count}")
+        return lines
+
+
+def _value(value):
+    # Presisi penuh seperti prometheus_client; format :g hanya 6 digit (12345678 -> 1.23457e+07)
+    value = float(value)
+    if value == math.inf:
+        return "+Inf"
+    if value == -math.inf:
+        return "-Inf"
+    if math.isnan(value):
+        return "NaN"
+    return repr(value)
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels.items()) + "}"
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, help_text):
+        return self.register(Counter(name, help_text))
+
+    def gauge(self, name, help_text, collect, type_name="gauge"):
+        return self.register(Gauge(name, help_text, collect, type_name))
+
+    def histogram(self, name, help_text, buckets):
+        return self.register(Histogram(name, help_text, buckets))
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            try:
+                lines.extend(metric.render())
+            except Exception as e:
+                lines.append(f"# error collecting {metric.name}: {e}")
+        return "\n".join(lines) + "\n"
+
+
+def serve_metrics(registry, port, host="0.0.0.0"):
+    """Jalankan endpoint GET /metrics di thread daemon."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?", 1)[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = registry.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass  # jangan spam log setiap scrape
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    return server
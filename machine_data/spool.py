@@ -0,0 +1,248 @@
+import os
+import json
+import time
+import queue
+import threading
+from collections import deque
+
+
+class SpoolQueue:
+    """
+    Antrean FIFO dengan memori terbatas dan limpahan ke disk (segment log append-only).
+
+    Selama spool kosong, item disimpan di memori sampai `maxsize`. Begitu memori penuh,
+    item berikutnya ditulis ke file segment di `directory` dan SEMUA item baru ikut ke
+    spool sampai spool habis dibaca lagi, jadi urutan FIFO tetap terjaga. get() selalu
+    mengosongkan memori dulu (item paling lama), lalu membaca spool berurutan.
+
+    Segment yang sudah habis dibaca dikumpulkan lewat checkpoint() saat batch diambil, lalu
+    baru dihapus dengan ack(segments) setelah batch itu tersimpan di DB. Jika proses mati sebelum itu, segment dibaca ulang saat start
+    (at-least-once). `encode`/`decode` mengubah item menjadi satu baris teks dan sebaliknya.
+
+    Jika menulis ke disk gagal (mis. ENOSPC), item tidak dibuang: item ditahan di memori
+    (`pending`, urutannya sesudah isi spool) dan ditulis ulang ke disk setiap `retry_seconds`.
+    `max_bytes` > 0 (opt-in) membatasi ukuran spool dengan MEMBUANG item baru saat penuh;
+    default 0 = tidak dibatasi, tidak ada data yang dibuang.
+    """
+
+    SEGMENT_SUFFIX = ".seg"
+
+    def __init__(self, directory, maxsize, segment_bytes=16 * 1024 * 1024, max_bytes=0,
+                 encode=json.dumps, decode=json.loads, retry_seconds=5.0):
+        self.directory = directory
+        self.encode = encode
+        self.decode = decode
+        self.maxsize = maxsize
+        self.segment_bytes = segment_bytes
+        self.max_bytes = max_bytes
+        self.retry_seconds = retry_seconds
+        os.makedirs(directory, exist_ok=True)
+
+        self._memory = deque()
+        # Item yang gagal ditulis ke disk; dilayani sesudah spool, ditulis ulang saat disk pulih
+        self._pending = deque()
+        self._retry_at = 0.0
+        self._lock = threading.Lock()
+        self._not_empty = threading.Condition(self._lock)
+
+        self._segments = sorted(
+            os.path.join(directory, name) for name in os.listdir(directory) if name.endswith(self.SEGMENT_SUFFIX)
+        )
+        self._next_segment = 1 + max((self._segment_number(p) for p in self._segments), default=0)
+        self._writer = None
+        self._write_path = None
+        self._write_size = 0
+        self._reader = None
+        self._consumed = []
+
+        self.spool_depth = sum(self._count_lines(p) for p in self._segments)
+        self.spool_bytes = sum(os.path.getsize(p) for p in self._segments)
+        self.spilled_total = 0
+        self.replayed_total = 0
+        self.dropped_total = 0
+        self.write_errors_total = 0
+        if not self.spool_depth:
+            # Sisa segment kosong / sudah terbaca semua
+            self._consumed.extend(self._segments)
+            self._segments = []
+
+    # --- helpers ---
+    @classmethod
+    def _segment_number(cls, path):
+        try:
+            return int(os.path.basename(path)[:-len(cls.SEGMENT_SUFFIX)])
+        except ValueError:
+            return 0
+
+    @staticmethod
+    def _count_lines(path):
+        with open(path, "rb") as f:
+            # Baris terakhir tanpa newline (tulisan terpotong saat crash) tidak dihitung
+            return sum(1 for line in f if line.endswith(b"\n"))
+
+    def _open_new_segment(self):
+        if self._writer:
+            self._writer.close()
+        self._write_path = os.path.join(self.directory, f"{self._next_segment:012d}{self.SEGMENT_SUFFIX}")
+        self._next_segment += 1
+        self._writer = open(self._write_path, "a", encoding="utf-8")
+        self._write_size = 0
+        self._segments.append(self._write_path)
+
+    def _spill(self, item):
+        """Tulis item ke segment. False jika disk gagal (item belum tersimpan di mana pun)."""
+        if self.max_bytes and self.spool_bytes >= self.max_bytes:
+            self.dropped_total += 1
+            return True
+        try:
+            if self._writer is None or self._write_size >= self.segment_bytes:
+                self._open_new_segment()
+            line = self.encode(item) + "\n"
+            self._writer.write(line)
+            self._writer.flush()
+        except OSError as e:
+            # Disk penuh (ENOSPC) dsb.: jangan sampai error naik ke on_message paho
+            self.write_errors_total += 1
+            if not self._pending:
+                print(f"Spool: gagal menulis ke {self.directory} ({e}), pesan ditahan di memori")
+            self._abandon_segment()
+            self._retry_at = time.monotonic() + self.retry_seconds
+            return False
+        size = len(line.encode("utf-8"))
+        self._write_size += size
+        self.spool_bytes += size
+        self.spool_depth += 1
+        self.spilled_total += 1
+        return True
+
+    def _flush_pending(self):
+        """Pindahkan item pending ke disk (atau ke memori jika spool sudah habis dibaca)."""
+        if not self.spool_depth:
+            # Tidak ada yang lebih lama di disk: pending cukup jadi ekor antrean memori
+            self._memory.extend(self._pending)
+            self._pending.clear()
+            return
+        if time.monotonic() < self._retry_at:
+            return
+        while self._pending:
+            if not self._spill(self._pending[0]):
+                return
+            self._pending.popleft()
+        print(f"Spool: menulis ke {self.directory} pulih")
+
+    def _abandon_segment(self):
+        """
+        Tutup segment yang gagal ditulis. Baris terpotong di ujungnya dilewati saat dibaca
+        (sama seperti setelah crash), dan tulisan berikutnya masuk ke segment baru.
+        """
+        writer, path = self._writer, self._write_path
+        self._writer = None
+        self._write_path = None
+        if writer is not None:
+            try:
+                writer.close()
+            except OSError:
+                pass
+        if path is not None and path in self._segments:
+            try:
+                self.spool_bytes += os.path.getsize(path) - self._write_size
+            except OSError:
+                pass
+
+    def _read_spool(self):
+        while self._segments:
+            if self._reader is None:
+                self._reader = open(self._segments[0], "r", encoding="utf-8")
+            line = self._reader.readline()
+            if line.endswith("\n"):
+                self.spool_depth -= 1
+                self.replayed_total += 1
+                if not self.spool_depth:
+                    self._finish_spool()
+                try:
+                    return self.decode(line)
+                except ValueError:
+                    print(f"Spool: baris rusak dilewati di {self.directory}")
+                    continue
+            if self._segments[0] == self._write_path:
+                # Segment yang sedang ditulis; belum ada baris baru
+                return None
+            # Segment lama habis dibaca (atau berakhir dengan baris terpotong karena crash)
+            self._reader.close()
+            self._reader = None
+            self._consumed.append(self._segments.pop(0))
+        return None
+
+    def _finish_spool(self):
+        """Spool sudah habis: tutup file, segment dihapus saat ack() berikutnya."""
+        if self._reader:
+            self._reader.close()
+            self._reader = None
+        if self._writer:
+            self._writer.close()
+            self._writer = None
+            self._write_path = None
+        self._consumed.extend(self._segments)
+        self._segments = []
+
+    # --- public API (mirip queue.Queue) ---
+    def put(self, item):
+        with self._not_empty:
+            if self._pending:
+                # Disk sedang gagal: item baru antre di belakang pending supaya urutan terjaga
+                self._pending.append(item)
+                self._flush_pending()
+            elif not self.spool_depth and len(self._memory) < self.maxsize:
+                self._memory.append(item)
+            elif not self._spill(item):
+                self._pending.append(item)
+            self._not_empty.notify()
+
+    def get(self, timeout=None):
+        with self._not_empty:
+            while True:
+                if self._memory:
+                    return self._memory.popleft()
+                if self.spool_depth:
+                    item = self._read_spool()
+                    if item is not None:
+                        return item
+                if self._pending and not self.spool_depth:
+                    return self._pending.popleft()
+                if not self._not_empty.wait(timeout):
+                    raise queue.Empty
+
+    def checkpoint(self):
+        """Ambil daftar segment yang sudah habis dibaca sampai saat ini."""
+        with self._lock:
+            consumed, self._consumed = self._consumed, []
+        return consumed
+
+    def ack(self, segments):
+        """Hapus segment dari checkpoint() setelah datanya tersimpan."""
+        for path in segments:
+            try:
+                size = os.path.getsize(path)
+                os.remove(path)
+            except OSError:
+                continue
+            with self._lock:
+                self.spool_bytes = max(0, self.spool_bytes - size)
+
+    def qsize(self):
+        with self._lock:
+            return len(self._memory) + self.spool_depth + len(self._pending)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "memory_depth": len(self._memory),
+                "pending_depth": len(self._pending),
+                "spool_depth": self.spool_depth,
+                "spool_bytes": self.spool_bytes,
+                "spool_segments": len(self._segments),
+                "spilled_total": self.spilled_total,
+                "replayed_total": self.replayed_total,
+                "dropped_total": self.dropped_total,
+                "write_errors_total": self.write_errors_total,
+            }
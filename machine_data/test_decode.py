@@ -0,0 +1,44 @@
+"""
+Unit test coerce_value / decode_payload (tanpa DB / broker).
+
+Jalankan dari folder machine_data:
+    python -m unittest test_decode
+"""
+import json
+import unittest
+from unittest import mock
+
+from decode import InvalidPayload, MAX_TAG_VALUE_LEN, coerce_value, decode_payload
+
+
+class CoerceValueTest(unittest.TestCase):
+    def test_numbers_keep_ingest_format(self):
+        self.assertEqual(coerce_value(True), "true")
+        self.assertEqual(coerce_value(42), "42")
+        self.assertEqual(coerce_value(1.5), "1.5")
+
+    def test_int_longer_than_column_is_rejected(self):
+        self.assertEqual(coerce_value(10 ** (MAX_TAG_VALUE_LEN - 1)), "1" + "0" * (MAX_TAG_VALUE_LEN - 1))
+        with self.assertRaises(InvalidPayload):
+            coerce_value(10 ** MAX_TAG_VALUE_LEN)
+        with self.assertRaises(InvalidPayload):
+            coerce_value(-(10 ** (MAX_TAG_VALUE_LEN - 1)))
+        # Jauh di atas batas digit str() Python 3.11+: tetap InvalidPayload, bukan ValueError biasa
+        with self.assertRaises(InvalidPayload):
+            coerce_value(1 << 20000)
+
+    def test_non_finite_float_is_rejected(self):
+        with self.assertRaises(InvalidPayload):
+            coerce_value(float("nan"))
+
+    def test_huge_int_drops_only_its_item(self):
+        payload = json.dumps({"d": [{"tag": "speed", "value": 10}, {"tag": "counter", "value": 10 ** 200}]})
+        # orjson membaca int > 64 bit sebagai float; fallback json bawaan mempertahankan int utuh
+        with mock.patch("decode.loads", json.loads):
+            rows, dropped = decode_payload("M1", payload, 0)
+        self.assertEqual(dropped, 1)
+        self.assertEqual([row[1:3] for row in rows], [("speed", "10")])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,165 @@
+"""
+Unit test SpoolQueue (hanya file I/O, tanpa DB / broker).
+
+Jalankan dari folder machine_data:
+    python -m unittest test_spool
+"""
+import os
+import errno
+import queue
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from spool import SpoolQueue
+
+
+def drain(spool):
+    items = []
+    while True:
+        try:
+            items.append(spool.get(timeout=0))
+        except queue.Empty:
+            return items
+
+
+class SpoolQueueTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix="spool-test-")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def segments(self):
+        return sorted(name for name in os.listdir(self.directory) if name.endswith(SpoolQueue.SEGMENT_SUFFIX))
+
+    def write_segment(self, name, content):
+        with open(os.path.join(self.directory, name), "w", encoding="utf-8") as f:
+            f.write(content)
+
+    def test_memory_first_then_spill_keeps_fifo(self):
+        spool = SpoolQueue(self.directory, maxsize=2)
+        for i in range(5):
+            spool.put(i)
+        self.assertEqual(spool.stats()["memory_depth"], 2)
+        self.assertEqual(spool.stats()["spool_depth"], 3)
+        self.assertEqual(drain(spool), [0, 1, 2, 3, 4])
+
+    def test_truncated_last_line_is_skipped_on_restart(self):
+        # Crash di tengah tulis: baris terakhir segment pertama tanpa newline
+        self.write_segment("000000000001.seg", '1\n2\n{"partial')
+        self.write_segment("000000000002.seg", "3\n")
+        spool = SpoolQueue(self.directory, maxsize=10)
+        self.assertEqual(spool.qsize(), 3)
+        self.assertEqual(drain(spool), [1, 2, 3])
+        self.assertEqual(spool.qsize(), 0)
+
+    def test_segment_rollover(self):
+        spool = SpoolQueue(self.directory, maxsize=0, segment_bytes=8)
+        items = [f"item-{i}" for i in range(6)]
+        for item in items:
+            spool.put(item)
+        # Setiap baris ("item-N" + newline = 9 byte) sudah melewati segment_bytes
+        self.assertEqual(len(self.segments()), 6)
+        self.assertEqual(spool.stats()["spilled_total"], 6)
+        self.assertEqual(drain(spool), items)
+
+    def test_ack_deletes_only_checkpointed_segments(self):
+        spool = SpoolQueue(self.directory, maxsize=0, segment_bytes=8)
+        for i in range(4):
+            spool.put(f"item-{i}")
+        first, second, *rest = self.segments()
+
+        # Segment pertama baru dianggap habis saat pembacaan pindah ke segment berikutnya
+        self.assertEqual(spool.get(timeout=0), "item-0")
+        self.assertEqual(spool.checkpoint(), [])
+        self.assertEqual(spool.get(timeout=0), "item-1")
+        consumed = spool.checkpoint()
+        self.assertEqual([os.path.basename(p) for p in consumed], [first])
+        # Belum di-ack (batch belum commit): file masih ada
+        self.assertIn(first, self.segments())
+
+        spool.ack(consumed)
+        self.assertEqual(self.segments(), [second, *rest])
+
+        # Proses mati sebelum batch berikutnya commit: item-1 dibaca ulang (at-least-once),
+        # item-0 yang sudah di-ack tidak
+        restarted = SpoolQueue(self.directory, maxsize=0, segment_bytes=8)
+        self.assertEqual(drain(restarted), ["item-1", "item-2", "item-3"])
+
+    def test_fully_drained_spool_is_deleted_on_ack(self):
+        spool = SpoolQueue(self.directory, maxsize=0)
+        for i in range(3):
+            spool.put(i)
+        self.assertEqual(drain(spool), [0, 1, 2])
+        self.assertEqual(len(self.segments()), 1)
+        spool.ack(spool.checkpoint())
+        self.assertEqual(self.segments(), [])
+        self.assertEqual(spool.stats()["spool_bytes"], 0)
+
+    def test_max_bytes_drops_new_items(self):
+        spool = SpoolQueue(self.directory, maxsize=0, max_bytes=4)
+        for i in range(10, 15):
+            spool.put(i)
+        # "10\n" + "11\n" = 6 byte >= max_bytes, sisanya dibuang
+        stats = spool.stats()
+        self.assertEqual(stats["spilled_total"], 2)
+        self.assertEqual(stats["dropped_total"], 3)
+        self.assertEqual(drain(spool), [10, 11])
+
+    def test_enospc_on_open_keeps_item_in_memory(self):
+        spool = SpoolQueue(self.directory, maxsize=0)
+        with mock.patch("spool.open", side_effect=OSError(errno.ENOSPC, "No space left on device"), create=True):
+            spool.put("kept-1")
+            spool.put("kept-2")
+        stats = spool.stats()
+        self.assertEqual(stats["dropped_total"], 0)
+        self.assertEqual(stats["write_errors_total"], 1)
+        # Spool kosong, jadi tidak ada yang lebih lama di disk: item cukup antre di memori
+        self.assertEqual(spool.qsize(), 2)
+        self.assertEqual(drain(spool), ["kept-1", "kept-2"])
+
+    def test_enospc_mid_write_keeps_order_and_retries_disk(self):
+        spool = SpoolQueue(self.directory, maxsize=0, retry_seconds=0)
+        spool.put("before")
+        real_writer = spool._writer
+
+        class FullDisk:
+            # Sebagian baris sempat tertulis sebelum disk penuh
+            def write(self, line):
+                real_writer.write(line[:3])
+                real_writer.flush()
+                raise OSError(errno.ENOSPC, "No space left on device")
+
+            def close(self):
+                real_writer.close()
+
+        spool._writer = FullDisk()
+        spool.put("during")
+        self.assertEqual(spool.stats()["pending_depth"], 1)
+
+        # Disk pulih: pending ditulis dulu ke segment baru, baru item berikutnya
+        spool.put("after")
+        stats = spool.stats()
+        self.assertEqual(stats["pending_depth"], 0)
+        self.assertEqual(stats["dropped_total"], 0)
+        self.assertEqual(len(self.segments()), 2)
+        self.assertEqual(drain(spool), ["before", "during", "after"])
+        spool.ack(spool.checkpoint())
+        self.assertEqual(self.segments(), [])
+
+    def test_pending_waits_behind_spool_until_retry(self):
+        spool = SpoolQueue(self.directory, maxsize=0, retry_seconds=3600)
+        spool.put("on-disk")
+        with mock.patch.object(spool, "_open_new_segment", side_effect=OSError(errno.EROFS, "Read-only file system")):
+            spool._write_size = spool.segment_bytes
+            spool.put("pending-1")
+        spool.put("pending-2")
+        # Retry belum waktunya: item baru tetap di memori, di belakang isi spool
+        self.assertEqual(spool.stats()["pending_depth"], 2)
+        self.assertEqual(drain(spool), ["on-disk", "pending-1", "pending-2"])
+
+
+if __name__ == "__main__":
+    unittest.main()